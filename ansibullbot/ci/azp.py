@@ -2,7 +2,6 @@ import hashlib
 import logging
 import json
 import os.path
-import pickle
 import re
 
 from datetime import timezone
@@ -13,6 +12,7 @@ import ansibullbot.constants as C
 from ansibullbot._text_compat import to_bytes
 from ansibullbot.ci.base import BaseCI
 from ansibullbot.errors import NoCIError
+from ansibullbot.utils.cache_store import dump_file, load_file
 from ansibullbot.utils.net_tools import fetch
 from ansibullbot.utils.timetools import strip_time_safely
 
@@ -98,7 +98,7 @@ class AzurePipelinesCI(BaseCI):
 
             if not os.path.isdir(self._cachedir):
                 os.makedirs(self._cachedir)
-            cache_file = os.path.join(self._cachedir, u'timeline_%s.pickle' % self.build_id)
+            cache_file = os.path.join(self._cachedir, u'timeline_%s.cache' % self.build_id)
 
             url = TIMELINE_URL_FMT % self.build_id
             resp = fetch(url, timeout=TIMEOUT)
@@ -106,17 +106,13 @@ class AzurePipelinesCI(BaseCI):
                 raise Exception('Unable to GET %s' % url)
 
             if resp.status_code == 404:
-                data = None
-                if os.path.isfile(cache_file):
-                    logging.info(u'timeline was probably removed, load it from cache')
-                    with open(cache_file, 'rb') as f:
-                        data = pickle.load(f)
+                logging.info(u'timeline was probably removed, load it from cache')
+                data = load_file(cache_file)
             else:
                 data = resp.json()
                 data = (strip_time_safely(data['lastChangedOn']), data)
                 logging.info(u'writing %s' % cache_file)
-                with open(cache_file, 'wb') as f:
-                    pickle.dump(data, f)
+                dump_file(cache_file, data)
 
             if data is not None:
                 data = data[1]
@@ -165,12 +161,9 @@ class AzurePipelinesCI(BaseCI):
             if not os.path.isdir(self._cachedir):
                 os.makedirs(self._cachedir)
 
-            data = None
-            cache_file = os.path.join(self._cachedir, 'artifacts_%s.pickle' % self.build_id)
-            if os.path.isfile(cache_file):
-                logging.info('load artifacts cache')
-                with open(cache_file, 'rb') as f:
-                    data = pickle.load(f)
+            cache_file = os.path.join(self._cachedir, 'artifacts_%s.cache' % self.build_id)
+            logging.info('load artifacts cache')
+            data = load_file(cache_file)
 
             if data is None or (data and data[0] < self.updated_at) or not data[1]:
                 if data:
@@ -188,8 +181,7 @@ class AzurePipelinesCI(BaseCI):
                     data = (self.updated_at, data)
 
                     logging.info('writing %s' % cache_file)
-                    with open(cache_file, 'wb') as f:
-                        pickle.dump(data, f)
+                    dump_file(cache_file, data)
             if data:
                 self._artifacts = data[1]
 
@@ -199,12 +191,9 @@ class AzurePipelinesCI(BaseCI):
         if not os.path.isdir(self._cachedir):
             os.makedirs(self._cachedir)
 
-        data = None
-        cache_file = os.path.join(self._cachedir, '%s_%s.pickle' % (name.replace(' ', '-'), self.build_id))
-        if os.path.isfile(cache_file):
-            logging.info('loading %s' % cache_file)
-            with open(cache_file, 'rb') as f:
-                data = pickle.load(f)
+        cache_file = os.path.join(self._cachedir, '%s_%s.cache' % (name.replace(' ', '-'), self.build_id))
+        logging.info('loading %s' % cache_file)
+        data = load_file(cache_file)
 
         if data is None or (data and data[0] < self.updated_at) or not data[1]:
             if data:
@@ -231,8 +220,7 @@ class AzurePipelinesCI(BaseCI):
 
                     data = (self.updated_at, artifact_data)
                     logging.info('writing %s' % cache_file)
-                    with open(cache_file, 'wb') as f:
-                        pickle.dump(data, f)
+                    dump_file(cache_file, data)
         if data:
             return data[1]
 
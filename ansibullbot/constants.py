@@ -259,6 +259,16 @@ DEFAULT_GITHUB_TOKEN = get_config(
     value_type='string'
 )
 
+# extra tokens to spread the api reads over, see utils/ratelimits.py
+DEFAULT_GITHUB_TOKENS = get_config(
+    p,
+    DEFAULTS,
+    'github_tokens',
+    '%s_GITHUB_TOKENS' % PROG_NAME.upper(),
+    [],
+    value_type='list'
+)
+
 DEFAULT_GITHUB_REPOS = get_config(
     p,
     DEFAULTS,
@@ -315,6 +325,16 @@ DEFAULT_STALE_WINDOW = get_config(
     value_type='int'
 )
 
+# How many days a closed issue stays in the cache after its last update
+DEFAULT_CACHE_CLOSED_DAYS = get_config(
+    p,
+    DEFAULTS,
+    'cache_closed_days',
+    '%s_CACHE_CLOSED_DAYS' % PROG_NAME.upper(),
+    30,
+    value_type='int'
+)
+
 
 # Pickle the issue objects?
 DEFAULT_PICKLE_ISSUES = get_config(
@@ -3,11 +3,13 @@
 # FIXME
 #   - [Errno -5] No address associated with hostname
 
+import atexit
 import http.client
 import logging
 import requests
 import socket
 import sys
+import threading
 import time
 import traceback
 
@@ -15,6 +17,7 @@ from requests.exceptions import ReadTimeout
 
 from ansibullbot._text_compat import to_text
 from ansibullbot.errors import RateLimitError
+from ansibullbot.utils.ratelimits import RATELIMITS
 from ansibullbot.utils.sqlite_utils import AnsibullbotDatabase
 
 import ansibullbot.constants as C
@@ -22,8 +25,15 @@ import ansibullbot.constants as C
 
 ADB = AnsibullbotDatabase()
 
+# the sqlalchemy session is not thread safe and
+# decorated calls can come from --prefetch workers
+ADB_LOCK = threading.RLock()
 
-def get_rate_limit():
+# how often the tracked ratelimit is written to the database
+RATELIMIT_PERSIST_INTERVAL = 60
+
+
+def get_rate_limit(token=None):
     url = C.DEFAULT_GITHUB_URL
     if not url:
         url = 'https://api.github.com/rate_limit'
@@ -31,7 +41,7 @@ def get_rate_limit():
         url += '/rate_limit'
     username = C.DEFAULT_GITHUB_USERNAME
     password = C.DEFAULT_GITHUB_PASSWORD
-    token = C.DEFAULT_GITHUB_TOKEN
+    token = token or C.DEFAULT_GITHUB_TOKEN
 
     if token:
         while True:
@@ -64,11 +74,40 @@ def get_rate_limit():
         logging.warning('Unable to fetch rate limit %r', response.get('message'))
         return False
 
-    ADB.set_rate_limit(username=username, token=token, rawjson=response)
+    RATELIMITS.update_from_json(response, token=token)
+    save_rate_limit()
 
     return response
 
 
+def load_rate_limit():
+    '''Start from the last saved ratelimits if their window is still open'''
+    for token in RATELIMITS.unknown_tokens():
+        with ADB_LOCK:
+            rl = ADB.get_rate_limit_rawjson(token=token)
+        try:
+            if rl and rl['resources']['core']['reset'] > time.time():
+                RATELIMITS.update_from_json(rl, token=token)
+                continue
+        except (KeyError, TypeError):
+            pass
+        get_rate_limit(token=token)
+
+
+def save_rate_limit(force=False):
+    '''Write the tracked ratelimits to the database every so often'''
+    for token, tracker in RATELIMITS.trackers.items():
+        if not tracker.known():
+            continue
+        if not tracker.should_persist(RATELIMIT_PERSIST_INTERVAL, force=force):
+            continue
+        with ADB_LOCK:
+            ADB.set_rate_limit(token=token, rawjson=tracker.to_json())
+
+
+atexit.register(save_rate_limit, force=True)
+
+
 def get_reset_time():
     '''Return the number of seconds until the rate limit resets'''
 
@@ -106,23 +145,25 @@ def RateLimited(fn):
         while not success:
             count += 1
 
-            # use cached ratelimit data and a query counter to reduce api calls for rate_limit
-            rl = ADB.get_rate_limit_rawjson(token=C.DEFAULT_GITHUB_TOKEN)
-            qcounter = ADB.get_rate_limit_query_counter(token=C.DEFAULT_GITHUB_TOKEN)
-            if rl is None or qcounter is None or qcounter > 100 or (rl and rl['resources']['core']['remaining'] < 100):
-                rl = get_rate_limit()
-                ADB.set_rate_limit(token=C.DEFAULT_GITHUB_TOKEN, rawjson=rl)
-                qcounter = ADB.get_rate_limit_query_counter(token=C.DEFAULT_GITHUB_TOKEN)
-
-            logging.debug('qcounter: %s' % qcounter)
-            rl['resources']['core']['remaining'] -= qcounter
+            # the quota is tracked in memory from the response headers
+            if not RATELIMITS.known():
+                load_rate_limit()
+
+            stime = RATELIMITS.acquire()
+            if stime:
+                # the counts may have drifted, ask github before sleeping
+                for token in RATELIMITS.trackers:
+                    get_rate_limit(token=token)
+                stime = RATELIMITS.acquire()
+            if stime:
+                logging.warning('ratelimit exhausted on every token, sleeping %s minutes' % (stime / 60))
+                time.sleep(stime)
 
-            if rl:
-                logging.debug('ratelimited call #%s [%s] [%s] [%s]' %
-                              (count,
-                               type(args[0]),
-                               fn.__name__,
-                               rl['resources']['core']['remaining']))
+            logging.debug('ratelimited call #%s [%s] [%s] [%s]' %
+                          (count,
+                           type(args[0]),
+                           fn.__name__,
+                           RATELIMITS.remaining()))
 
             if count > 10:
                 logging.error('HIT 10 loop iteration on call, giving up')
@@ -133,6 +174,7 @@ def RateLimited(fn):
             try:
                 x = fn(*args, **kwargs)
                 success = True
+                save_rate_limit()
             except RateLimitError:
                 stime = get_reset_time()
             except OSError as e:
@@ -13,7 +13,10 @@
 import datetime
 import json
 import logging
+import multiprocessing
 import os
+import queue
+import time
 
 from copy import deepcopy
 from pprint import pprint
@@ -21,15 +24,24 @@ from pprint import pprint
 import ansibullbot.constants as C
 
 from ansibullbot._text_compat import to_bytes, to_text
+from ansibullbot.decorators import github as github_decorators
 from ansibullbot.errors import LabelWafflingError
 from ansibullbot.parsers.botmetadata import BotMetadataParser
 from ansibullbot.triagers.defaulttriager import DefaultActions, DefaultTriager
+from ansibullbot.utils import cache_store
+from ansibullbot.utils import fingerprint
+from ansibullbot.utils.command_table import VALID_COMMANDS
 from ansibullbot.utils.component_tools import AnsibleComponentMatcher
 from ansibullbot.utils.extractors import extract_pr_number_from_comment
+from ansibullbot.utils import http_cache
+from ansibullbot.utils import index_snapshot
+from ansibullbot.utils.fact_scheduler import FactPlugin, FactScheduler
 from ansibullbot.utils.moduletools import ModuleIndexer
+from ansibullbot.utils.ratelimits import RATELIMITS
 from ansibullbot.utils.receiver_client import post_to_receiver
 from ansibullbot.utils.timetools import strip_time_safely
 from ansibullbot.utils.version_tools import AnsibleVersionIndexer
+from ansibullbot.wrappers.ghapiwrapper import RepoWrapper
 from ansibullbot.wrappers.issuewrapper import IssueWrapper
 
 from ansibullbot.triagers.plugins.backports import get_backport_facts
@@ -68,6 +80,35 @@ from ansibullbot.triagers.plugins.docs_info import get_docs_facts
 
 VALID_CI_PROVIDERS = frozenset(('azp',))
 
+# what nearly every fact plugin reads of an issue, see fingerprint.get_input_digests
+ISSUE_INPUTS = ('issue', 'history', 'labels', 'assignees', 'pullrequest')
+
+# meta keys written by the bigger fact plugins, see get_fact_plugins
+COMPONENT_MATCH_KEYS = (
+    'is_collection', 'is_module', 'is_action_plugin', 'is_new_module', 'is_new_directory',
+    'is_module_util', 'is_plugin', 'is_new_plugin', 'is_core', 'is_multi_module',
+    'module_match', 'component', 'component_name', 'component_match_strategy',
+    'component_matches', 'component_filenames', 'component_labels', 'component_maintainers',
+    'component_namespace_maintainers', 'component_notifiers', 'component_support',
+    'component_scm', 'component_collection', 'needs_component_message',
+    'is_bad_pr', 'is_bad_pr_reason', 'is_empty_pr',
+)
+NEEDS_REVISION_KEYS = (
+    'committer_count', 'is_needs_revision', 'is_needs_revision_msgs', 'is_needs_rebase',
+    'is_needs_rebase_msgs', 'has_commit_mention', 'has_commit_mention_notification', 'has_ci',
+    'merge_commits', 'has_merge_commit_notification', 'mergeable', 'mergeable_state',
+    'change_requested', 'ci_state', 'ci_stale', 'reviews', 'ready_for_review_date',
+    'ready_for_review', 'has_remote_repo', 'stale_reviews', 'has_multiple_modules',
+    'needs_multiple_new_modules_notification',
+)
+SHIPIT_KEYS = (
+    'shipit', 'supershipit', 'owner_pr', 'shipit_ansible', 'shipit_community',
+    'shipit_count_other', 'shipit_count_community', 'shipit_count_maintainer',
+    'shipit_count_ansible', 'shipit_count_vtotal', 'shipit_count_historical',
+    'shipit_count_htotal', 'shipit_actors', 'shipit_actors_other', 'supershipit_actors',
+    'community_usernames', 'notify_community_shipit', 'is_rebuild_merge',
+)
+
 
 class AnsibleActions(DefaultActions):
     def __init__(self):
@@ -97,29 +138,7 @@ class AnsibleTriage(DefaultTriager):
         'network': "networking"
     }
 
-    VALID_COMMANDS = [
-        'needs_info',
-        '!needs_info',
-        'notabug',
-        'bot_status',
-        'bot_broken',
-        '!bot_broken',
-        'bot_skip',
-        '!bot_skip',
-        'wontfix',
-        'bug_resolved',
-        'resolved_by_pr',
-        'needs_contributor',
-        '!needs_contributor',
-        'needs_rebase',
-        '!needs_rebase',
-        'needs_revision',
-        '!needs_revision',
-        'shipit',
-        '!shipit',
-        'duplicate_of',
-        'close_me'
-    ]
+    VALID_COMMANDS = VALID_COMMANDS
 
     def __init__(self, args=None):
         super().__init__(args)
@@ -135,41 +154,45 @@ class AnsibleTriage(DefaultTriager):
         self.ci = None
         self.ci_class = ci_class
 
+        if self.args.workers > 1 and not (self.args.force or self.args.dry_run):
+            raise ValueError('--workers requires --force or --dry-run, workers can not prompt for input')
+
     def load_botmeta(self, gitrepo):
         if self.args.botmetafile is not None:
             with open(self.args.botmetafile, 'rb') as f:
                 rdata = f.read()
         else:
             rdata = gitrepo.get_file_content('.github/BOTMETA.yml')
+        self.botmeta_sha = fingerprint.git_blob_sha(rdata)
         logging.info('ansible triager [re]loading botmeta')
         return BotMetadataParser.parse_yaml(rdata)
 
     def _should_skip_issue(self, iw, repopath):
-        lmeta = self.load_meta(iw)
+        entry = iw.store.meta_index().get(iw.number)
 
-        if not lmeta:
+        if not entry:
             return False
 
-        if lmeta['updated_at'] != to_text(iw.updated_at.isoformat()):
+        if entry.updated_at != to_text(iw.updated_at.isoformat()):
             return False
 
         # re-check ansible/ansible after a window of time since the last check.
-        days_stale = (datetime.datetime.now() - strip_time_safely(lmeta['time'])).days
+        days_stale = int((time.time() - entry.last_processed) // (24 * 60 * 60))
         if days_stale > C.DEFAULT_STALE_WINDOW:
             logging.info('!skipping: %s days since last check' % days_stale)
             return False
 
         if iw.is_pullrequest():
             # always poll rebuilds till they are merged
-            if lmeta.get('needs_rebuild') or lmeta.get('admin_merge'):
+            if entry.needs_rebuild or entry.admin_merge:
                 return False
 
-            if to_text(iw.pullrequest.updated_at.isoformat()) > lmeta['updated_at']:
+            if to_text(iw.pullrequest.updated_at.isoformat()) > entry.updated_at:
                 return False
 
             # if last process time is older than last completion time on CI, we need
             # to reprocess because the CI status has probabaly changed.
-            if self.ci.updated_at and self.ci.updated_at > strip_time_safely(lmeta['updated_at']):
+            if self.ci.updated_at and self.ci.updated_at > strip_time_safely(entry.updated_at):
                 return False
 
         if iw.number in self.repos[repopath]['stale']:
@@ -191,33 +214,14 @@ class AnsibleTriage(DefaultTriager):
 
         icount = 0
         for repopath, repodata in self.repos.copy().items():
-            repo = repodata['repo']
-            cachedir = os.path.join(self.cachedir_base, repopath)
-
             logging.info('loading botmeta')
             self.botmeta = self.load_botmeta(repodata['gitrepo'])
+            self.index_version = repodata['gitrepo'].head
+            self.create_indexers(repopath, repodata['gitrepo'])
 
-            logging.info('creating version indexer')
-            self.version_indexer = AnsibleVersionIndexer(checkoutdir=repodata['gitrepo'].checkoutdir)
-
-            logging.info('creating module indexer')
-            self.module_indexer = ModuleIndexer(
-                botmeta=self.botmeta,
-                gh_client=self.gqlc,
-                cachedir=self.cachedir_base,
-                gitrepo=repodata['gitrepo'],
-                commits=not self.args.ignore_module_commits
-            )
-
-            logging.info('creating component matcher')
-            self.component_matcher = AnsibleComponentMatcher(
-                cachedir=self.cachedir_base,
-                gitrepo=repodata['gitrepo'],
-                botmeta=self.botmeta,
-                email_cache=self.module_indexer.emails_cache,
-                usecache=True,
-                use_galaxy=not self.args.ignore_galaxy
-            )
+            if self.args.workers > 1:
+                icount += self.run_workers(repopath, repodata)
+                continue
 
             for issue in repodata['issues']:
                 if issue is None:
@@ -225,118 +229,349 @@ class AnsibleTriage(DefaultTriager):
 
                 icount += 1
 
-                self.meta = {}
-                self.processed_meta = {}
-                self.set_resume(repopath, issue.number)
+                # the wrapper built by a --prefetch worker, if any
+                prefetched = repodata['issues'].prefetched.pop(issue.number, None)
 
-                # keep track of known issues
-                self.repos[repopath]['processed'].append(issue.number)
+                self.set_resume(repopath, repodata['issues'].resume_number)
+                self.triage_issue(repopath, repodata, issue, prefetched=prefetched)
+                cache_store.flush_all()
 
-                if issue.state == 'closed' and not self.args.ignore_state:
-                    logging.info(str(issue.number) + ' is closed, skipping')
-                    continue
+        ts2 = datetime.datetime.now()
+        td = (ts2 - ts1).total_seconds()
+        logging.info('triaged %s issues in %s seconds' % (icount, td))
+        http_cache.log_stats()
+        fingerprint.log_stats()
+        RATELIMITS.log_stats()
+
+    def create_indexers(self, repopath, gitrepo):
+        '''Create the indexers, from the snapshot of an earlier run if it is still current
+
+        If the checkout moved since the snapshot, the snapshot is updated
+        with the files that changed in between.
+        '''
+        base_key = index_snapshot.get_base_key(
+            self.botmeta_sha,
+            {'commits': not self.args.ignore_module_commits, 'galaxy': not self.args.ignore_galaxy},
+        )
+        head = gitrepo.head if gitrepo.isgit else None
+        refs_sha = gitrepo.refs_sha if head else None
+
+        snapshot = None
+        if head and not self.args.rebuild_indexes:
+            snapshot = index_snapshot.load_snapshot(self.cachedir_base, repopath, base_key)
+
+        changed_files = None
+        state = {}
+        current = False
+        if snapshot:
+            if (snapshot['head'], snapshot['refs_sha']) == (head, refs_sha):
+                state = snapshot['indexers']
+                current = True
+            else:
+                changed_files = gitrepo.get_changed_files(snapshot['head'], head)
+                if changed_files is not None:
+                    logging.info('%s files changed since the index snapshot' % len(changed_files))
+                    # the versions come from the branches and tags, those are cheap to list
+                    state = {k: v for k, v in snapshot['indexers'].items() if k != 'version_indexer'}
+
+        logging.info('creating version indexer')
+        self.version_indexer = AnsibleVersionIndexer(
+            checkoutdir=gitrepo.checkoutdir,
+            state=state.get('version_indexer'),
+        )
 
-                if self.args.only_prs and 'pull' not in issue.html_url:
-                    logging.info(str(issue.number) + ' is issue, skipping')
-                    continue
+        logging.info('creating module indexer')
+        self.module_indexer = ModuleIndexer(
+            botmeta=self.botmeta,
+            gh_client=self.gqlc,
+            cachedir=self.cachedir_base,
+            gitrepo=gitrepo,
+            commits=not self.args.ignore_module_commits,
+            state=state.get('module_indexer'),
+        )
+        if changed_files is not None:
+            self.module_indexer.update(changed_files=changed_files)
+
+        logging.info('creating component matcher')
+        self.component_matcher = AnsibleComponentMatcher(
+            cachedir=self.cachedir_base,
+            gitrepo=gitrepo,
+            botmeta=self.botmeta,
+            email_cache=self.module_indexer.emails_cache,
+            usecache=True,
+            use_galaxy=not self.args.ignore_galaxy,
+            state=state.get('component_matcher'),
+        )
+        if changed_files is not None:
+            self.component_matcher.update(email_cache=self.module_indexer.emails_cache, changed_files=changed_files)
+
+        if head and not current:
+            index_snapshot.save_snapshot(self.cachedir_base, repopath, {
+                'base_key': base_key,
+                'head': head,
+                'refs_sha': refs_sha,
+                'indexers': {
+                    'version_indexer': self.version_indexer.get_state(),
+                    'module_indexer': self.module_indexer.get_state(),
+                    'component_matcher': self.component_matcher.get_state(),
+                },
+            })
+
+    def triage_issue(self, repopath, repodata, issue, prefetched=None):
+        '''Triage a single issue or pullrequest'''
+        repo = repodata['repo']
+        cachedir = os.path.join(self.cachedir_base, repopath)
+
+        self.meta = {}
+        self.processed_meta = {}
+
+        # keep track of known issues
+        self.repos[repopath]['processed'].append(issue.number)
+
+        if issue.state == 'closed' and not self.args.ignore_state:
+            logging.info(str(issue.number) + ' is closed, skipping')
+            return
+
+        if self.args.only_prs and 'pull' not in issue.html_url:
+            logging.info(str(issue.number) + ' is issue, skipping')
+            return
+
+        if self.args.only_issues and 'pull' in issue.html_url:
+            logging.info(str(issue.number) + ' is pullrequest, skipping')
+            return
+
+        # users may want to re-run this issue after manual intervention
+        redo = True
+
+        # keep track of how many times this isssue has been re-done
+        loopcount = 0
+
+        # time each issue
+        its1 = datetime.datetime.now()
+
+        while redo:
+
+            # use the loopcount to check new data
+            loopcount += 1
+
+            if loopcount <= 1:
+                logging.info('starting triage for %s' % issue.html_url)
+            else:
+                # if >1 get latest data
+                logging.info('restarting triage for %s' % issue.number)
+                issue = repo.get_issue(issue.number)
+
+            # clear redo
+            redo = False
 
-                if self.args.only_issues and 'pull' in issue.html_url:
-                    logging.info(str(issue.number) + ' is pullrequest, skipping')
+            # create the wrapper on each loop iteration
+            if loopcount <= 1 and prefetched is not None:
+                iw = prefetched
+                iw.repo = repo
+            else:
+                iw = IssueWrapper(
+                    github=self.ghw,
+                    repo=repo,
+                    issue=issue,
+                    cachedir=cachedir,
+                    gitrepo=repodata['gitrepo'],
+                    gqlc=self.gqlc if self.args.graphql_prs else None,
+                )
+
+            if iw.is_pullrequest():
+                logging.info('creating CI wrapper')
+                self.ci = self.ci_class(self.cachedir_base, iw)
+            else:
+                self.ci = None
+
+            if self.args.skip_no_update:
+                if self._should_skip_issue(iw, repopath):
                     continue
 
-                # users may want to re-run this issue after manual intervention
-                redo = True
+            # force an update on the PR data, unless it was just prefetched
+            if iw is not prefetched:
+                iw.update_pullrequest()
 
-                # keep track of how many times this isssue has been re-done
-                loopcount = 0
+            actions = AnsibleActions()
+            digests = stored = None
+            if self.args.memoize_triage:
+                digests = self.get_input_digests(iw, repodata['labels'])
+                stored = iw.store.get_json(iw.number, 'meta')
 
-                # time each issue
-                its1 = datetime.datetime.now()
+            if not self.reuse_triage(iw, actions, stored, digests):
+                self.process(iw, repodata['labels'], previous=stored, digests=digests)
 
-                while redo:
+                # build up actions from the meta
+                self.create_actions(iw, actions, repodata['labels'])
+                self.save_meta(iw, self.meta, actions)
 
-                    # use the loopcount to check new data
-                    loopcount += 1
+            # DEBUG!
+            logging.info('url: %s' % iw.html_url)
+            logging.info('title: %s' % iw.title)
+            if iw.is_pullrequest():
+                for fn in iw.files:
+                    logging.info('component[f]: %s' % fn)
+            else:
+                for line in iw.template_data.get('component_raw', '').split('\n'):
+                    logging.info('component[t]: %s' % line)
+                for fn in self.meta['component_filenames']:
+                    logging.info('component[m]: %s' % fn)
 
-                    if loopcount <= 1:
-                        logging.info('starting triage for %s' % issue.html_url)
-                    else:
-                        # if >1 get latest data
-                        logging.info('restarting triage for %s' % issue.number)
-                        issue = repo.get_issue(issue.number)
+            if self.meta['template_missing_sections']:
+                logging.info(
+                    'missing sections: ' +
+                    ', '.join(self.meta['template_missing_sections'])
+                )
+            if self.meta['is_needs_revision']:
+                logging.info('needs_revision')
+                for msg in self.meta['is_needs_revision_msgs']:
+                    logging.info('needs_revision_msg: %s' % msg)
+            if self.meta['is_needs_rebase']:
+                logging.info('needs_rebase')
+                for msg in self.meta['is_needs_rebase_msgs']:
+                    logging.info('needs_rebase_msg: %s' % msg)
+
+            pprint(vars(actions))
+
+            # do the actions
+            action_meta = self.apply_actions(iw, actions)
+            if action_meta['REDO']:
+                redo = True
 
-                    # clear redo
-                    redo = False
+        its2 = datetime.datetime.now()
+        td = (its2 - its1).total_seconds()
+        logging.info('finished triage for %s in %ss' % (to_text(iw), td))
+
+    def run_workers(self, repopath, repodata):
+        '''Triage the repo's issues in forked worker processes
+
+        The indexers are already built, so forking shares them with the
+        workers copy-on-write. Workers pull numbers from a shared queue and
+        report back to the parent, which owns the processed list, the resume
+        file and the timing stats.
+        '''
+        numbers = repodata['issues'].numbers
+        ctx = multiprocessing.get_context('fork')
+        work_q = ctx.Queue()
+        result_q = ctx.Queue()
+
+        for number in numbers:
+            work_q.put(number)
+        for x in range(self.args.workers):
+            work_q.put(None)
+
+        # buffered cache writes would be written once by every worker
+        cache_store.flush_all()
+
+        workers = []
+        for x in range(self.args.workers):
+            proc = ctx.Process(
+                target=self._triage_worker,
+                args=(repopath, repodata, work_q, result_q)
+            )
+            proc.start()
+            workers.append(proc)
 
-                    # create the wrapper on each loop iteration
-                    iw = IssueWrapper(
-                        github=self.ghw,
-                        repo=repo,
-                        issue=issue,
-                        cachedir=cachedir,
-                        gitrepo=repodata['gitrepo'],
-                    )
+        logging.info('started %s workers for %s issues' % (len(workers), len(numbers)))
 
-                    if iw.is_pullrequest():
-                        logging.info('creating CI wrapper')
-                        self.ci = self.ci_class(self.cachedir_base, iw)
-                    else:
-                        self.ci = None
-
-                    if self.args.skip_no_update:
-                        if self._should_skip_issue(iw, repopath):
-                            continue
-
-                    # force an update on the PR data
-                    iw.update_pullrequest()
-
-                    self.process(iw, repodata['labels'])
-
-                    # build up actions from the meta
-                    actions = AnsibleActions()
-                    self.create_actions(iw, actions, repodata['labels'])
-                    self.save_meta(iw, self.meta, actions)
-
-                    # DEBUG!
-                    logging.info('url: %s' % iw.html_url)
-                    logging.info('title: %s' % iw.title)
-                    if iw.is_pullrequest():
-                        for fn in iw.files:
-                            logging.info('component[f]: %s' % fn)
-                    else:
-                        for line in iw.template_data.get('component_raw', '').split('\n'):
-                            logging.info('component[t]: %s' % line)
-                        for fn in self.meta['component_filenames']:
-                            logging.info('component[m]: %s' % fn)
-
-                    if self.meta['template_missing_sections']:
-                        logging.info(
-                            'missing sections: ' +
-                            ', '.join(self.meta['template_missing_sections'])
-                        )
-                    if self.meta['is_needs_revision']:
-                        logging.info('needs_revision')
-                        for msg in self.meta['is_needs_revision_msgs']:
-                            logging.info('needs_revision_msg: %s' % msg)
-                    if self.meta['is_needs_rebase']:
-                        logging.info('needs_rebase')
-                        for msg in self.meta['is_needs_rebase_msgs']:
-                            logging.info('needs_rebase_msg: %s' % msg)
-
-                    pprint(vars(actions))
-
-                    # do the actions
-                    action_meta = self.apply_actions(iw, actions)
-                    if action_meta['REDO']:
-                        redo = True
+        stats = {}
+        done = set()
+        exited = set()
+        resume_idx = 0
+        while len(exited) < len(workers):
+            try:
+                msg = result_q.get(timeout=5)
+            except queue.Empty:
+                if not any(proc.is_alive() for proc in workers):
+                    break
+                continue
+
+            if msg[0] == 'exit':
+                exited.add(msg[1])
+                continue
+
+            pid, number, seconds = msg[1:]
+            stats.setdefault(pid, []).append(seconds)
+            done.add(number)
+            self.repos[repopath]['processed'].append(number)
+
+            # only move the resume point past numbers that are all done
+            # so a restart never skips an issue a slow worker still holds
+            last = None
+            while resume_idx < len(numbers) and numbers[resume_idx] in done:
+                last = numbers[resume_idx]
+                resume_idx += 1
+            if last is not None:
+                self.set_resume(repopath, last)
+
+        for proc in workers:
+            proc.join()
+            if proc.exitcode:
+                logging.error('worker %s exited with %s' % (proc.pid, proc.exitcode))
+
+        for pid, timings in sorted(stats.items()):
+            logging.info(
+                'worker %s triaged %s issues in %ss (avg %ss)' %
+                (pid, len(timings), sum(timings), sum(timings) / len(timings))
+            )
 
+        return len(done)
+
+    def _triage_worker(self, repopath, repodata, work_q, result_q):
+        '''Worker process loop for run_workers'''
+        pid = os.getpid()
+        try:
+            # the forked pygithub and sqlite connections are shared with
+            # the parent, every worker needs its own
+            self.ghw.gh = self.ghw.new_connection()
+            self.ghw.session = http_cache.new_session()
+            self.gqlc.session = http_cache.new_session()
+            github_decorators.ADB.reconnect()
+            repodata['repo'] = RepoWrapper(self.ghw.gh, repopath, cachedir=self.cachedir_base)
+
+            for number in iter(work_q.get, None):
+                its1 = datetime.datetime.now()
+                try:
+                    issue = repodata['repo'].get_issue(number)
+                    if issue is not None:
+                        self.triage_issue(repopath, repodata, issue)
+                    cache_store.flush_all()
+                except Exception as e:
+                    logging.exception('worker %s failed on %s: %s' % (pid, number, e))
                 its2 = datetime.datetime.now()
-                td = (its2 - its1).total_seconds()
-                logging.info('finished triage for %s in %ss' % (to_text(iw), td))
+                result_q.put(('issue', pid, number, (its2 - its1).total_seconds()))
+        finally:
+            # forked workers exit without running the atexit handlers
+            cache_store.flush_all()
+            http_cache.log_stats()
+            fingerprint.log_stats()
+            result_q.put(('exit', pid))
+
+    def get_input_digests(self, iw, valid_labels):
+        return fingerprint.get_input_digests(
+            iw,
+            ci=self.ci,
+            botmeta_sha=getattr(self, 'botmeta_sha', None),
+            index_version=getattr(self, 'index_version', None),
+            valid_labels=valid_labels,
+            maintainer_team=self.maintainer_team,
+        )
 
-        ts2 = datetime.datetime.now()
-        td = (ts2 - ts1).total_seconds()
-        logging.info('triaged %s issues in %s seconds' % (icount, td))
+    def reuse_triage(self, iw, actions, stored, digests):
+        '''Load the meta and actions of the last triage if its inputs are unchanged'''
+        if digests is None:
+            return False
+
+        if not stored or stored.get('fingerprint') != fingerprint.get_triage_fingerprint(digests):
+            fingerprint.count('misses')
+            return False
+
+        fingerprint.count('hits')
+        logging.info('inputs unchanged, reusing the last triage of %s' % iw.number)
+        self.meta = stored
+        vars(actions).update(stored.get('actions', {}))
+        self.dump_meta(iw, stored)
+        return True
 
     def save_meta(self, issuewrapper, meta, actions):
         # save the meta+actions
@@ -393,30 +628,19 @@ class AnsibleTriage(DefaultTriager):
         )
         self.processed_meta = dmeta_copy.copy()
 
-    def load_meta(self, issuewrapper):
-        mfile = os.path.join(
-            issuewrapper.full_cachedir,
-            'meta.json'
-        )
-        meta = {}
-        if os.path.isfile(mfile):
-            try:
-                with open(mfile, 'rb') as f:
-                    meta = json.load(f)
-            except ValueError as e:
-                logging.error("Could not load json from '%s' because: '%s'. Removing the file...", f.name, e)
-                os.remove(mfile)
-                return {}
-        return meta
-
     def dump_meta(self, issuewrapper, meta):
+        meta['time'] = to_text(datetime.datetime.now().isoformat())
+        issuewrapper.store.put_meta(issuewrapper.number, meta)
+
+        # meta.json is still exported for the scripts that read it
         mfile = os.path.join(
             issuewrapper.full_cachedir,
             'meta.json'
         )
-        meta['time'] = to_text(datetime.datetime.now().isoformat())
         logging.info('dump meta to %s' % mfile)
 
+        if not os.path.isdir(issuewrapper.full_cachedir):
+            os.makedirs(issuewrapper.full_cachedir)
         with open(mfile, 'w', encoding='utf-8') as f:
             json.dump(meta, f)
 
@@ -1244,221 +1468,435 @@ class AnsibleTriage(DefaultTriager):
             data,
         )
 
-    def process(self, iw, valid_labels):
-        '''Do initial processing of the issue'''
+    def process(self, iw, valid_labels, previous=None, digests=None):
+        '''Do initial processing of the issue
+
+        With the input digests the meta records which fact plugins read
+        what, and the plugins whose inputs are the same as for the previous
+        meta keep their facts from it instead of running again.
+        '''
 
         # clear the actions+meta
         self.meta = {}
 
-        self.meta['state'] = iw.state
-        self.meta['submitter'] = iw.submitter
+        scheduler = FactScheduler(self.get_fact_plugins(iw, valid_labels))
+
+        reused = None
+        if digests is not None and previous and previous.get('fact_groups'):
+            stale = scheduler.get_stale(digests, previous['fact_groups'])
+            reused = scheduler.get_reused(previous['fact_groups'], previous, stale)
+            logging.info('reusing the facts of %s of %s fact plugins' % (len(reused), len(scheduler.plugins)))
+
+        if self.args.serial_facts:
+            scheduler.run_serial(self.meta, reused=reused)
+        else:
+            self.preload_fact_inputs(iw)
+            scheduler.run(self.meta, reused=reused)
+
+        if digests is not None:
+            reused_count = len(reused or {})
+            fingerprint.count('facts_reused', reused_count)
+            fingerprint.count('facts_run', len(scheduler.plugins) - reused_count)
+            self.meta['fingerprint'] = fingerprint.get_triage_fingerprint(digests)
+            self.meta['fact_groups'] = scheduler.get_groups(digests)
+
+    def preload_fact_inputs(self, iw):
+        '''Load what the fact plugins read lazily before they run in threads
+
+        The wrappers fill these in on first use without locking, threads
+        racing to do so would fetch them twice or read them half built.
+        '''
+        iw.history.index
+        iw.history.command_table
+        iw.labels
+        iw.template_data
+        if iw.is_pullrequest():
+            iw.pullrequest
+            iw.pullrequest_raw_data
+            iw.mergeable_state
+            iw.reviews
+            iw.commits
+            iw.files
+            iw.pr_files
+            iw.merge_commits
+            iw.committer_emails
+            iw.renamed_files
+
+    def get_fact_plugins(self, iw, valid_labels):
+        '''The fact plugins in serial order with the meta keys they use'''
+        return [
+            FactPlugin(
+                'issue',
+                lambda meta: self.get_issue_facts(iw),
+                writes=('state', 'submitter', 'issue_type', 'is_issue', 'is_pullrequest'),
+                inputs=('issue',),
+            ),
+            FactPlugin(
+                'version',
+                lambda meta: self.get_version_facts(iw),
+                writes=('ansible_version', 'ansible_label_version'),
+                inputs=('issue', 'history', 'index'),
+            ),
+            # what component(s) is this about?
+            FactPlugin(
+                'component_match',
+                lambda meta: get_component_match_facts(iw, self.component_matcher, valid_labels),
+                writes=COMPONENT_MATCH_KEYS,
+                inputs=ISSUE_INPUTS + ('botmeta', 'index', 'valid_labels'),
+            ),
+            # collections?
+            FactPlugin(
+                'collection',
+                lambda meta: get_collection_facts(iw, self.component_matcher, meta),
+                reads=('is_backport', 'component_matches'),
+                writes=(
+                    'is_collection', 'needs_collection_boilerplate', 'needs_collection_redirect',
+                    'collection_redirects', 'collection_filemap', 'collection_filemap_full',
+                    'collection_file_matches', 'collection_fqcn_label_remove', 'collection_fqcns',
+                    'component_support',
+                ),
+                inputs=ISSUE_INPUTS + ('botmeta', 'index'),
+            ),
+            FactPlugin(
+                'backport',
+                lambda meta: get_backport_facts(iw),
+                writes=('is_backport', 'base_ref'),
+                inputs=('issue', 'pullrequest'),
+            ),
+            FactPlugin(
+                'traceback',
+                lambda meta: get_traceback_facts(iw),
+                writes=('has_traceback',),
+                inputs=('issue', 'history'),
+            ),
+            FactPlugin(
+                'small_patch',
+                lambda meta: get_small_patch_facts(iw),
+                writes=('is_small_patch',),
+                inputs=('pullrequest',),
+            ),
+            FactPlugin(
+                'docs_only',
+                lambda meta: get_docs_facts(iw),
+                writes=('is_docs_only',),
+                inputs=('pullrequest',),
+            ),
+            FactPlugin(
+                'needs_revision',
+                lambda meta: get_needs_revision_facts(
+                    iw, meta, self.ci, self.maintainer_team, C.DEFAULT_BOT_NAMES,
+                ),
+                reads=('component_maintainers',),
+                writes=NEEDS_REVISION_KEYS,
+                inputs=ISSUE_INPUTS + ('reviews', 'ci', 'maintainer_team', 'date'),
+                uses=('ci',),
+            ),
+            FactPlugin(
+                'needs_contributor',
+                lambda meta: get_needs_contributor_facts(iw, C.DEFAULT_BOT_NAMES),
+                writes=('is_needs_contributor',),
+                inputs=ISSUE_INPUTS,
+            ),
+            # who needs to be notified or assigned?
+            FactPlugin(
+                'notification',
+                lambda meta: get_notification_facts(iw, meta, botmeta=self.botmeta),
+                reads=('guessed_components', 'component_matches', 'module_match',
+                       'component_maintainers', 'component_notifiers'),
+                writes=('to_notify', 'to_assign'),
+                inputs=ISSUE_INPUTS + ('botmeta',),
+            ),
+            # ci_verified and test results
+            FactPlugin(
+                'ci_run',
+                lambda meta: get_ci_run_facts(iw, meta, self.ci),
+                reads=('has_ci', 'ci_state'),
+                writes=('ci_test_results', 'ci_verified', 'needs_testresult_notification'),
+                inputs=ISSUE_INPUTS + ('ci',),
+                uses=('ci',),
+            ),
+            FactPlugin(
+                'needs_info',
+                lambda meta: {'is_needs_info': is_needsinfo(iw, C.DEFAULT_BOT_NAMES)},
+                writes=('is_needs_info',),
+                inputs=ISSUE_INPUTS,
+            ),
+            FactPlugin(
+                'comment_commands',
+                lambda meta: self.get_comment_command_facts(iw, meta),
+                reads=('component_authors', 'component_maintainers', 'component_notifiers'),
+                writes=('maintainer_commands', 'submitter_commands', 'resolved_by_pr'),
+                inputs=ISSUE_INPUTS,
+            ),
+            FactPlugin(
+                'needs_info_template',
+                lambda meta: needs_info_template_facts(iw, meta),
+                reads=('is_needs_info', 'component_match_strategy'),
+                writes=('template_missing', 'template_missing_sections',
+                        'template_warning_required', 'is_needs_info'),
+                inputs=ISSUE_INPUTS,
+            ),
+            FactPlugin(
+                'needs_info_timeout',
+                lambda meta: needs_info_timeout_facts(iw, meta),
+                reads=('is_needs_info',),
+                writes=('needs_info_action',),
+                inputs=ISSUE_INPUTS + ('date',),
+            ),
+            # who is this person?
+            FactPlugin(
+                'submitter',
+                lambda meta: get_submitter_facts(
+                    iw, meta, self.module_indexer.emails_cache, self.component_matcher
+                ),
+                reads=('component_filenames',),
+                writes=('submitter_previous_commits', 'submitter_previous_commits_for_pr_files'),
+                inputs=ISSUE_INPUTS + ('index',),
+            ),
+            FactPlugin(
+                'shipit',
+                lambda meta: get_shipit_facts(
+                    iw, meta, self.botmeta['files'],
+                    maintainer_team=self.maintainer_team, botnames=C.DEFAULT_BOT_NAMES,
+                ),
+                reads=('component_matches', 'is_module_util', 'is_new_module',
+                       'component_maintainers', 'component_namespace_maintainers',
+                       'is_needs_revision', 'is_needs_rebase'),
+                writes=SHIPIT_KEYS,
+                inputs=ISSUE_INPUTS + ('reviews', 'botmeta', 'maintainer_team'),
+            ),
+            FactPlugin(
+                'review',
+                lambda meta: get_review_facts(iw, meta),
+                reads=('shipit', 'is_needs_info', 'is_needs_revision', 'is_needs_rebase',
+                       'component_support'),
+                writes=('core_review', 'community_review', 'committer_review'),
+                inputs=ISSUE_INPUTS,
+            ),
+            # bot_status needed?
+            FactPlugin(
+                'bot_status',
+                lambda meta: get_bot_status_facts(
+                    iw, self.module_indexer.all_maintainers,
+                    maintainer_team=self.maintainer_team, bot_names=C.DEFAULT_BOT_NAMES,
+                ),
+                writes=('needs_bot_status',),
+                inputs=ISSUE_INPUTS + ('botmeta', 'maintainer_team'),
+            ),
+            # who is this waiting on?
+            FactPlugin(
+                'waiting_on',
+                lambda meta: self.get_waiting_on_facts(iw, meta),
+                reads=('is_needs_info', 'is_needs_contributor', 'is_needs_revision',
+                       'is_needs_rebase', 'is_core'),
+                writes=('waiting_on',),
+                inputs=ISSUE_INPUTS,
+            ),
+            # community label manipulation
+            FactPlugin(
+                'label_commands',
+                lambda meta: get_label_command_facts(
+                    iw, self.module_indexer.all_maintainers,
+                    maintainer_team=self.maintainer_team, valid_labels=valid_labels,
+                ),
+                writes=('label_cmds',),
+                inputs=ISSUE_INPUTS + ('botmeta', 'valid_labels', 'maintainer_team'),
+            ),
+            # waffling overrides [label_waffling_overrides]
+            FactPlugin(
+                'waffling_overrides',
+                lambda meta: get_waffling_overrides(
+                    iw, self.module_indexer.all_maintainers,
+                    maintainer_team=self.maintainer_team,
+                ),
+                writes=('label_waffling_overrides',),
+                inputs=ISSUE_INPUTS + ('botmeta', 'maintainer_team'),
+            ),
+            # filament, only sets its own key on the meta it is given
+            FactPlugin(
+                'filament',
+                lambda meta: get_filament_facts(iw, {}),
+                writes=('is_filament',),
+                inputs=ISSUE_INPUTS,
+            ),
+            FactPlugin(
+                'test_support_plugins',
+                lambda meta: get_test_support_plugins_facts(iw, self.component_matcher),
+                writes=('test_support_plugins',),
+                inputs=ISSUE_INPUTS + ('index',),
+            ),
+            FactPlugin(
+                'ci',
+                lambda meta: get_ci_facts(iw, self.ci),
+                writes=('ci_run_number',),
+                inputs=ISSUE_INPUTS + ('ci',),
+                uses=('ci',),
+            ),
+            # ci rebuilds
+            FactPlugin(
+                'rebuild',
+                lambda meta: get_rebuild_facts(iw, meta),
+                reads=('ci_stale', 'is_needs_revision', 'is_needs_rebase', 'has_ci', 'shipit'),
+                writes=('needs_rebuild', 'needs_rebuild_all'),
+                inputs=ISSUE_INPUTS,
+            ),
+            # ci rebuild + merge
+            FactPlugin(
+                'rebuild_merge',
+                lambda meta: get_rebuild_merge_facts(iw, meta, self.maintainer_team, self.ci),
+                reads=('needs_rebuild', 'needs_rebuild_all', 'is_needs_revision',
+                       'is_needs_rebase'),
+                writes=('needs_rebuild', 'needs_rebuild_all', 'admin_merge'),
+                inputs=ISSUE_INPUTS + ('ci', 'maintainer_team'),
+                uses=('ci',),
+            ),
+            # ci rebuild requested?
+            FactPlugin(
+                'rebuild_command',
+                lambda meta: get_rebuild_command_facts(iw, meta, self.ci),
+                reads=('needs_rebuild', 'needs_rebuild_all', 'needs_rebuild_failed'),
+                writes=('needs_rebuild', 'needs_rebuild_all', 'needs_rebuild_failed'),
+                inputs=ISSUE_INPUTS + ('ci',),
+                uses=('ci',),
+            ),
+            # first time contributor?
+            FactPlugin(
+                'contributor',
+                lambda meta: get_contributor_facts(iw),
+                writes=('new_contributor',),
+            ),
+            # is it deprecated?
+            FactPlugin(
+                'deprecation',
+                lambda meta: get_deprecation_facts(meta),
+                reads=('is_module', 'module_match'),
+                writes=('deprecated',),
+                inputs=(),
+            ),
+            # does it have a pr or does it have an issue?
+            FactPlugin(
+                'cross_reference',
+                lambda meta: get_cross_reference_facts(iw),
+                writes=('has_pr', 'has_issue', 'needs_has_pr', 'needs_has_issue'),
+                inputs=ISSUE_INPUTS,
+            ),
+            # need these keys to always exist
+            FactPlugin(
+                'defaults',
+                self.get_default_facts,
+                reads=('merge_commits', 'is_bad_pr'),
+                writes=('merge_commits', 'is_bad_pr'),
+                inputs=(),
+            ),
+            # spam!
+            FactPlugin(
+                'spam',
+                lambda meta: get_spam_facts(iw),
+                writes=('spam_comment_ids',),
+                inputs=ISSUE_INPUTS,
+            ),
+            FactPlugin(
+                'automerge',
+                lambda meta: get_automerge_facts(iw, meta),
+                reads=(
+                    'supershipit', 'shipit', 'is_backport', 'merge_commits', 'has_commit_mention',
+                    'is_needs_revision', 'is_needs_rebase', 'is_needs_info', 'has_ci', 'mergeable',
+                    'ci_stale', 'ci_state', 'component_matches', 'is_new_module',
+                    'is_new_directory', 'is_module', 'module_match', 'component_support',
+                ),
+                writes=('automerge', 'automerge_status'),
+                inputs=ISSUE_INPUTS,
+            ),
+            # community working groups
+            FactPlugin(
+                'community_workgroup',
+                lambda meta: get_community_workgroup_facts(iw, meta),
+                reads=('component_matches', 'component_maintainers'),
+                writes=('wg',),
+                inputs=ISSUE_INPUTS,
+            ),
+        ]
+
+    def get_issue_facts(self, iw):
+        facts = {
+            'state': iw.state,
+            'submitter': iw.submitter,
+        }
 
         # set the issue type
         issue_type = iw.template_data.get('issue type')
         if issue_type in self.ISSUE_TYPES:
-            self.meta['issue_type'] = issue_type
+            facts['issue_type'] = issue_type
         else:
             # look for best match?
             for key in self.ISSUE_TYPES.keys():
                 if iw.body and key in iw.body.lower():
-                    self.meta['issue_type'] = key
+                    facts['issue_type'] = key
                     break
             else:
-                self.meta['issue_type'] = None
+                facts['issue_type'] = None
 
         # needed for bot status
-        self.meta['is_issue'] = iw.is_issue()
-        self.meta['is_pullrequest'] = iw.is_pullrequest()
+        facts['is_issue'] = iw.is_issue()
+        facts['is_pullrequest'] = iw.is_pullrequest()
+
+        return facts
 
-        self.meta['ansible_version'] = None
-        self.meta['ansible_label_version'] = None
+    def get_version_facts(self, iw):
+        facts = {
+            'ansible_version': None,
+            'ansible_label_version': None,
+        }
 
         # When working with ansible/ansible, determine the version to eventually set the "affects_%s" label
         if iw.repo_full_name == "ansible/ansible":
             # get ansible version
             if iw.is_issue():
-                self.meta['ansible_version'] = self.version_indexer.version_by_issue(iw)
+                facts['ansible_version'] = self.version_indexer.version_by_issue(iw)
             else:
                 # use the submit date's current version
-                self.meta['ansible_version'] = self.version_indexer.version_by_date(iw.created_at)
+                facts['ansible_version'] = self.version_indexer.version_by_date(iw.created_at)
 
             # https://github.com/ansible/ansible/issues/21207
-            if not self.meta['ansible_version']:
+            if not facts['ansible_version']:
                 # fallback to version by date
-                self.meta['ansible_version'] = self.version_indexer.version_by_date(iw.created_at)
-
-            self.meta['ansible_label_version'] = self.version_indexer.get_version_major_minor(self.meta['ansible_version'])
-            logging.info('ansible version: %s' % self.meta['ansible_version'])
-
-        # what component(s) is this about?
-        self.meta.update(
-            get_component_match_facts(
-                iw,
-                self.component_matcher,
-                valid_labels
-            )
-        )
-
-        # collections?
-        self.meta.update(
-            get_collection_facts(
-                iw,
-                self.component_matcher,
-                self.meta,
-            )
-        )
-
-        # backports
-        self.meta.update(get_backport_facts(iw))
-
-        # traceback
-        self.meta.update(get_traceback_facts(iw))
-
-        # small_patch
-        self.meta.update(get_small_patch_facts(iw))
-
-        # docs_only
-        self.meta.update(get_docs_facts(iw))
-
-        # shipit?
-        self.meta.update(
-            get_needs_revision_facts(
-                iw,
-                self.meta,
-                self.ci,
-                self.maintainer_team,
-                C.DEFAULT_BOT_NAMES,
-            )
-        )
-
-        # needs_contributor?
-        self.meta.update(get_needs_contributor_facts(iw, C.DEFAULT_BOT_NAMES))
-
-        # who needs to be notified or assigned?
-        self.meta.update(get_notification_facts(iw, self.meta, botmeta=self.botmeta))
+                facts['ansible_version'] = self.version_indexer.version_by_date(iw.created_at)
 
-        # ci_verified and test results
-        self.meta.update(
-            get_ci_run_facts(iw, self.meta, self.ci)
-        )
-
-        # needsinfo?
-        self.meta['is_needs_info'] = is_needsinfo(iw, C.DEFAULT_BOT_NAMES)
-        self.meta.update(self.process_comment_commands(iw, self.meta))
-        self.meta.update(needs_info_template_facts(iw, self.meta))
-        self.meta.update(needs_info_timeout_facts(iw, self.meta))
-
-        # who is this person?
-        self.meta.update(
-            get_submitter_facts(
-                iw,
-                self.meta,
-                self.module_indexer.emails_cache,
-                self.component_matcher
-            )
-        )
-
-        # shipit?
-        self.meta.update(
-            get_shipit_facts(
-                iw, self.meta, self.botmeta['files'],
-                maintainer_team=self.maintainer_team, botnames=C.DEFAULT_BOT_NAMES,
-            )
-        )
-        self.meta.update(get_review_facts(iw, self.meta))
+            facts['ansible_label_version'] = self.version_indexer.get_version_major_minor(facts['ansible_version'])
+            logging.info('ansible version: %s' % facts['ansible_version'])
 
-        # bot_status needed?
-        self.meta.update(get_bot_status_facts(iw, self.module_indexer.all_maintainers, maintainer_team=self.maintainer_team, bot_names=C.DEFAULT_BOT_NAMES))
+        return facts
 
-        # who is this waiting on?
+    def get_waiting_on_facts(self, iw, meta):
         wo = 'maintainer'
-        if self.meta['is_needs_info']:
+        if meta['is_needs_info']:
             wo = iw.submitter
         if iw.is_issue():
-            if self.meta['is_needs_contributor']:
+            if meta['is_needs_contributor']:
                 wo = 'contributor'
         else:
-            if self.meta['is_needs_revision'] or self.meta['is_needs_rebase']:
+            if meta['is_needs_revision'] or meta['is_needs_rebase']:
                 wo = iw.submitter
-            elif self.meta['is_core']:
+            elif meta['is_core']:
                 wo = 'ansible'
-        self.meta.update({'waiting_on': wo})
-
-        # community label manipulation
-        self.meta.update(
-            get_label_command_facts(
-                iw,
-                self.module_indexer.all_maintainers,
-                maintainer_team=self.maintainer_team,
-                valid_labels=valid_labels
-            )
-        )
-
-        # waffling overrides [label_waffling_overrides]
-        self.meta.update(
-            get_waffling_overrides(
-                iw,
-                self.module_indexer.all_maintainers,
-                maintainer_team=self.maintainer_team,
-            )
-        )
-
-        # filament
-        self.meta.update(get_filament_facts(iw, self.meta))
-
-        # test_support_plugins
-        self.meta.update(
-            get_test_support_plugins_facts(iw, self.component_matcher)
-        )
-
-        # ci
-        self.meta.update(get_ci_facts(iw, self.ci))
-
-        # ci rebuilds
-        self.meta.update(get_rebuild_facts(iw, self.meta))
-
-        # ci rebuild + merge
-        self.meta.update(
-            get_rebuild_merge_facts(
-                iw,
-                self.meta,
-                self.maintainer_team,
-                self.ci,
-            )
-        )
-
-        # ci rebuild requested?
-        self.meta.update(
-            get_rebuild_command_facts(
-                iw,
-                self.meta,
-                self.ci,
-            )
-        )
-
-        # first time contributor?
-        self.meta.update(get_contributor_facts(iw))
-
-        # is it deprecated?
-        self.meta.update(get_deprecation_facts(self.meta))
-
-        # does it have a pr or does it have an issue?
-        self.meta.update(get_cross_reference_facts(iw))
-
-        # need these keys to always exist
-        if 'merge_commits' not in self.meta:
-            self.meta['merge_commits'] = []
-        if 'is_bad_pr' not in self.meta:
-            self.meta['is_bad_pr'] = False
-
-        # spam!
-        self.meta.update(get_spam_facts(iw))
-
-        # automerge
-        self.meta.update(get_automerge_facts(iw, self.meta))
-
-        # community working groups
-        self.meta.update(get_community_workgroup_facts(iw, self.meta))
+        return {'waiting_on': wo}
+
+    def get_comment_command_facts(self, iw, meta):
+        # process_comment_commands updates the meta it is given
+        cmeta = self.process_comment_commands(iw, meta.copy())
+        return {
+            k: cmeta[k]
+            for k in ('maintainer_commands', 'submitter_commands', 'resolved_by_pr')
+            if k in cmeta
+        }
+
+    def get_default_facts(self, meta):
+        facts = {}
+        if 'merge_commits' not in meta:
+            facts['merge_commits'] = []
+        if 'is_bad_pr' not in meta:
+            facts['is_bad_pr'] = False
+        return facts
 
     def process_comment_commands(self, issuewrapper, meta):
 
@@ -1598,8 +2036,6 @@ class AnsibleTriage(DefaultTriager):
         parser.description = "Triage issue and pullrequest queues for Ansible.\n" \
                              " (NOTE: only useful if you have commit access to" \
                              " the repo in question.)"
-        parser.add_argument("--skip_no_update", action="store_true",
-                            help="skip processing if updated_at hasn't changed")
         parser.add_argument("--collect_only", action="store_true",
                             help="stop after caching issues")
         parser.add_argument("--ignore_bot_broken", action="store_true",
@@ -1613,4 +2049,12 @@ class AnsibleTriage(DefaultTriager):
         parser.add_argument("--ci", type=str, choices=VALID_CI_PROVIDERS,
                             default=C.DEFAULT_CI_PROVIDER,
                             help="Specify a CI provider that repo uses")
+        parser.add_argument("--serial-facts", action="store_true",
+                            help="run the fact plugins one at a time, for debugging")
+        parser.add_argument("--workers", type=int, default=1,
+                            help="triage issues|prs in N forked processes")
+        parser.add_argument("--rebuild-indexes", action="store_true",
+                            help="build the indexers from the checkout instead of loading their snapshot")
+        parser.add_argument("--memoize-triage", action="store_true",
+                            help="reuse the last triage of issues whose inputs did not change")
         return parser
@@ -16,7 +16,7 @@
 
 import abc
 import argparse
-import datetime
+import functools
 import json
 import logging
 import os
@@ -29,13 +29,18 @@ from jinja2 import Environment, FileSystemLoader
 from ansibullbot import constants as C
 from ansibullbot._text_compat import to_text
 from ansibullbot.decorators.github import RateLimited
+from ansibullbot.utils import issue_scheduler
+from ansibullbot.utils.cache_gc import CacheGC
+from ansibullbot.utils.cache_store import get_store
 from ansibullbot.utils.gh_gql_client import GithubGraphQLClient
 from ansibullbot.utils.git_tools import GitRepoWrapper
+from ansibullbot.utils.issue_scheduler import QuotaScheduler
 from ansibullbot.utils.iterators import RepoIssuesIterator
 from ansibullbot.utils.logs import set_logger
 from ansibullbot.utils.systemtools import run_command
-from ansibullbot.utils.timetools import strip_time_safely
+from ansibullbot.utils.timetools import strip_time_safely, utc_timestamp
 from ansibullbot.wrappers.ghapiwrapper import GithubWrapper, RepoWrapper
+from ansibullbot.wrappers.issuewrapper import IssueSnapshot, IssueWrapper
 
 basepath = os.path.dirname(__file__).split('/')
 libindex = basepath[::-1].index('ansibullbot')
@@ -118,8 +123,19 @@ class DefaultTriager:
             server=C.DEFAULT_GITHUB_URL
         )
 
+        self.cache_gc = CacheGC(self.cachedir_base, self.get_gc_summaries)
+
         self._maintainer_team = None
 
+    def get_gc_summaries(self, repopath):
+        '''The summaries the cache gc needs to know which issues are closed'''
+        # a daemon already has them from the last loop
+        if repopath not in self.issue_summaries:
+            if not self.args.gc_cache:
+                return None
+            self.update_issue_summaries(repopath=repopath)
+        return self.issue_summaries[repopath]
+
     @property
     def maintainer_team(self):
         # Note: this assumes that the token used by the bot has access to check
@@ -143,6 +159,7 @@ class DefaultTriager:
         parser.add_argument("--dry-run", "-n", action="store_true", help="Don't make any changes")
         parser.add_argument("--dump_actions", action="store_true", help="serialize the actions to disk [/tmp/actions]")
         parser.add_argument("--force", "-f", action="store_true", help="Do not ask questions")
+        parser.add_argument("--gc-cache", action="store_true", help="evict old and closed entries from the cachedir and exit")
         parser.add_argument("--logfile", type=str, default='/var/log/ansibullbot.log', help="Send logging to this file")
         parser.add_argument("--ignore_state", action="store_true", help="Do not skip processing closed issues")
         parser.add_argument("--last", type=int, help="triage the last N issues or PRs")
@@ -151,9 +168,14 @@ class DefaultTriager:
         parser.add_argument("--only_prs", action="store_true", help="Triage pullrequests only")
         parser.add_argument("--pause", "-p", action="store_true", dest="always_pause", help="Always pause between prs|issues")
         parser.add_argument("--pr", "--id", type=str, help="Triage only the specified pr|issue (separated by commas)")
+        parser.add_argument("--prefetch", type=int, default=0, help="fetch the next N issues|prs in the background while triaging")
+        parser.add_argument("--graphql-issues", action="store_true", help="load issues|prs in batches through graphql instead of one rest call each")
+        parser.add_argument("--graphql-prs", action="store_true", help="load pr files, commits, reviews and checks from one graphql snapshot")
+        parser.add_argument("--quota-reserve", type=int, default=0, help="with fewer api calls left, triage the cheapest issues|prs first and park the rest until the reset [default 0, off]")
         parser.add_argument("--resume", action="store_true", dest="resume_enabled", help="pickup right after where the bot last stopped")
         parser.add_argument("--repo", "-r", type=str, help="Github repo to triage (defaults to all)")
         parser.add_argument("--skiprepo", action='append', help="Github repo to skip triaging")
+        parser.add_argument("--skip_no_update", action="store_true", help="skip processing if updated_at hasn't changed")
         parser.add_argument("--start-at", type=int, help="Start triage at the specified pr|issue")
         parser.add_argument("--sort", default='desc', choices=['asc', 'desc'], help="Direction to sort issues [desc=9-0 asc=0-9]")
         return parser
@@ -162,7 +184,10 @@ class DefaultTriager:
         set_logger(debug=self.args.debug, logfile=self.args.logfile)
 
     def start(self):
-        if self.args.daemonize:
+        if self.args.gc_cache:
+            logging.info('collecting cache garbage')
+            self.cache_gc.collect()
+        elif self.args.daemonize:
             logging.info('starting daemonize loop')
             self.loop()
         else:
@@ -174,6 +199,7 @@ class DefaultTriager:
         """Call the run method in a defined interval"""
         while True:
             self.run()
+            self.cache_gc.step()
             interval = self.args.daemonize_interval
             logging.info('sleep %ss (%sm)' % (interval, interval / 60))
             time.sleep(interval)
@@ -354,39 +380,17 @@ class DefaultTriager:
             self.issue_summaries[repopath] = self.gqlc.get_issue_summaries(repopath)
 
     def get_stale_numbers(self, reponame):
-        stale = []
-        for number, summary in self.issue_summaries[reponame].items():
-            if number in stale:
-                continue
-
-            if summary['state'] == 'closed':
-                continue
-
-            number = int(number)
-            mfile = os.path.join(
-                self.cachedir_base,
-                reponame,
-                'issues',
-                to_text(number),
-                'meta.json'
-            )
-
-            if not os.path.isfile(mfile):
-                stale.append(number)
-                continue
+        # workers may have triaged since the last loop, so reload the index
+        index = get_store(os.path.join(self.cachedir_base, reponame)).meta_index(reload=True)
 
-            try:
-                with open(mfile, 'rb') as f:
-                    meta = json.load(f)
-            except ValueError as e:
-                logging.error('failed to parse %s: %s' % (to_text(mfile), to_text(e)))
-                os.remove(mfile)
-                stale.append(number)
-                continue
+        # more than the window in whole days since the last triage
+        cutoff = time.time() - (C.DEFAULT_STALE_WINDOW + 1) * 24 * 60 * 60
+        processed = {number for number, entry in index.items() if entry.last_processed > cutoff}
 
-            delta = (datetime.datetime.now() - strip_time_safely(meta['time'])).days
-            if delta > C.DEFAULT_STALE_WINDOW:
-                stale.append(number)
+        stale = [
+            int(number) for number, summary in self.issue_summaries[reponame].items()
+            if summary['state'] != 'closed' and int(number) not in processed
+        ]
 
         stale = sorted({int(x) for x in stale})
         if 10 >= len(stale) > 0:
@@ -532,15 +536,117 @@ class DefaultTriager:
         if self.args.last and len(numbers) > self.args.last:
             numbers = numbers[0 - self.args.last:]
 
+        if self.args.skip_no_update:
+            unchanged = self.get_unchanged_numbers(repo, numbers)
+            numbers = [x for x in numbers if x not in unchanged]
+            logging.info('%s numbers after skipping %s unchanged' % (len(numbers), len(unchanged)))
+
         # Use iterator to avoid requesting all issues upfront
         self.repos[repo]['issues'] = RepoIssuesIterator(
             self.repos[repo]['repo'],
             numbers,
-            issuecache=issuecache
+            issuecache=issuecache,
+            prefetch=self.args.prefetch,
+            prefetcher=functools.partial(self.prefetch_issue, repo),
+            batcher=functools.partial(self.get_issue_snapshots, repo) if self.args.graphql_issues else None,
+            scheduler=QuotaScheduler(
+                functools.partial(self.estimate_issue_cost, repo),
+                reserve=self.args.quota_reserve,
+            ),
         )
 
         logging.info('getting repo objs for %s complete' % repo)
 
+    def get_unchanged_numbers(self, repopath, numbers):
+        '''The numbers --skip_no_update can skip without any rest call
+
+        An issue is unchanged when its summary was not updated since it was
+        last triaged, that was within the stale window and it is not waiting
+        on a rebuild or merge. A pullrequest also needs no new checks on its
+        head since, which is asked for all of them in batched queries.
+        '''
+        index = get_store(os.path.join(self.cachedir_base, repopath)).meta_index()
+        cutoff = time.time() - (C.DEFAULT_STALE_WINDOW + 1) * 24 * 60 * 60
+        stale = set(self.repos.get(repopath, {}).get('stale', []))
+
+        candidates = {}
+        for number in numbers:
+            entry = index.get(number)
+            summary = self.issue_summaries[repopath].get(to_text(number))
+            if entry is None or summary is None or number in stale:
+                continue
+            if utc_timestamp(entry.updated_at) != utc_timestamp(summary['updated_at']):
+                continue
+            if entry.last_processed <= cutoff:
+                continue
+            if summary['type'] == 'pullrequest' and (entry.needs_rebuild or entry.admin_merge):
+                continue
+            candidates[number] = entry
+
+        prs = [x for x in candidates if self.issue_summaries[repopath][to_text(x)]['type'] == 'pullrequest']
+        if prs:
+            owner, name = repopath.split('/', 1)
+            ci_updated = self.gqlc.get_ci_updated_at(owner, name, prs)
+            for number in prs:
+                updated = ci_updated.get(number)
+                # checks finished after the last triage may change the ci facts
+                if updated and utc_timestamp(updated) > utc_timestamp(candidates[number].last_processed):
+                    candidates.pop(number)
+
+        return set(candidates)
+
+    def estimate_issue_cost(self, repopath, number):
+        '''Guess the api calls it takes to triage an issue|pr
+
+        An item that has not changed since it was last triaged is served
+        by conditional requests, which do not count against the quota.
+        '''
+        summary = self.issue_summaries.get(repopath, {}).get(to_text(number), {})
+
+        if summary.get('updated_at'):
+            index = get_store(os.path.join(self.cachedir_base, repopath)).meta_index()
+            entry = index.get(int(number))
+            if entry and utc_timestamp(entry.updated_at) >= utc_timestamp(summary['updated_at']):
+                return issue_scheduler.CACHED_COST
+
+        if summary.get('type') == 'pullrequest':
+            return issue_scheduler.PULLREQUEST_COST
+        return issue_scheduler.ISSUE_COST
+
+    def get_issue_snapshots(self, repopath, numbers):
+        '''Load a batch of issues through graphql, see --graphql-issues'''
+        owner, name = repopath.split('/', 1)
+        repo = self.repos[repopath]['repo']
+        nodes = self.gqlc.get_issue_batch(owner, name, numbers)
+        return {number: IssueSnapshot(node, repo=repo) for number, node in nodes.items()}
+
+    def prefetch_issue(self, repopath, number, issue=None):
+        '''Fetch an issue and its timeline/pr data, runs in a worker thread'''
+        # the objects fetched here keep a reference to their own connection
+        # so they can be used from the main thread once handed over
+        repo = RepoWrapper(
+            self.ghw.new_connection(),
+            repopath,
+            cachedir=self.cachedir_base,
+            lazy=True
+        )
+        if issue is None:
+            issue = repo.get_issue(number)
+        if issue is None:
+            return None, None
+
+        iw = IssueWrapper(
+            github=self.ghw,
+            repo=repo,
+            issue=issue,
+            cachedir=os.path.join(self.cachedir_base, repopath),
+            gitrepo=self.repos[repopath]['gitrepo'],
+            gqlc=self.gqlc if self.args.graphql_prs else None,
+        )
+        iw.prefetch()
+
+        return issue, iw
+
     def collect_repos(self):
         '''Populate the local cache of repos'''
         logging.info('start collecting repos')
@@ -225,50 +225,28 @@ def get_component_match_facts(iw, component_matcher, valid_labels):
 
 def reconcile_component_commands(iw, component_matcher, CM_MATCHES):
     """Allow components to be set by bot commands"""
-    component_commands = iw.history.get_component_commands()
     component_filenames = [x['repo_filename'] for x in CM_MATCHES]
 
-    for ccx in component_commands:
-
-        if '\n' in ccx['body']:
-            lines = ccx['body'].split('\n')
-            lines = [x.strip() for x in lines if x.strip()]
-        else:
-            lines = [ccx['body'].strip()]
-
-        # keep track if files are reset in the same comment
-        cleared = False
-
-        for line in lines:
-
-            if not line.strip().startswith('!component'):
-                continue
-
-            # !component [action][filename]
-            try:
-                filen = line.split()[1]
-            except IndexError:
-                filen = line.replace('!component', '')
-
-            # https://github.com/ansible/ansible/issues/37494#issuecomment-373548008
-            if not filen:
-                continue
-
-            action = filen[0]
-            filen = filen[1:].strip()
-
-            if action == '+' and filen not in component_filenames:
+    # keep track if files are reset in the same comment
+    cleared = set()
+
+    # !component [action][filename]
+    for command in iw.history.command_table.find('!component'):
+        action = command.arg[0]
+        filen = command.arg[1:].strip()
+
+        if action == '+' and filen not in component_filenames:
+            component_filenames.append(filen)
+        elif action == '-' and filen in component_filenames:
+            component_filenames.remove(filen)
+        elif action == '=':
+            # possibly unintuitive but multiple ='s in the same comment
+            # should initially clear the set and then become additive.
+            if command.position not in cleared:
+                component_filenames = [filen]
+            else:
                 component_filenames.append(filen)
-            elif action == '-' and filen in component_filenames:
-                component_filenames.remove(filen)
-            elif action == '=':
-                # possibly unintuitive but multiple ='s in the same comment
-                # should initially clear the set and then become additive.
-                if not cleared:
-                    component_filenames = [filen]
-                else:
-                    component_filenames.append(filen)
-                cleared = True
+            cleared.add(command.position)
 
     CM_MATCHES = component_matcher.match_components('', '', '', files=component_filenames)
 
@@ -257,6 +257,19 @@ def _is_diff_docs_only(file_content, diff):
 
     return True
 
+def _is_missing_patch(changed_file):
+    """ Check if ``changed_file`` has no patch but _is_docs_only needs one. """
+
+    if isinstance(changed_file, dict):
+        changed_file = CommitFile(changed_file)
+
+    return (
+        changed_file.patch is None
+        and changed_file.status == "modified"
+        and changed_file.filename.endswith(".py")
+        and not _is_docs_path(changed_file.filename)
+    )
+
 def _is_docs_only(changed_file):
     """ Check if the changes made to ``changed_file`` affect only documentation. """
 
@@ -293,7 +306,13 @@ def get_docs_facts(iw):
     if not iw.is_pullrequest():
         return dfacts
 
-    docs_only = False not in [_is_docs_only(f.raw_data) for f in iw.pr_files]
+    files = [f.raw_data for f in iw.pr_files]
+
+    # a graphql snapshot has no patches, only fetch them if one is needed
+    if any(_is_missing_patch(f) for f in files):
+        files = [f.raw_data for f in iw.rest_pr_files]
+
+    docs_only = False not in [_is_docs_only(f) for f in files]
 
     dfacts["is_docs_only"] = docs_only
     return dfacts
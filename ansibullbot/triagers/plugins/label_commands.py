@@ -46,30 +46,18 @@ def get_label_command_facts(issuewrapper, all_maintainers, maintainer_team=[], v
     maintainers = sorted(set(maintainers))
 
     # iterate through the description and comments and look for label commands
-    for ev in iw.history.history:
-        if ev['actor'] in maintainers and ev['event'] == 'commented':
-            if '+label' in ev['body'] or '-label' in ev['body']:
-                for line in ev['body'].split('\n'):
-                    if 'label' not in line:
-                        continue
-                    words = line.split()
-
-                    # https://github.com/ansible/ansibullbot/issues/1284
-                    if len(words) < 2:
-                        continue
-
-                    label = words[1]
-                    if label not in whitelist:
-                        continue
-                    action = words[0]
-                    if action == '+label':
-                        add_labels.append(label)
-                        if label in del_labels:
-                            del_labels.remove(label)
-                    elif action == '-label':
-                        del_labels.append(label)
-                        if label in add_labels:
-                            add_labels.remove(label)
+    for command in iw.history.command_table.find(['+label', '-label'], maintainers):
+        label = command.arg
+        if label not in whitelist:
+            continue
+        if command.command == '+label':
+            add_labels.append(label)
+            if label in del_labels:
+                del_labels.remove(label)
+        else:
+            del_labels.append(label)
+            if label in add_labels:
+                add_labels.remove(label)
 
     # prevent waffling on label actions
     #   https://github.com/ansible/ansibullbot/issues/672
@@ -99,17 +87,10 @@ def get_waffling_overrides(issuewrapper, all_maintainers, maintainer_team=[]):
     maintainers += all_maintainers
     maintainers = sorted(set(maintainers))
 
-    for ev in iw.history.history:
-        if ev['actor'] in maintainers and ev['event'] == 'commented':
-            if '!waffling' in ev.get('body', ''):
-                lines = ev['body'].split('\n')
-                for line in lines:
-                    if line.strip().startswith('!waffling'):
-                        line = line.strip()
-                        parts = line.strip().split()
-                        thislabel = parts[1].strip()
-                        if thislabel not in overrides:
-                            overrides.append(thislabel)
+    for command in iw.history.command_table.find('!waffling', maintainers):
+        thislabel = command.arg.strip()
+        if thislabel not in overrides:
+            overrides.append(thislabel)
 
     fact = {
         'label_waffling_overrides': overrides
@@ -2,7 +2,6 @@ import datetime
 import logging
 
 from ansibullbot.errors import NoCIError
-from ansibullbot.triagers.plugins.shipit import is_approval
 from ansibullbot.utils.timetools import strip_time_safely
 
 
@@ -132,7 +131,8 @@ def get_needs_revision_facts(iw, meta, ci, maintainer_team=None, botnames=None):
 
         has_set_needs_revision = set()
 
-        for event in iw.history.history:
+        commands = iw.history.command_table
+        for position, event in enumerate(iw.history.history):
 
             if event['actor'] in botnames:
                 continue
@@ -158,7 +158,7 @@ def get_needs_revision_facts(iw, meta, ci, maintainer_team=None, botnames=None):
                         continue
 
                 if event['event'] == 'commented':
-                    if is_approval(event['body']):
+                    if commands.is_approval(position):
                         shipits[event['actor']] = event['created_at']
                     if '!needs_revision' in event['body']:
                         needs_revision = False
@@ -276,13 +276,13 @@ def get_needs_revision_facts(iw, meta, ci, maintainer_team=None, botnames=None):
             if review['state'] != 'CHANGES_REQUESTED':
                 continue
             lrd = None
-            for x in iw.history.history:
+            for position, x in enumerate(iw.history.history):
                 if x['actor'] != actor:
                     continue
                 if x['event'] == 'review_changes_requested':
                     if not lrd or lrd < x['created_at']:
                         lrd = x['created_at']
-                elif x['event'] == 'commented' and is_approval(x['body']):
+                elif x['event'] == 'commented' and iw.history.command_table.is_approval(position):
                     if lrd and lrd < x['created_at']:
                         lrd = None
 
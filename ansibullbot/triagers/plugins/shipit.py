@@ -2,6 +2,8 @@ import itertools
 import logging
 from fnmatch import fnmatch
 
+from ansibullbot.utils.command_table import APPROVAL_COMMANDS
+
 
 def replace_ansible(maintainers, ansible_members, bots=[]):
     '''Replace -ansible- with the -humans- in the org'''
@@ -19,15 +21,7 @@ def replace_ansible(maintainers, ansible_members, bots=[]):
 def is_approval(body):
     if not body:
         return False
-    lines = [x.strip() for x in body.split()]
-    return 'shipit' in lines or '+1' in lines or 'LGTM' in lines or 'rebuild_merge' in lines
-
-
-def is_rebuild_merge(body):
-    if not body:
-        return False
-    lines = [x.strip() for x in body.split()]
-    return 'rebuild_merge' in lines
+    return bool(APPROVAL_COMMANDS.intersection(body.split()))
 
 
 def get_automerge_facts(issuewrapper, meta):
@@ -327,7 +321,8 @@ def get_shipit_facts(issuewrapper, inmeta, botmeta_files, maintainer_team=[], bo
     rebuild_merge = False
     shipits_historical = set()
 
-    for event in iw.history.history:
+    commands = iw.history.command_table
+    for position, event in enumerate(iw.history.history):
         if event['event'] not in ['commented', 'committed', 'review_approved', 'review_comment']:
             continue
         if event['actor'] in botnames:
@@ -350,16 +345,14 @@ def get_shipit_facts(issuewrapper, inmeta, botmeta_files, maintainer_team=[], bo
             continue
 
         actor = event['actor']
-        body = event.get('body', '')
-        body = body.strip()
 
-        if not is_approval(body):
+        if not commands.is_approval(position):
             continue
 
         # historical shipits (keep track of all of them, even if reset)
         shipits_historical.add(actor)
 
-        if actor in maintainer_team and is_rebuild_merge(body):
+        if actor in maintainer_team and commands.has_word(position, 'rebuild_merge'):
             rebuild_merge = True
             logging.info('%s shipit [rebuild_merge]' % actor)
         else:
@@ -0,0 +1,157 @@
+'''Keep the cachedir within its budgets
+
+Every namespace of the cachedir has a size and an age budget. Entries
+unused for longer than the age are dropped first, then the least recently
+used ones until the namespace fits its size. The last use of a file is the
+later of its atime and mtime, atime alone is not updated on most mounts.
+
+The per repo cache stores are only pruned of closed issues, once they have
+not been updated for DEFAULT_CACHE_CLOSED_DAYS. An issue that is open, or
+whose state is not known, is never evicted.
+
+--gc-cache runs every step at once, in daemon mode one step runs after
+each loop so the work is spread out.
+'''
+
+import datetime
+import logging
+import os
+import shutil
+import time
+
+import ansibullbot.constants as C
+from ansibullbot.utils import http_cache
+from ansibullbot.utils.cache_store import CACHE_FILE, get_store
+
+
+DAY = 24 * 60 * 60
+MB = 1024 * 1024
+
+# namespace -> (max bytes, max days unused), None is unlimited
+NAMESPACES = {
+    'azp.runs': (2048 * MB, 30),
+    'galaxy': (256 * MB, 7),
+    'module_extractor_cache': (512 * MB, 30),
+    # replaced by http_cache.sqlite
+    'cached_requests': (0, 0),
+}
+
+HTTP_CACHE_BUDGET = (1024 * MB, 14)
+
+
+class CacheGC:
+
+    def __init__(self, cachedir, get_summaries, closed_days=None):
+        self.cachedir = os.path.expanduser(cachedir)
+        # get_summaries(repopath) -> {number: issue summary} or None
+        self.get_summaries = get_summaries
+        if closed_days is None:
+            closed_days = C.DEFAULT_CACHE_CLOSED_DAYS
+        self.closed_days = closed_days
+        self._steps = []
+
+    def get_steps(self):
+        steps = [(self.collect_namespace, x) for x in sorted(NAMESPACES)]
+        steps.append((self.collect_http_cache, None))
+        steps += [(self.collect_repo, x) for x in self.get_repos()]
+        return steps
+
+    def get_repos(self):
+        '''owner/repo of every cache store in the cachedir'''
+        repos = []
+        if not os.path.isdir(self.cachedir):
+            return repos
+        for owner in sorted(os.listdir(self.cachedir)):
+            odir = os.path.join(self.cachedir, owner)
+            if owner in NAMESPACES or not os.path.isdir(odir):
+                continue
+            for repo in sorted(os.listdir(odir)):
+                if os.path.isfile(os.path.join(odir, repo, CACHE_FILE)):
+                    repos.append('%s/%s' % (owner, repo))
+        return repos
+
+    def collect(self):
+        '''Run every step, for --gc-cache'''
+        for step, arg in self.get_steps():
+            step(arg)
+
+    def step(self):
+        '''Run the next step, for the daemon loop'''
+        if not self._steps:
+            self._steps = self.get_steps()
+        step, arg = self._steps.pop(0)
+        step(arg)
+
+    def collect_namespace(self, namespace):
+        max_bytes, max_days = NAMESPACES[namespace]
+        nsdir = os.path.join(self.cachedir, namespace)
+        if not os.path.isdir(nsdir):
+            return
+
+        entries = []
+        for root, dirs, files in os.walk(nsdir):
+            for fn in files:
+                path = os.path.join(root, fn)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((max(st.st_atime, st.st_mtime), st.st_size, path))
+
+        # oldest first
+        entries.sort()
+        total = sum(x[1] for x in entries)
+        cutoff = time.time() - max_days * DAY if max_days is not None else None
+
+        count = 0
+        freed = 0
+        for used, size, path in entries:
+            expired = cutoff is not None and used < cutoff
+            if not expired and (max_bytes is None or total <= max_bytes):
+                break
+            try:
+                os.remove(path)
+            except OSError as e:
+                logging.debug(e)
+                continue
+            total -= size
+            count += 1
+            freed += size
+
+        logging.info('cache gc %s: removed %s files, %sMB, %sMB left' % (namespace, count, freed // MB, total // MB))
+
+    def collect_http_cache(self, arg=None):
+        store = http_cache.STORE
+        if store is None:
+            store = http_cache.configure(self.cachedir)
+        max_bytes, max_days = HTTP_CACHE_BUDGET
+        count, freed = store.evict(max_bytes=max_bytes, max_age=max_days * DAY)
+        logging.info('cache gc http cache: removed %s responses, %sMB' % (count, freed // MB))
+
+    def collect_repo(self, repopath):
+        '''Prune the closed issues of a repo that have not changed in a while'''
+        summaries = self.get_summaries(repopath)
+        if not summaries:
+            logging.info('cache gc %s: no issue summaries, skipping' % repopath)
+            return
+
+        # summaries have github timestamps, those sort as strings
+        cutoff = (datetime.datetime.utcnow() - datetime.timedelta(days=self.closed_days)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        repodir = os.path.join(self.cachedir, repopath)
+        store = get_store(repodir)
+        count = 0
+        for number in sorted(store.numbers()):
+            summary = summaries.get(str(number))
+            if summary is None or summary.get('state') != 'closed':
+                continue
+            if not summary.get('updated_at') or summary['updated_at'] >= cutoff:
+                continue
+
+            store.delete(number)
+            idir = os.path.join(repodir, 'issues', str(number))
+            if os.path.isdir(idir):
+                shutil.rmtree(idir)
+            count += 1
+
+        logging.info('cache gc %s: pruned %s closed issues' % (repopath, count))
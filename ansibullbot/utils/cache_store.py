@@ -0,0 +1,400 @@
+'''One sqlite file per repo for the per issue caches
+
+The issue, files, history, timeline, pr snapshot and meta caches used to
+be separate files under cachedir/<repo>/issues/<number>/. They are now
+records keyed by (number, kind) in cachedir/<repo>/cache.sqlite, each
+with the version of the format it was written in. A record read with a
+different version is treated as missing.
+
+Writes are buffered and written in one transaction by flush(), which the
+triager calls after every issue. Records that belong to the repo rather
+than an issue, like its labels, use number 0.
+
+Records are plain data, zlib compressed json with datetimes tagged, see
+encode(). Github objects are stored as their raw_data and rebuilt when
+loaded, pickles of them broke with every pygithub upgrade.
+'''
+
+import atexit
+import collections
+import datetime
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+
+
+CACHE_FILE = 'cache.sqlite'
+
+# the files each kind used to be stored in, see migrate_repo
+LEGACY_FILES = {
+    'issue': 'issue.pickle',
+    'files': 'files.pickle',
+    'history': 'history.pickle',
+    'pr_snapshot': 'pr_snapshot.json',
+    'meta': 'meta.json',
+}
+
+# repo level records
+REPO = 0
+
+# the format version of each kind of record, the pickled ones were 1
+VERSIONS = {
+    'issue': 2,
+    'files': 2,
+    'history': 2,
+    'labels': 2,
+    'assignees': 2,
+}
+
+STORES = {}
+STORES_LOCK = threading.Lock()
+
+
+def _default(obj):
+    if isinstance(obj, datetime.datetime):
+        return {'__datetime__': obj.isoformat()}
+    raise TypeError('%r can not be cached' % obj)
+
+
+def _object_hook(obj):
+    if len(obj) == 1 and '__datetime__' in obj:
+        return datetime.datetime.fromisoformat(obj['__datetime__'])
+    return obj
+
+
+def encode(data):
+    '''Plain data to compact bytes, datetimes survive the round trip'''
+    return zlib.compress(json.dumps(data, default=_default, separators=(',', ':')).encode('utf-8'))
+
+
+def decode(data):
+    return json.loads(zlib.decompress(data), object_hook=_object_hook)
+
+
+def load_file(path):
+    '''The data of a file written by dump_file, None if it is unreadable'''
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return decode(f.read())
+    except (ValueError, zlib.error) as e:
+        logging.error('failed to load %s: %s' % (path, e))
+        return None
+
+
+def dump_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(encode(data))
+
+
+# what the stale checks need from the meta of an issue, see CacheStore.meta_index
+MetaIndexEntry = collections.namedtuple(
+    'MetaIndexEntry',
+    ['last_processed', 'updated_at', 'needs_rebuild', 'admin_merge']
+)
+
+
+def meta_index_entry(meta, last_processed=None):
+    if last_processed is None:
+        last_processed = time.mktime(datetime.datetime.fromisoformat(meta['time']).timetuple())
+    return MetaIndexEntry(
+        last_processed,
+        meta.get('updated_at'),
+        bool(meta.get('needs_rebuild')),
+        bool(meta.get('admin_merge')),
+    )
+
+
+class CacheStore:
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS records (
+            number INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            version TEXT,
+            stored_at REAL,
+            data BLOB,
+            PRIMARY KEY (number, kind)
+        )
+    '''
+
+    INDEX_SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS meta_index (
+            number INTEGER PRIMARY KEY,
+            last_processed REAL,
+            updated_at TEXT,
+            needs_rebuild INTEGER,
+            admin_merge INTEGER
+        )
+    '''
+
+    def __init__(self, path, batch_size=200):
+        self.path = path
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._pending = {}
+        self._pending_index = {}
+        self._meta_index = None
+
+        dirname = os.path.dirname(self.path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+
+        with self.connection as conn:
+            conn.execute(self.SCHEMA)
+            conn.execute(self.INDEX_SCHEMA)
+
+    @property
+    def connection(self):
+        # sqlite connections must not cross threads or forks
+        if getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=60)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def get(self, number, kind, version=None):
+        '''The data of a record, None if it is missing or has another version'''
+        key = (int(number), kind)
+        with self._lock:
+            if key in self._pending:
+                record = self._pending[key]
+            else:
+                record = None
+        if record is None:
+            record = self.connection.execute(
+                'SELECT version, stored_at, data FROM records WHERE number = ? AND kind = ?', key
+            ).fetchone()
+        if record is None or record[2] is None:
+            return None
+        if version is not None and record[0] != str(version):
+            logging.debug('%s %s cache is version %s, want %s' % (kind, number, record[0], version))
+            return None
+        return record[2]
+
+    def put(self, number, kind, data, version=1):
+        with self._lock:
+            self._pending[(int(number), kind)] = (str(version), time.time(), data)
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+
+    def delete(self, number, kind=None):
+        '''Drop one kind of record of an issue, or all of them'''
+        with self._lock:
+            for key in list(self._pending):
+                if key[0] == int(number) and kind in (None, key[1]):
+                    self._pending.pop(key)
+            if kind in (None, 'meta'):
+                self._pending_index.pop(int(number), None)
+                if self._meta_index is not None:
+                    self._meta_index.pop(int(number), None)
+            with self.connection as conn:
+                if kind is None:
+                    conn.execute('DELETE FROM records WHERE number = ?', (int(number),))
+                else:
+                    conn.execute('DELETE FROM records WHERE number = ? AND kind = ?', (int(number), kind))
+                if kind in (None, 'meta'):
+                    conn.execute('DELETE FROM meta_index WHERE number = ?', (int(number),))
+
+    def flush(self):
+        '''Write the buffered records in one transaction'''
+        with self._lock:
+            pending = self._pending
+            pending_index = self._pending_index
+            self._pending = {}
+            self._pending_index = {}
+            if not pending and not pending_index:
+                return
+            with self.connection as conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)',
+                    [(k[0], k[1], v[0], v[1], v[2]) for k, v in pending.items()]
+                )
+                conn.executemany(
+                    'INSERT OR REPLACE INTO meta_index VALUES (?, ?, ?, ?, ?)',
+                    [(k,) + tuple(v) for k, v in pending_index.items()]
+                )
+
+    def put_meta(self, number, meta):
+        '''Store the meta of an issue and keep the meta index in step'''
+        entry = meta_index_entry(meta, last_processed=time.time())
+        with self._lock:
+            self.put_json(number, 'meta', meta)
+            self._pending_index[int(number)] = entry
+            if self._meta_index is not None:
+                self._meta_index[int(number)] = entry
+
+    def meta_index(self, reload=False):
+        '''{number: MetaIndexEntry} of every issue with a meta
+
+        Loaded once and then kept up to date by put_meta, reload picks up
+        what other processes wrote.
+        '''
+        with self._lock:
+            if self._meta_index is None or reload:
+                self.flush()
+                rows = self.connection.execute('SELECT * FROM meta_index').fetchall()
+                if not rows:
+                    rows = self._build_meta_index()
+                self._meta_index = {
+                    x[0]: MetaIndexEntry(x[1], x[2], bool(x[3]), bool(x[4])) for x in rows
+                }
+            return self._meta_index
+
+    def _build_meta_index(self):
+        '''Index the meta records of a store from before the index existed'''
+        rows = []
+        for number, data in self.connection.execute("SELECT number, data FROM records WHERE kind = 'meta'"):
+            try:
+                entry = meta_index_entry(json.loads(data))
+            except (ValueError, KeyError, TypeError) as e:
+                logging.debug('not indexing the meta of %s: %s' % (number, e))
+                continue
+            rows.append((number,) + tuple(entry))
+        if rows:
+            logging.info('indexed %s meta records in %s' % (len(rows), self.path))
+            with self.connection as conn:
+                conn.executemany('INSERT OR REPLACE INTO meta_index VALUES (?, ?, ?, ?, ?)', rows)
+        return rows
+
+    def numbers(self):
+        '''The issues with any record'''
+        self.flush()
+        rows = self.connection.execute('SELECT DISTINCT number FROM records WHERE number != ?', (REPO,))
+        return {x[0] for x in rows.fetchall()}
+
+    def get_json(self, number, kind, version=None):
+        data = self.get(number, kind, version=version)
+        if data is None:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError as e:
+            logging.error('failed to parse the %s cache of %s: %s' % (kind, number, e))
+            return None
+
+    def put_json(self, number, kind, data, version=1):
+        self.put(number, kind, json.dumps(data).encode('utf-8'), version=version)
+
+    def get_data(self, number, kind):
+        data = self.get(number, kind, version=VERSIONS.get(kind, 1))
+        if data is None:
+            return None
+        try:
+            return decode(data)
+        except (ValueError, zlib.error) as e:
+            logging.error('failed to load the %s cache of %s: %s' % (kind, number, e))
+            return None
+
+    def put_data(self, number, kind, data):
+        self.put(number, kind, encode(data), version=VERSIONS.get(kind, 1))
+
+
+def get_store(repo_cachedir):
+    '''The store of a repo, shared by everything in the process'''
+    path = os.path.join(os.path.expanduser(repo_cachedir), CACHE_FILE)
+    with STORES_LOCK:
+        # a removed cachedir starts over with a new file
+        if path not in STORES or not os.path.exists(path):
+            STORES[path] = CacheStore(path)
+        return STORES[path]
+
+
+def flush_all():
+    with STORES_LOCK:
+        stores = list(STORES.values())
+    for store in stores:
+        store.flush()
+
+
+atexit.register(flush_all)
+
+
+def _from_pickle(kind, data):
+    '''The plain data of a pickled record'''
+    if kind == 'issue':
+        return {'raw_data': data.raw_data, 'headers': data.raw_headers}
+    if kind in ('files', 'labels', 'assignees'):
+        return [data[0], [x.raw_data for x in data[1]]]
+    return data
+
+
+def migrate_repo(repo_cachedir, remove=False):
+    '''Move the per issue cache files of a repo into its store
+
+    Returns the number of records written.
+    '''
+    store = get_store(repo_cachedir)
+    issuesdir = os.path.join(os.path.expanduser(repo_cachedir), 'issues')
+    if not os.path.isdir(issuesdir):
+        return 0
+
+    count = 0
+    for kind in ('labels', 'assignees'):
+        fn = os.path.join(os.path.expanduser(repo_cachedir), '%s.pickle' % kind)
+        if os.path.isfile(fn):
+            try:
+                with open(fn, 'rb') as f:
+                    store.put_data(REPO, kind, _from_pickle(kind, pickle.load(f)))
+                count += 1
+            except Exception as e:
+                logging.warning('skipping the %s cache: %s' % (kind, e))
+
+    for number in sorted(os.listdir(issuesdir)):
+        if not number.isdigit():
+            continue
+        idir = os.path.join(issuesdir, number)
+
+        for kind, filename in LEGACY_FILES.items():
+            fn = os.path.join(idir, filename)
+            if not os.path.isfile(fn):
+                continue
+            with open(fn, 'rb') as f:
+                data = f.read()
+            if kind in VERSIONS:
+                try:
+                    store.put_data(number, kind, _from_pickle(kind, pickle.loads(data)))
+                except Exception as e:
+                    # the bot fetches it again
+                    logging.warning('skipping the %s cache of %s: %s' % (kind, number, e))
+                    continue
+            else:
+                store.put(number, kind, data)
+            count += 1
+
+        # the timeline was split over a data and a meta file
+        tdata = os.path.join(idir, 'timeline_data.json')
+        tmeta = os.path.join(idir, 'timeline_meta.json')
+        if os.path.isfile(tdata) and os.path.isfile(tmeta):
+            try:
+                with open(tmeta) as f:
+                    timeline = json.loads(f.read())
+                with open(tdata) as f:
+                    timeline['events'] = json.loads(f.read())
+                store.put_json(number, 'timeline', timeline)
+                count += 1
+            except ValueError as e:
+                logging.warning('skipping the timeline of %s: %s' % (number, e))
+
+        store.flush()
+
+        if remove:
+            for filename in list(LEGACY_FILES.values()) + ['timeline_data.json', 'timeline_meta.json']:
+                # meta.json stays, it is the output scripts read
+                if filename == 'meta.json':
+                    continue
+                fn = os.path.join(idir, filename)
+                if os.path.isfile(fn):
+                    os.remove(fn)
+
+    logging.info('migrated %s records into %s' % (count, store.path))
+    return count
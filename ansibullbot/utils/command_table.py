@@ -0,0 +1,138 @@
+'''The commands in the comments of an issue
+
+The triager and its plugins look for commands in the comments: the
+VALID_COMMANDS words, the CI commands, approvals, and the +label, -label,
+!waffling and !component lines. A CommandTable splits each comment and
+review of a history into its words and lines once and keeps a row per
+command it finds, with the actor and date, for them to query.
+'''
+
+import collections
+
+from operator import attrgetter
+
+
+VALID_COMMANDS = [
+    'needs_info',
+    '!needs_info',
+    'notabug',
+    'bot_status',
+    'bot_broken',
+    '!bot_broken',
+    'bot_skip',
+    '!bot_skip',
+    'wontfix',
+    'bug_resolved',
+    'resolved_by_pr',
+    'needs_contributor',
+    '!needs_contributor',
+    'needs_rebase',
+    '!needs_rebase',
+    'needs_revision',
+    '!needs_revision',
+    'shipit',
+    '!shipit',
+    'duplicate_of',
+    'close_me'
+]
+
+APPROVAL_COMMANDS = frozenset(['shipit', '+1', 'LGTM', 'rebuild_merge'])
+
+# commands that are a word anywhere in a comment
+WORD_COMMANDS = frozenset(VALID_COMMANDS) | APPROVAL_COMMANDS | frozenset([
+    '/rebuild',
+    '/rebuild_failed',
+    'ready_for_review',
+])
+
+Command = collections.namedtuple(
+    'Command',
+    ['index', 'position', 'event', 'actor', 'created_at', 'command', 'arg']
+)
+
+
+def tokenize(body):
+    '''The words of a comment and the (command, arg) it has, in order
+
+    A word command is listed once, with no argument.
+    '''
+    words = set()
+    commands = []
+    for line in body.split('\n'):
+        parts = line.split()
+        if not parts:
+            continue
+        for word in parts:
+            if word in WORD_COMMANDS and word not in words:
+                commands.append((word, None))
+            words.add(word)
+
+        first = parts[0]
+        if first in ('+label', '-label') and len(parts) > 1:
+            commands.append((first, parts[1]))
+        elif first.startswith('!waffling') and len(parts) > 1:
+            commands.append(('!waffling', parts[1]))
+        elif first.startswith('!component'):
+            # !component [action][filename] or !component[action][filename]
+            arg = parts[1] if len(parts) > 1 else ' '.join(parts).replace('!component', '')
+            if arg:
+                commands.append(('!component', arg))
+    return frozenset(words), commands
+
+
+class CommandTable:
+
+    def __init__(self, history, botnames=()):
+        self.rows = []
+        self.by_command = {}
+        # position in the history -> words of the comment or review
+        self.words = {}
+        # positions of the comments mirrored from another issue
+        self.mirrored = set()
+
+        for pos, event in enumerate(history):
+            body = event.get('body')
+            if not body or not isinstance(body, str) or event.get('actor') in botnames:
+                continue
+            words, commands = tokenize(body)
+            self.words[pos] = words
+            if body.startswith('_From @'):
+                self.mirrored.add(pos)
+            for command, arg in commands:
+                row = Command(
+                    len(self.rows), pos, event['event'], event.get('actor'),
+                    event.get('created_at'), command, arg
+                )
+                self.rows.append(row)
+                self.by_command.setdefault(command, []).append(row)
+
+    def find(self, commands, actors=None, event='commented'):
+        '''The rows of the commands by the actors, in the order of the history
+
+        actors and event are not filtered on when they are None.
+        '''
+        if isinstance(commands, str):
+            commands = [commands]
+        commands = set(commands)
+        rows = []
+        for command in commands:
+            rows.extend(self.by_command.get(command, []))
+        if actors is not None:
+            actors = set(actors)
+            rows = [x for x in rows if x.actor in actors]
+        if event is not None:
+            rows = [x for x in rows if x.event == event]
+        if len(commands) > 1:
+            rows.sort(key=attrgetter('index'))
+        return rows
+
+    def has_word(self, position, word):
+        return word in self.words.get(position, ())
+
+    def is_active(self, position, command):
+        '''Does the comment give the command without also negating it?'''
+        words = self.words.get(position, ())
+        return command in words and '!' + command not in words
+
+    def is_approval(self, position):
+        return bool(APPROVAL_COMMANDS & self.words.get(position, frozenset()))
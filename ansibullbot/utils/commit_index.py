@@ -0,0 +1,184 @@
+'''Commit counts by author email, in total and by file
+
+The submitter facts ask how many commits an author made and how many of
+them touched each file of a pullrequest. One git log --name-only of the
+checkout answers that for every author at once, instead of a git show per
+commit of the author.
+
+Emails and paths are numbered, the counts kept in arrays of those numbers.
+The index is stored as plain json in the .git directory of the checkout
+with the HEAD it was built at, and only the commits since that HEAD are
+read when the checkout moved ahead. An index stored with another
+SCHEMA_VERSION is built again.
+'''
+
+import array
+import json
+import logging
+import os
+import subprocess
+
+from ansibullbot._text_compat import to_text
+
+
+INDEX_FILE = 'ansibullbot_commit_index.json'
+
+
+def read_commits(checkoutdir, revs):
+    '''(email, [path]) of every commit in revs, newest first'''
+    cmd = [
+        'git', '-c', 'core.quotePath=false', 'log', '--name-only', '--format=%x00%H;%ae',
+    ] + list(revs)
+    p = subprocess.Popen(cmd, cwd=checkoutdir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    email = None
+    paths = []
+    for line in p.stdout:
+        line = to_text(line).rstrip('\n')
+        if line.startswith('\0'):
+            if email is not None:
+                yield email, paths
+            email = line[1:].split(';', 1)[1]
+            paths = []
+        elif line:
+            paths.append(line)
+    if email is not None:
+        yield email, paths
+    p.stdout.close()
+    if p.wait() != 0:
+        raise OSError('git log %s failed in %s' % (' '.join(revs), checkoutdir))
+
+
+class CommitIndex:
+
+    SCHEMA_VERSION = 1
+
+    def __init__(self):
+        # the commit the index was built up to
+        self.head = None
+        self.email_ids = {}
+        self.path_ids = {}
+        self.paths = []
+        # by email id
+        self.commit_counts = array.array('I')
+        # by email id, (path ids, counts) sorted by path id
+        self.file_counts = []
+
+    def _get_email_id(self, email):
+        eid = self.email_ids.get(email)
+        if eid is None:
+            eid = self.email_ids[email] = len(self.commit_counts)
+            self.commit_counts.append(0)
+            self.file_counts.append((array.array('I'), array.array('I')))
+        return eid
+
+    def _get_path_id(self, path):
+        pid = self.path_ids.get(path)
+        if pid is None:
+            pid = self.path_ids[path] = len(self.paths)
+            self.paths.append(path)
+        return pid
+
+    def add_commits(self, commits):
+        '''Count the (email, [path]) of more commits, returns how many'''
+        pending = {}
+        count = 0
+        for email, paths in commits:
+            eid = self._get_email_id(email)
+            self.commit_counts[eid] += 1
+            counts = pending.setdefault(eid, {})
+            for path in paths:
+                pid = self._get_path_id(path)
+                counts[pid] = counts.get(pid, 0) + 1
+            count += 1
+
+        for eid, counts in pending.items():
+            pids, values = self.file_counts[eid]
+            for pid, value in zip(pids, values):
+                counts[pid] = counts.get(pid, 0) + value
+            pids = sorted(counts)
+            self.file_counts[eid] = (array.array('I', pids), array.array('I', [counts[x] for x in pids]))
+        return count
+
+    def get(self, email):
+        '''{'commit_count': n, 'commit_count_byfile': {path: n}} of an email'''
+        eid = self.email_ids.get(email)
+        if eid is None:
+            return {'commit_count': 0, 'commit_count_byfile': {}}
+        pids, values = self.file_counts[eid]
+        return {
+            'commit_count': self.commit_counts[eid],
+            'commit_count_byfile': {self.paths[x]: y for x, y in zip(pids, values)},
+        }
+
+    def update(self, checkoutdir, head):
+        '''Count the commits up to head that are not counted yet
+
+        When head does not descend from the commit the index was built up
+        to, the history was rewritten and everything is counted again.
+        '''
+        revs = [head]
+        if self.head:
+            rc = subprocess.call(
+                ['git', 'merge-base', '--is-ancestor', self.head, head],
+                cwd=checkoutdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            if rc == 0:
+                revs.append('^%s' % self.head)
+            else:
+                logging.info('%s is not an ancestor of %s, rebuilding the commit index' % (self.head, head))
+                self.__init__()
+        count = self.add_commits(read_commits(checkoutdir, revs))
+        self.head = head
+        logging.info('added %s commits to the commit index of %s' % (count, checkoutdir))
+
+    @staticmethod
+    def get_path(checkoutdir):
+        return os.path.join(checkoutdir, '.git', INDEX_FILE)
+
+    def to_dict(self):
+        return {
+            'version': self.SCHEMA_VERSION,
+            'head': self.head,
+            # by email id
+            'emails': list(self.email_ids),
+            'paths': self.paths,
+            'commit_counts': self.commit_counts.tolist(),
+            'file_counts': [(pids.tolist(), values.tolist()) for pids, values in self.file_counts],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls()
+        index.head = data['head']
+        index.email_ids = {x: i for i, x in enumerate(data['emails'])}
+        index.paths = data['paths']
+        index.path_ids = {x: i for i, x in enumerate(index.paths)}
+        index.commit_counts = array.array('I', data['commit_counts'])
+        index.file_counts = [
+            (array.array('I', pids), array.array('I', values)) for pids, values in data['file_counts']
+        ]
+        return index
+
+    @classmethod
+    def load(cls, checkoutdir):
+        path = cls.get_path(checkoutdir)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != cls.SCHEMA_VERSION:
+                logging.info('commit index %s has schema version %s, rebuilding' % (path, data.get('version')))
+                return None
+            return cls.from_dict(data)
+        except Exception as e:
+            logging.warning('unreadable commit index %s: %s' % (path, e))
+            return None
+
+    def save(self, checkoutdir):
+        path = self.get_path(checkoutdir)
+        # readers never see a partial file
+        tmp = '%s.%s' % (path, os.getpid())
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp, path)
@@ -184,7 +184,7 @@ class AnsibleComponentMatcher:
         'winrm': 'lib/ansible/plugins/connection/winrm.py'
     }
 
-    def __init__(self, gitrepo=None, botmeta=None, usecache=False, cachedir=None, email_cache=None, use_galaxy=False):
+    def __init__(self, gitrepo=None, botmeta=None, usecache=False, cachedir=None, email_cache=None, use_galaxy=False, state=None):
         self.gitrepo = gitrepo
         self.usecache = usecache
         self.cachedir = cachedir
@@ -200,17 +200,45 @@ class AnsibleComponentMatcher:
         self.strategy = None
         self.strategies = []
 
-        self.update()
+        # the get_state() of a matcher for the same checkout and botmeta
+        if state is not None:
+            self.set_state(state)
+        else:
+            self.update()
+
+    def get_state(self):
+        return {
+            'MODULES': self.MODULES,
+            'MODULE_NAMES': self.MODULE_NAMES,
+            'MODULE_NAMESPACE_DIRECTORIES': self.MODULE_NAMESPACE_DIRECTORIES,
+            'KEYWORDS': self.KEYWORDS,
+            # index_files adds the module metadata to the botmeta
+            'botmeta_files': self.botmeta['files'],
+        }
 
-    def update(self, email_cache=None, botmeta=None):
+    def set_state(self, state):
+        self.MODULES = state['MODULES']
+        self.MODULE_NAMES = state['MODULE_NAMES']
+        self.MODULE_NAMESPACE_DIRECTORIES = state['MODULE_NAMESPACE_DIRECTORIES']
+        self.KEYWORDS = state['KEYWORDS']
+        self.botmeta['files'].clear()
+        self.botmeta['files'].update(state['botmeta_files'])
+
+    def update(self, email_cache=None, botmeta=None, changed_files=None):
+        '''Index the files again
+
+        Given the paths that changed since the last update, the metadata
+        of the other modules is kept. That needs the botmeta this matcher
+        already added the metadata to.
+        '''
         if botmeta is not None:
             self.botmeta = botmeta
         if email_cache:
             self.email_cache = email_cache
-        self.index_files()
+        self.index_files(changed_files=changed_files)
         self.cache_keywords()
 
-    def get_module_meta(self, checkoutdir, filename):
+    def get_module_meta(self, checkoutdir, filename, refresh=False):
 
         if self.cachedir:
             cdir = os.path.join(self.cachedir, 'module_extractor_cache')
@@ -221,7 +249,7 @@ class AnsibleComponentMatcher:
         cfile = os.path.join(cdir, '%s.json' % os.path.basename(filename))
 
         bmeta = None
-        if not os.path.exists(cfile) or not self.usecache:
+        if refresh or not os.path.exists(cfile) or not self.usecache:
             efile = os.path.join(checkoutdir, filename)
             if not os.path.exists(efile):
                 fdata = self.gitrepo.get_file_content(filename, follow=True)
@@ -277,7 +305,8 @@ class AnsibleComponentMatcher:
 
         return bmeta
 
-    def index_files(self):
+    def index_files(self, changed_files=None):
+        previous = self.MODULES if changed_files is not None else {}
         self.MODULES = OrderedDict()
         self.MODULE_NAMES = []
         self.MODULE_NAMESPACE_DIRECTORIES = []
@@ -357,9 +386,13 @@ class AnsibleComponentMatcher:
                     _k = k
             else:
                 _k = k
+            if k in previous and k not in changed_files:
+                # the botmeta already has the metadata
+                self.MODULES[k] = previous[k]
+                continue
             logging.debug('extract %s' % k)
             # FIXME fmeta = self.get_module_meta(checkoutdir, k, _k)
-            fmeta = self.get_module_meta(checkoutdir, k)
+            fmeta = self.get_module_meta(checkoutdir, k, refresh=changed_files is not None)
             if k in self.botmeta['files']:
                 self.botmeta['files'][k].update(fmeta)
             else:
@@ -1010,7 +1043,12 @@ class AnsibleComponentMatcher:
         if body in self.gitrepo.files:
             matches = [body]
         else:
-            for fn in self.gitrepo.files:
+            if partial:
+                candidates = self.gitrepo.files.with_prefix(context) if context else self.gitrepo.files
+            else:
+                # without partial matching only a suffix can match
+                candidates = self.gitrepo.files.with_suffix(body, body + '.py', body + '.ps1')
+            for fn in candidates:
 
                 # limit the search set if a context is given
                 if context is not None and not fn.startswith(context):
@@ -1466,11 +1504,11 @@ class AnsibleComponentMatcher:
                 ppy = pattern + '.py'
             if not pattern.endswith('.py') and not pattern.endswith('.ps1'):
                 ps1 = pattern + '.ps1'
-            for mf in self.gitrepo.module_files:
-                if pattern in mf:
-                    if mf.endswith((pattern, ppy, ps1)):
-                        candidate = mf
-                        break
+            suffixes = [x for x in (pattern, ppy, ps1) if x]
+            for mf in self.gitrepo.file_index.with_suffix(*suffixes):
+                if mf.startswith('plugins/modules'):
+                    candidate = mf
+                    break
 
         return candidate
 
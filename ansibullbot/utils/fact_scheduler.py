@@ -0,0 +1,151 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from ansibullbot.utils.fingerprint import get_group_digest
+
+
+class FactPlugin:
+
+    '''A fact gathering function and the meta keys it reads and writes
+
+    inputs names what else the function reads, the digests of
+    fingerprint.get_input_digests. A plugin without inputs is always run.
+    uses names shared objects that are not thread safe, plugins that use
+    the same one run one after the other.
+    '''
+
+    def __init__(self, name, func, reads=(), writes=(), inputs=None, uses=()):
+        # func(meta) -> dict of facts to merge into the meta
+        self.name = name
+        self.func = func
+        self.reads = frozenset(reads)
+        self.writes = frozenset(writes)
+        self.inputs = frozenset(inputs) if inputs is not None else None
+        self.uses = frozenset(uses)
+
+    def __repr__(self):
+        return '<FactPlugin %s>' % self.name
+
+    def depends_on(self, other):
+        '''Does this plugin have to run after other, an earlier plugin?'''
+        return bool(
+            other.writes & self.reads or
+            other.writes & self.writes or
+            other.reads & self.writes or
+            other.uses & self.uses
+        )
+
+
+class FactScheduler:
+
+    '''Run fact plugins concurrently in the order their meta keys allow
+
+    The plugins are given in the order they would run serially. A plugin
+    waits for every earlier plugin it shares a key with, so the merged meta
+    is the same as the serial run, including the key order.
+
+    Plugins given as reused are not run, their facts are merged as if
+    they had been, see get_stale and get_reused.
+    '''
+
+    def __init__(self, plugins, workers=8):
+        self.plugins = plugins
+        self.workers = workers
+        # name -> facts of the last run
+        self.results = {}
+
+        self.deps = {}
+        for idx, plugin in enumerate(plugins):
+            if plugin.name in self.deps:
+                raise ValueError('duplicate fact plugin: %s' % plugin.name)
+            self.deps[plugin.name] = {
+                x.name for x in plugins[:idx] if plugin.depends_on(x)
+            }
+
+    def get_stale(self, digests, groups):
+        '''The names of the plugins whose facts have to be gathered again
+
+        groups is what get_groups recorded for the last triage. A plugin is
+        stale once one of its inputs changed, or a plugin it depends on is.
+        '''
+        stale = set()
+        for plugin in self.plugins:
+            group = groups.get(plugin.name)
+            if (
+                plugin.inputs is None or
+                group is None or
+                group['digest'] != get_group_digest(plugin.inputs, digests) or
+                self.deps[plugin.name] & stale
+            ):
+                stale.add(plugin.name)
+        return stale
+
+    def get_reused(self, groups, meta, stale):
+        '''The facts of the plugins that are not stale, from the last meta'''
+        reused = {}
+        for plugin in self.plugins:
+            if plugin.name in stale:
+                continue
+            group = groups[plugin.name]
+            facts = {x: meta.get(x) for x in group['keys']}
+            # keys a later plugin overwrote are kept aside
+            facts.update(group['shadowed'])
+            reused[plugin.name] = facts
+        return reused
+
+    def get_groups(self, digests):
+        '''What get_stale and get_reused need to know of this run'''
+        groups = {}
+        for idx, plugin in enumerate(self.plugins):
+            if plugin.inputs is None:
+                continue
+            facts = self.results[plugin.name]
+            later = set()
+            for other in self.plugins[idx + 1:]:
+                later.update(self.results[other.name])
+            groups[plugin.name] = {
+                'digest': get_group_digest(plugin.inputs, digests),
+                'keys': sorted(facts),
+                'shadowed': {k: v for k, v in facts.items() if k in later},
+            }
+        return groups
+
+    def run_serial(self, meta, reused=None):
+        reused = reused or {}
+        self.results = {}
+        for plugin in self.plugins:
+            if plugin.name in reused:
+                self.results[plugin.name] = reused[plugin.name]
+            else:
+                self.results[plugin.name] = plugin.func(meta)
+            meta.update(self.results[plugin.name])
+        return meta
+
+    def run(self, meta, reused=None):
+        results = dict(reused or {})
+        # only this thread updates the working copy, each plugin gets
+        # a snapshot of it with everything it depends on already merged
+        working = meta.copy()
+        for plugin in self.plugins:
+            if plugin.name in results:
+                working.update(results[plugin.name])
+        pending = [x for x in self.plugins if x.name not in results]
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while pending or running:
+                for plugin in pending[:]:
+                    if self.deps[plugin.name].issubset(results):
+                        pending.remove(plugin)
+                        future = executor.submit(plugin.func, working.copy())
+                        running[future] = plugin
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    plugin = running.pop(future)
+                    results[plugin.name] = future.result()
+                    working.update(results[plugin.name])
+
+        self.results = results
+        for plugin in self.plugins:
+            meta.update(results[plugin.name])
+        return meta
@@ -0,0 +1,127 @@
+'''Fingerprints of what a triage depends on
+
+An issue whose events, labels, assignees, pullrequest, reviews and CI run
+are unchanged, triaged against the same BOTMETA, checkout, maintainer team
+and bot code, comes to the same facts and actions. The triager stores the
+fingerprint with the meta and reuses the stored meta and actions when it
+matches, see --memoize-triage. When only some inputs changed, the fact
+plugins that do not read them keep their facts from the stored meta, see
+FactScheduler.get_stale.
+
+Some facts count the days since an event, like the needs_info timeouts,
+so the date is part of the fingerprint as well.
+'''
+
+import datetime
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from ansibullbot._text_compat import to_bytes
+
+
+STATS_LOCK = threading.Lock()
+STATS = {
+    'hits': 0,
+    'misses': 0,
+    'facts_reused': 0,
+    'facts_run': 0,
+}
+
+
+def git_blob_sha(data):
+    '''The sha git gives a file with this content'''
+    data = to_bytes(data)
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def get_code_version():
+    '''A hash over the source and templates of the bot'''
+    basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    digest = hashlib.sha1()
+    for root, dirs, files in sorted(os.walk(basedir)):
+        dirs.sort()
+        for fn in sorted(files):
+            if not fn.endswith(('.py', '.j2')):
+                continue
+            path = os.path.join(root, fn)
+            digest.update(to_bytes(os.path.relpath(path, basedir)))
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def get_digest(data):
+    return hashlib.sha256(to_bytes(json.dumps(data, sort_keys=True, default=str))).hexdigest()
+
+
+def get_input_digests(iw, ci=None, botmeta_sha=None, index_version=None, valid_labels=None,
+                      maintainer_team=None):
+    '''A digest of each input a triage of iw reads, by name
+
+    The names are what FactPlugin.inputs refers to.
+    '''
+    if iw.is_pullrequest():
+        pr = iw.pullrequest
+        pullrequest = (
+            pr.head.sha, pr.base.ref, pr.state, pr.merged, pr.draft,
+            pr.mergeable, pr.mergeable_state,
+        )
+        # the state and commit of a review are not part of its history event
+        reviews = iw.reviews
+    else:
+        pullrequest = None
+        reviews = None
+
+    inputs = {
+        'issue': (iw.title, iw.body, iw.state, iw.submitter, iw.created_at, iw.html_url),
+        # whole events, an edited comment keeps its id but not its body
+        'history': iw.history.history,
+        'labels': sorted(iw.labels),
+        'assignees': sorted(iw.assignees),
+        'pullrequest': pullrequest,
+        'reviews': reviews,
+        'ci': (ci.state, ci.updated_at) if ci else None,
+        'botmeta': botmeta_sha,
+        'index': index_version,
+        'valid_labels': sorted(valid_labels or []),
+        'maintainer_team': sorted(maintainer_team or []),
+        'code': get_code_version(),
+        'date': datetime.date.today().isoformat(),
+    }
+    return {k: get_digest(v) for k, v in inputs.items()}
+
+
+def get_group_digest(inputs, digests):
+    '''The digest of the named inputs, and of the bot code that reads them'''
+    return get_digest([digests['code']] + [(x, digests[x]) for x in sorted(inputs)])
+
+
+def get_triage_fingerprint(digests):
+    '''The digest of every input of a triage'''
+    return get_group_digest(digests, digests)
+
+
+def count(name, value=1):
+    with STATS_LOCK:
+        STATS[name] += value
+
+
+def get_stats():
+    with STATS_LOCK:
+        return STATS.copy()
+
+
+def log_stats():
+    stats = get_stats()
+    total = stats['hits'] + stats['misses']
+    if not total:
+        return
+    logging.info(
+        'triage fingerprints: %s hits, %s misses (%.1f%% hit rate), %s fact plugins reused, %s run' %
+        (stats['hits'], stats['misses'], 100.0 * stats['hits'] / total, stats['facts_reused'], stats['facts_run'])
+    )
@@ -8,7 +8,9 @@ from string import Template
 
 import requests
 
+import ansibullbot.constants as C
 from ansibullbot._text_compat import to_bytes, to_text
+from ansibullbot.utils import http_cache
 from ansibullbot.utils.receiver_client import post_to_receiver
 
 
@@ -98,6 +100,203 @@ query {
 }
 """
 
+QUERY_TEMPLATE_ISSUE_BATCH = """
+{
+    repository(owner:"$owner", name:"$repo") {
+        $nodes
+    }
+}
+"""
+
+QUERY_ISSUE_BATCH_NODE = """
+        i$number: issueOrPullRequest(number: $number) {
+            __typename
+            ... on Issue {
+                $fields
+            }
+            ... on PullRequest {
+                $fields
+                isDraft
+                mergeable
+                merged
+                mergedAt
+            }
+        }
+"""
+
+QUERY_ISSUE_BATCH_FIELDS = """
+id
+number
+url
+title
+body
+state
+createdAt
+updatedAt
+closedAt
+author {
+    __typename
+    login
+}
+labels(first: 100) {
+    nodes {
+        name
+    }
+}
+assignees(first: 100) {
+    nodes {
+        login
+    }
+}
+"""
+
+QUERY_CI_STATUS_NODE = """
+        p$number: pullRequest(number: $number) {
+            commits(last: 1) {
+                nodes {
+                    commit {
+                        statusCheckRollup {
+                            contexts(last: 100) {
+                                nodes {
+                                    __typename
+                                    ... on CheckRun {
+                                        startedAt
+                                        completedAt
+                                    }
+                                    ... on StatusContext {
+                                        createdAt
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+"""
+
+QUERY_PULLREQUEST_SNAPSHOT = """
+query($owner: String!, $repo: String!, $number: Int!,
+      $withFiles: Boolean!, $withCommits: Boolean!, $withReviews: Boolean!,
+      $filesCursor: String, $commitsCursor: String, $reviewsCursor: String) {
+    repository(owner: $owner, name: $repo) {
+        pullRequest(number: $number) {
+            number
+            updatedAt
+            headRefOid
+            baseRefName
+            files(first: 100, after: $filesCursor) @include(if: $withFiles) {
+                pageInfo {
+                    endCursor
+                    hasNextPage
+                }
+                nodes {
+                    path
+                    additions
+                    deletions
+                    changeType
+                }
+            }
+            commits(first: 100, after: $commitsCursor) @include(if: $withCommits) {
+                pageInfo {
+                    endCursor
+                    hasNextPage
+                }
+                nodes {
+                    commit {
+                        oid
+                        url
+                        message
+                        authoredDate
+                        committedDate
+                        parents(first: 2) {
+                            nodes {
+                                oid
+                            }
+                        }
+                        author {
+                            name
+                            email
+                            user {
+                                login
+                            }
+                        }
+                        committer {
+                            name
+                            email
+                            user {
+                                login
+                            }
+                        }
+                    }
+                }
+            }
+            reviews(first: 100, after: $reviewsCursor) @include(if: $withReviews) {
+                pageInfo {
+                    endCursor
+                    hasNextPage
+                }
+                nodes {
+                    databaseId
+                    state
+                    body
+                    submittedAt
+                    author {
+                        login
+                    }
+                    commit {
+                        oid
+                    }
+                }
+            }
+            headCommit: commits(last: 1) {
+                nodes {
+                    commit {
+                        oid
+                        statusCheckRollup {
+                            state
+                        }
+                        checkSuites(first: 20) {
+                            nodes {
+                                app {
+                                    slug
+                                }
+                                checkRuns(first: 100) {
+                                    nodes {
+                                        databaseId
+                                        name
+                                        status
+                                        conclusion
+                                        detailsUrl
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+"""
+
+# graphql -> rest values for PullRequestChangedFile.changeType
+CHANGE_TYPES = {
+    'ADDED': 'added',
+    'DELETED': 'removed',
+    'MODIFIED': 'modified',
+    'RENAMED': 'renamed',
+    'COPIED': 'copied',
+    'CHANGED': 'changed',
+}
+
+# graphql -> pygithub values for PullRequest.mergeable
+MERGEABLE_STATES = {
+    'MERGEABLE': True,
+    'CONFLICTING': False,
+    'UNKNOWN': None,
+}
+
 
 class GithubGraphQLClient:
     baseurl = 'https://api.github.com/graphql'
@@ -111,10 +310,13 @@ class GithubGraphQLClient:
             'Accept': 'application/json',
             'Authorization': 'Bearer %s' % self.token,
         }
+        # graphql is POST only, going through the caching session keeps the
+        # connection alive and counts the requests with the rest of the api
+        self.session = http_cache.new_session()
 
     def get_members(self, org, team):
         query = Template(QUERY_TEAM_MEMBERS_TEMPLATE).substitute(login=org, slug=team)
-        resp = requests.post(self.baseurl, headers=self.headers, data=json.dumps({'query': query}))
+        resp = self.session.post(self.baseurl, headers=self.headers, data=json.dumps({'query': query}))
         if not resp.ok:
             raise Exception
         data = resp.json()
@@ -217,7 +419,7 @@ class GithubGraphQLClient:
                 'variables': '{}',
                 'operationName': None
             }
-            rr = requests.post(self.baseurl, headers=self.headers, data=json.dumps(payload))
+            rr = self.session.post(self.baseurl, headers=self.headers, data=json.dumps(payload))
             if not rr.ok:
                 break
             data = rr.json()
@@ -266,7 +468,7 @@ class GithubGraphQLClient:
         }
         payload['query'] = to_text(payload['query'], 'ascii')
 
-        rr = requests.post(self.baseurl, headers=self.headers, data=json.dumps(payload))
+        rr = self.session.post(self.baseurl, headers=self.headers, data=json.dumps(payload))
         data = rr.json()
 
         node = data['data']['repository'][otype]
@@ -290,6 +492,244 @@ class GithubGraphQLClient:
 
         node['type'] = node_type
 
+    def get_issue_batch(self, owner, repo, numbers, batch_size=50):
+        """Fetch issues and pullrequests with aliased queries
+
+        Returns a dict of issue snapshots with numbers as keys, numbers
+        that do not exist are left out.
+
+        Args:
+            owner      (str): the github namespace
+            repo       (str): the github repository
+            numbers   (list): issue or pullrequest numbers
+            batch_size (int): numbers per query
+        """
+        numbers = list(numbers)
+        snapshots = {}
+        for idx in range(0, len(numbers), batch_size):
+            chunk = numbers[idx:idx + batch_size]
+            nodes = ''.join(
+                Template(QUERY_ISSUE_BATCH_NODE).substitute(number=x, fields=QUERY_ISSUE_BATCH_FIELDS)
+                for x in chunk
+            )
+            query = Template(QUERY_TEMPLATE_ISSUE_BATCH).substitute(owner=owner, repo=repo, nodes=nodes)
+
+            payload = {
+                'query': to_text(query, 'ascii', 'ignore').strip(),
+                'variables': '{}',
+                'operationName': None
+            }
+            # deleted or transferred numbers come back as NOT_FOUND errors
+            response = self.requests(payload, allowed_errors=('NOT_FOUND',))
+            data = response.json().get('data', {}).get('repository') or {}
+
+            for number in chunk:
+                node = data.get('i%s' % number)
+                if node is None:
+                    continue
+                snapshots[number] = self.update_issue_node(node, owner, repo)
+
+            logging.debug('%s/%s issue batch: %s/%s' % (owner, repo, len(snapshots), idx + len(chunk)))
+
+        return snapshots
+
+    def get_ci_updated_at(self, owner, repo, numbers, batch_size=50):
+        """When the checks and statuses on the head of pullrequests last changed
+
+        Returns a dict with numbers as keys and the latest timestamp as
+        value, None for a head without any checks. Numbers that do not
+        exist are left out.
+
+        Args:
+            owner      (str): the github namespace
+            repo       (str): the github repository
+            numbers   (list): pullrequest numbers
+            batch_size (int): numbers per query
+        """
+        numbers = list(numbers)
+        updated = {}
+        for idx in range(0, len(numbers), batch_size):
+            chunk = numbers[idx:idx + batch_size]
+            nodes = ''.join(Template(QUERY_CI_STATUS_NODE).substitute(number=x) for x in chunk)
+            query = Template(QUERY_TEMPLATE_ISSUE_BATCH).substitute(owner=owner, repo=repo, nodes=nodes)
+
+            payload = {
+                'query': to_text(query, 'ascii', 'ignore').strip(),
+                'variables': '{}',
+                'operationName': None
+            }
+            response = self.requests(payload, allowed_errors=('NOT_FOUND',))
+            data = response.json().get('data', {}).get('repository') or {}
+
+            for number in chunk:
+                node = data.get('p%s' % number)
+                if node is None:
+                    continue
+                timestamps = []
+                for commit in node['commits']['nodes']:
+                    rollup = commit['commit'].get('statusCheckRollup') or {'contexts': {'nodes': []}}
+                    for context in rollup['contexts']['nodes']:
+                        timestamps += [
+                            context.get(x) for x in ('startedAt', 'completedAt', 'createdAt') if context.get(x)
+                        ]
+                updated[number] = max(timestamps) if timestamps else None
+
+        return updated
+
+    def update_issue_node(self, node, owner, repo):
+        """Convert a get_issue_batch node to the names pygithub uses"""
+        author = node.get('author') or {'login': 'ghost', '__typename': 'User'}
+        state = node['state'].lower()
+        if state == 'merged':
+            state = 'closed'
+
+        return {
+            'id': node['id'],
+            'number': node['number'],
+            'type': 'pullrequest' if node['__typename'] == 'PullRequest' else 'issue',
+            'url': '%s/repos/%s/%s/issues/%s' % (C.DEFAULT_GITHUB_URL, owner, repo, node['number']),
+            'html_url': node['url'],
+            'title': node['title'],
+            'body': node['body'],
+            'state': state,
+            'created_at': node['createdAt'],
+            'updated_at': node['updatedAt'],
+            'closed_at': node['closedAt'],
+            'merged_at': node.get('mergedAt'),
+            'user': {'login': author['login'], 'type': author['__typename']},
+            'labels': [x['name'] for x in node['labels']['nodes']],
+            'assignees': [x['login'] for x in node['assignees']['nodes']],
+            'draft': node.get('isDraft', False),
+            'mergeable': MERGEABLE_STATES.get(node.get('mergeable')),
+            'merged': node.get('merged', False),
+        }
+
+    def get_pullrequest_snapshot(self, owner, repo, number, full=True):
+        """Fetch files, commits, reviews and head check runs of a pullrequest
+
+        Files and commits only change with the head sha, with full=False
+        they are left out so a cached copy can be reused.
+
+        Args:
+            owner  (str): the github namespace
+            repo   (str): the github repository
+            number (int): the pullrequest number
+            full  (bool): include the files and commits
+        """
+        variables = {
+            'owner': owner,
+            'repo': repo,
+            'number': number,
+            'withFiles': full,
+            'withCommits': full,
+            'withReviews': True,
+        }
+        cursors = {
+            'files': 'filesCursor',
+            'commits': 'commitsCursor',
+            'reviews': 'reviewsCursor',
+        }
+        flags = {
+            'files': 'withFiles',
+            'commits': 'withCommits',
+            'reviews': 'withReviews',
+        }
+
+        pr = None
+        nodes = {'files': [], 'commits': [], 'reviews': []}
+        while True:
+            payload = {
+                'query': QUERY_PULLREQUEST_SNAPSHOT,
+                'variables': variables,
+                'operationName': None
+            }
+            response = self.requests(payload)
+            data = response.json()['data']['repository']['pullRequest']
+            if pr is None:
+                pr = data
+
+            # only page the connections that have more nodes
+            for key in nodes:
+                if not variables[flags[key]]:
+                    continue
+                nodes[key].extend(data[key]['nodes'])
+                pageinfo = data[key]['pageInfo']
+                variables[flags[key]] = pageinfo['hasNextPage']
+                variables[cursors[key]] = pageinfo['endCursor']
+
+            if not any(variables[x] for x in flags.values()):
+                break
+
+        snapshot = {
+            'number': pr['number'],
+            'updated_at': pr['updatedAt'],
+            'head_sha': pr['headRefOid'],
+            'base_ref': pr['baseRefName'],
+            'files': [],
+            'commits': [],
+            'reviews': [],
+            'check_runs': [],
+            'status': None,
+        }
+
+        for node in nodes['files']:
+            snapshot['files'].append({
+                'filename': node['path'],
+                'additions': node['additions'],
+                'deletions': node['deletions'],
+                'status': CHANGE_TYPES.get(node['changeType'], node['changeType'].lower()),
+            })
+
+        for node in nodes['commits']:
+            commit = node['commit']
+            snapshot['commits'].append({
+                'sha': commit['oid'],
+                'url': '%s/repos/%s/%s/commits/%s' % (C.DEFAULT_GITHUB_URL, owner, repo, commit['oid']),
+                'html_url': commit['url'],
+                'message': commit['message'],
+                'parents': [x['oid'] for x in commit['parents']['nodes']],
+                'author': {
+                    'login': (commit['author']['user'] or {}).get('login'),
+                    'name': commit['author']['name'],
+                    'email': commit['author']['email'],
+                    'date': commit['authoredDate'],
+                },
+                'committer': {
+                    'login': (commit['committer']['user'] or {}).get('login'),
+                    'name': commit['committer']['name'],
+                    'email': commit['committer']['email'],
+                    'date': commit['committedDate'],
+                },
+            })
+
+        # the same keys as the rest api reviews
+        for node in nodes['reviews']:
+            snapshot['reviews'].append({
+                'id': node['databaseId'],
+                'user': {'login': node['author']['login']} if node['author'] else None,
+                'state': node['state'],
+                'body': node['body'],
+                'submitted_at': node['submittedAt'],
+                'commit_id': (node['commit'] or {}).get('oid'),
+            })
+
+        for head in pr['headCommit']['nodes']:
+            rollup = head['commit']['statusCheckRollup']
+            if rollup:
+                snapshot['status'] = rollup['state'].lower()
+            for suite in head['commit']['checkSuites']['nodes']:
+                for run in suite['checkRuns']['nodes']:
+                    snapshot['check_runs'].append({
+                        'id': run['databaseId'],
+                        'name': run['name'],
+                        'status': run['status'].lower(),
+                        'conclusion': run['conclusion'].lower() if run['conclusion'] else None,
+                        'details_url': run['detailsUrl'],
+                        'app': (suite['app'] or {}).get('slug'),
+                    })
+
+        return snapshot
+
     def get_usernames_from_filename_blame(self, owner, repo, branch, filepath):
         template = Template(QUERY_TEMPLATE_BLAME)
         committers = defaultdict(set)
@@ -339,10 +779,10 @@ class GithubGraphQLClient:
             committers[github_id] = list(commits)
         return committers, emailmap
 
-    def requests(self, payload):
+    def requests(self, payload, allowed_errors=None):
         exc = None
         for i in range(5):
-            response = requests.post(self.baseurl, headers=self.headers, data=json.dumps(payload))
+            response = self.session.post(self.baseurl, headers=self.headers, data=json.dumps(payload))
             try:
                 response.raise_for_status()
             except requests.exceptions.HTTPError as e:
@@ -353,6 +793,8 @@ class GithubGraphQLClient:
             # GitHub GraphQL will happily return a 200 result with errors. One
             # must dig through the data to see if there were errors.
             errors = response.json().get('errors')
+            if errors and allowed_errors:
+                errors = [e for e in errors if e.get('type') not in allowed_errors]
             if errors:
                 msgs = ', '.join([e['message'] for e in errors])
                 exc = requests.exceptions.InvalidSchema('Error(s) from graphql: %s' % msgs)
@@ -0,0 +1,164 @@
+'''Read git objects through one long lived git cat-file --batch
+
+Every lookup through run_command starts a shell and a git process. A
+cat-file --batch process answers any number of lookups over its pipes:
+blobs by rev:path, trees and commits by rev. Tree listings and the files
+a commit changed are worked out here from those objects.
+
+scripts/benchmark_git_reader.py compares both.
+'''
+
+import logging
+import os
+import subprocess
+import threading
+
+from ansibullbot._text_compat import to_bytes, to_text
+
+
+class GitObjectReader:
+
+    def __init__(self, checkoutdir):
+        self.checkoutdir = checkoutdir
+        self._lock = threading.Lock()
+        self._proc = None
+        self._pid = None
+
+    def _start(self):
+        self._proc = subprocess.Popen(
+            ['git', 'cat-file', '--batch'],
+            cwd=self.checkoutdir,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._pid = os.getpid()
+
+    def _stop(self):
+        # a forked child must not close the pipes of its parent
+        if self._proc is not None and self._pid == os.getpid():
+            try:
+                self._proc.stdin.close()
+            except OSError:
+                pass
+            self._proc.stdout.close()
+            self._proc.wait()
+        self._proc = None
+
+    def close(self):
+        with self._lock:
+            self._stop()
+
+    def __del__(self):
+        self._stop()
+
+    def read(self, rev):
+        '''(sha, type, data) of the object rev names, None if there is none'''
+        with self._lock:
+            if self._proc is None or self._pid != os.getpid() or self._proc.poll() is not None:
+                self._stop()
+                self._start()
+            try:
+                self._proc.stdin.write(to_bytes(rev) + b'\n')
+                self._proc.stdin.flush()
+                header = self._proc.stdout.readline().split()
+                if len(header) != 3:
+                    # <rev> missing or <rev> ambiguous
+                    return None
+                sha, otype, size = header
+                data = self._proc.stdout.read(int(size) + 1)[:-1]
+            except (OSError, ValueError) as e:
+                logging.warning('git cat-file failed on %s: %s' % (rev, e))
+                self._stop()
+                return None
+        return to_text(sha), to_text(otype), data
+
+    def rev_parse(self, rev):
+        obj = self.read(rev)
+        return obj[0] if obj else None
+
+    def get_blob(self, rev, path):
+        '''The content of path at rev, None if it did not exist there'''
+        obj = self.read('%s:%s' % (rev, path))
+        if obj is None or obj[1] != 'blob':
+            return None
+        return obj[2]
+
+    @staticmethod
+    def parse_tree(data):
+        '''{name: (mode, sha)} of a tree object'''
+        entries = {}
+        idx = 0
+        while idx < len(data):
+            space = data.index(b' ', idx)
+            nul = data.index(b'\0', space)
+            mode = to_text(data[idx:space])
+            name = to_text(data[space + 1:nul])
+            entries[name] = (mode, data[nul + 1:nul + 21].hex())
+            idx = nul + 21
+        return entries
+
+    def get_tree(self, rev):
+        obj = self.read(rev)
+        if obj is None:
+            return {}
+        if obj[1] == 'commit':
+            obj = self.read('%s^{tree}' % obj[0])
+        return self.parse_tree(obj[2]) if obj and obj[1] == 'tree' else {}
+
+    def list_files(self, rev, prefix=''):
+        '''Every path below the tree of rev, like git ls-tree -r --name-only'''
+        files = []
+        for name, (mode, sha) in sorted(self.get_tree(rev).items()):
+            path = prefix + name
+            if mode == '40000':
+                files.extend(self.list_files(sha, path + '/'))
+            else:
+                files.append(path)
+        return files
+
+    def diff_trees(self, old, new, prefix=''):
+        '''The paths that differ between two trees, either may be None'''
+        old_entries = self.get_tree(old) if old else {}
+        new_entries = self.get_tree(new) if new else {}
+        paths = []
+        for name in sorted(set(old_entries) | set(new_entries)):
+            a = old_entries.get(name)
+            b = new_entries.get(name)
+            if a == b:
+                continue
+            path = prefix + name
+            a_tree = a[1] if a and a[0] == '40000' else None
+            b_tree = b[1] if b and b[0] == '40000' else None
+            if a_tree or b_tree:
+                paths.extend(self.diff_trees(a_tree, b_tree, path + '/'))
+            if (a and not a_tree) or (b and not b_tree):
+                paths.append(path)
+        return sorted(paths)
+
+    def get_commit_files(self, commit):
+        '''The paths a commit changed, like git show --name-only
+
+        For a merge, the paths that differ from every parent.
+        '''
+        obj = self.read(commit)
+        if obj is None or obj[1] != 'commit':
+            return []
+        tree = None
+        parents = []
+        for line in to_text(obj[2]).split('\n'):
+            if not line:
+                break
+            if line.startswith('tree '):
+                tree = line.split()[1]
+            elif line.startswith('parent '):
+                parents.append(line.split()[1])
+
+        if not parents:
+            return self.list_files(tree)
+
+        changed = None
+        for parent in parents:
+            paths = set(self.diff_trees('%s^{tree}' % parent, tree))
+            changed = paths if changed is None else changed & paths
+        return sorted(changed)
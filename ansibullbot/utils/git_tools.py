@@ -1,25 +1,79 @@
+import bisect
+import hashlib
 import logging
 import os
 import shutil
+import subprocess
 import tarfile
 import tempfile
 
 import requests
 
 from ansibullbot._text_compat import to_text
+from ansibullbot.utils.commit_index import CommitIndex
+from ansibullbot.utils.git_objects import GitObjectReader
 from ansibullbot.utils.systemtools import run_command
 
 
+class FileIndex:
+
+    '''The paths of a checkout, indexed for the lookups of the matchers
+
+    Membership is a set lookup, prefixes are a range of the sorted paths
+    and suffixes a range of the sorted reversed paths. Iterating goes
+    through the paths in sorted order.
+    '''
+
+    def __init__(self, paths):
+        self.paths = sorted(set(paths))
+        self.pathset = frozenset(self.paths)
+        self.reversed = sorted(x[::-1] for x in self.paths)
+
+    def __contains__(self, path):
+        return path in self.pathset
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    @staticmethod
+    def _range(paths, prefix):
+        start = bisect.bisect_left(paths, prefix)
+        # every string with the prefix sorts before prefix + the last code point
+        end = bisect.bisect_left(paths, prefix + '\U0010ffff', lo=start)
+        return paths[start:end]
+
+    def with_prefix(self, prefix):
+        return self._range(self.paths, prefix)
+
+    def with_suffix(self, *suffixes):
+        matches = set()
+        for suffix in suffixes:
+            matches.update(x[::-1] for x in self._range(self.reversed, suffix[::-1]))
+        return sorted(matches)
+
+
 class GitRepoWrapper:
     def __init__(self, cachedir, repo, commit=None, rebase=True, context=None):
         self._needs_rebase = rebase
         self.repo = repo
         self.commit = commit
         self.context = context
-        self._lrev_map = {}
+        # every path that ever existed -> the last commit that touched it
+        self._history = None
+        # old path -> (new path, commit) of the last rename of a path
+        self._renames = {}
+        # the refs the history was read up to
+        self._history_tips = None
         self._is_git = True
         self.checkoutdir = None
+        self._reader = None
+        self._git_dir = None
         self._files = []
+        self._index = None
+        self._context_index = None
 
         # allow for null repos
         if self.repo:
@@ -31,7 +85,7 @@ class GitRepoWrapper:
             if not os.path.exists(parent):
                 os.makedirs(parent)
 
-        self.commits_by_email = None
+        self._commit_index = None
         self.files_by_commit = {}
 
         if repo:
@@ -40,14 +94,58 @@ class GitRepoWrapper:
     def exists(self, filename):
         return filename in self.files
 
+    @property
+    def reader(self):
+        """The GitObjectReader of the checkout"""
+        if self._reader is None:
+            self._reader = GitObjectReader(self.checkoutdir)
+        return self._reader
+
+    def close_reader(self):
+        # the checkout changed under the reader
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    @property
+    def git_dir(self):
+        """The git directory of the checkout, .git is a file in worktrees and submodules"""
+        if self._git_dir is None:
+            cmd = "cd %s ; git rev-parse --absolute-git-dir" % self.checkoutdir
+            logging.debug(cmd)
+            (rc, so, se) = run_command(cmd, env={'GIT_TERMINAL_PROMPT': 0, 'GIT_ASKPASS': '/bin/echo'})
+            if rc != 0:
+                return None
+            self._git_dir = to_text(so).strip()
+        return self._git_dir
+
     @property
     def branch(self):
         """Retrieves the branch of a checkout"""
-        cmd = "cd %s ; git rev-parse --abbrev-ref HEAD" % self.checkoutdir
+        if self.git_dir is None:
+            return ''
+        try:
+            with open(os.path.join(self.git_dir, 'HEAD')) as f:
+                ref = f.read().strip()
+        except OSError:
+            return ''
+        # a detached HEAD is just a sha
+        if not ref.startswith('ref: '):
+            return 'HEAD'
+        return ref[5:].replace('refs/heads/', '', 1)
+
+    @property
+    def head(self):
+        """The sha of the checked out commit"""
+        return self.reader.rev_parse('HEAD')
+
+    @property
+    def refs_sha(self):
+        """A sha over every branch and tag of the checkout"""
+        cmd = "cd %s ; git show-ref --head" % self.checkoutdir
         logging.debug(cmd)
         (rc, so, se) = run_command(cmd, env={'GIT_TERMINAL_PROMPT': 0, 'GIT_ASKPASS': '/bin/echo'})
-        so = to_text(so).strip()
-        return so
+        return hashlib.sha1(so).hexdigest() if rc == 0 else None
 
     @property
     def isgit(self):
@@ -61,21 +159,32 @@ class GitRepoWrapper:
         return os.path.isdir(checkfile)
 
     @property
-    def files(self):
+    def file_index(self):
+        '''A FileIndex of every file in the checkout'''
         self.get_files()
-        if self.context:
-            _files = self._files[:]
-            _files = [x for x in _files if x.startswith(self.context)]
-            _files = [x.replace(self.context.rstrip('/') + '/', '') for x in _files]
-            return _files
-        return self._files
+        if self._index is None:
+            self._index = FileIndex(self._files)
+        return self._index
+
+    @property
+    def files(self):
+        '''A FileIndex of the files, relative to the context if there is one'''
+        if not self.context:
+            return self.file_index
+        if self._context_index is None:
+            prefix = self.context.rstrip('/') + '/'
+            self._context_index = FileIndex(
+                x[len(prefix):] for x in self.file_index.with_prefix(prefix)
+            )
+        return self._context_index
 
     @property
     def module_files(self):
-        return [x for x in self._files if x.startswith('plugins/modules')]
+        return self.file_index.with_prefix('plugins/modules')
 
     def create_checkout(self):
         """checkout ansible"""
+        self.close_reader()
         # cleanup
         if os.path.isdir(self.checkoutdir):
             shutil.rmtree(self.checkoutdir)
@@ -104,12 +213,69 @@ class GitRepoWrapper:
                 os.makedirs(self.checkoutdir)
 
     def update(self, force=False):
-        '''Reload everything if there are new commits'''
+        '''Reload everything if there are new commits
+
+        When the checkout only moved ahead, the file list is updated from
+        the diff between the old and the new HEAD instead of walking the
+        checkout again.
+        '''
+        old_head = self.head if self._is_git and self._files and os.path.isdir(self.checkoutdir) else None
         changed = self.manage_checkout()
+        if changed:
+            self.close_reader()
         if changed or force or not self._is_git:
-            self.get_files(force=True)
-        self.commits_by_email = None
-        self._lrev_map = {}
+            changes = None
+            if old_head and not force:
+                changes = self.get_changes(old_head, self.head)
+            if changes is None:
+                self.get_files(force=True)
+            else:
+                self.apply_changes(changes)
+        if self._history is not None:
+            self.update_history()
+
+    def get_changes(self, old, new):
+        '''[(status, path)] of the files that differ between two commits
+
+        A rename is a deletion of the old and an addition of the new path.
+        None if git could not tell.
+        '''
+        if not old or not new:
+            return None
+        if old == new:
+            return []
+        cmd = "cd %s ; git diff --name-status --no-renames %s %s" % (self.checkoutdir, old, new)
+        logging.debug(cmd)
+        (rc, so, se) = run_command(cmd)
+        if rc != 0:
+            logging.warning('could not diff %s..%s: %s' % (old, new, to_text(se)))
+            return None
+        changes = []
+        for line in to_text(so).splitlines():
+            if not line.strip():
+                continue
+            status, path = line.split('\t', 1)
+            changes.append((status[0], path))
+        return changes
+
+    def get_changed_files(self, old, new):
+        '''The set of paths that differ between two commits, None if unknown'''
+        changes = self.get_changes(old, new)
+        if changes is None:
+            return None
+        return {x[1] for x in changes}
+
+    def apply_changes(self, changes):
+        files = set(self._files)
+        for status, path in changes:
+            if status == 'D':
+                files.discard(path)
+            else:
+                files.add(path)
+        logging.info('applied %s changed files to the file list' % len(changes))
+        self._files = sorted(files)
+        self._index = None
+        self._context_index = None
 
     def update_checkout(self):
         """rebase + pull + update the checkout"""
@@ -148,8 +314,6 @@ class GitRepoWrapper:
                 if 'current branch devel is up to date.' not in so.lower():
                     changed = True
 
-        self.commits_by_email = None
-
         return changed
 
     def manage_checkout(self):
@@ -167,6 +331,9 @@ class GitRepoWrapper:
     def get_files(self, force=False):
         '''Cache a list of filenames in the checkout'''
         if not self._files or force:
+            self._files = []
+            self._index = None
+            self._context_index = None
             for root, directories, filenames in os.walk(self.checkoutdir):
                 for filename in filenames:
                     naive_fpath = os.path.realpath(os.path.join(root, filename))
@@ -175,72 +342,130 @@ class GitRepoWrapper:
 
     def get_files_by_commit(self, commit):
         if commit not in self.files_by_commit:
-            cmd = f'cd {self.checkoutdir}; git show --pretty="" --name-only {commit}'
-            (rc, so, se) = run_command(cmd)
-            filenames = [x.strip() for x in to_text(so).split('\n') if x.strip()]
+            filenames = self.reader.get_commit_files(commit)
             self.files_by_commit[commit] = filenames[:]
         else:
             filenames = self.files_by_commit[commit]
 
         return filenames
 
+    def get_commit_index(self):
+        '''The CommitIndex of the checkout, up to its HEAD'''
+        head = self.head if self._is_git and self.checkoutdir else None
+        if self._commit_index is None:
+            self._commit_index = (CommitIndex.load(self.checkoutdir) if head else None) or CommitIndex()
+        if head and self._commit_index.head != head:
+            try:
+                self._commit_index.update(self.checkoutdir, head)
+            except OSError as e:
+                logging.warning(e)
+                self._commit_index = CommitIndex()
+                return self._commit_index
+            self._commit_index.save(self.checkoutdir)
+        return self._commit_index
+
     def get_commits_by_email(self, email):
         '''Map an email(s) to a total num of commits and total by file'''
-        if self.commits_by_email is None:
-            commits = {}
-            cmd = f'cd {self.checkoutdir}; git log --format="%h;%ae"'
-            (rc, so, se) = run_command(cmd)
-            lines = [x.strip() for x in to_text(so).split('\n') if x.strip()]
-            for line in lines:
-                parts = line.split(';')
-                this_hash = parts[0]
-                this_email = parts[1]
-                if this_email not in commits:
-                    commits[this_email] = set()
-                commits[this_email].add(this_hash)
-            self.commits_by_email = commits
-
         if not isinstance(email, (set, list)):
             emails = [email]
         else:
             emails = [x for x in email]
 
-        email_map = {}
-
-        for _email in emails:
-            if _email not in email_map:
-                email_map[_email] = {
-                    'commit_count': 0,
-                    'commit_count_byfile': {}
-                }
-
-            if _email in self.commits_by_email:
-
-                email_map[_email]['commit_count'] = \
-                    len(self.commits_by_email[_email])
-
-                for _commit in self.commits_by_email[_email]:
-                    filenames = self.get_files_by_commit(_commit)
-                    for fn in filenames:
-                        if fn not in email_map[_email]['commit_count_byfile']:
-                            email_map[_email]['commit_count_byfile'][fn] = 0
-                        email_map[_email]['commit_count_byfile'][fn] += 1
-
-        return email_map
+        index = self.get_commit_index()
+        return {x: index.get(x) for x in emails}
+
+    def _read_history(self, exclude=()):
+        '''Read the paths touched by every commit of every ref
+
+        The log lists the newest commits first, so the first commit seen
+        for a path is the last one that touched it. Commits reachable from
+        exclude are skipped.
+        '''
+        cmd = [
+            'git', '-c', 'core.quotePath=false', 'log', '--all', '--stdin', '-M', '--name-status',
+            '--format=%x00%H',
+        ]
+        p = subprocess.Popen(cmd, cwd=self.checkoutdir, stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (so, se) = p.communicate(''.join('^%s\n' % x for x in exclude).encode('ascii'))
+        if p.returncode != 0:
+            logging.warning('could not read the history: %s' % to_text(se))
+            return None, None
+
+        history = {}
+        renames = {}
+        commit = None
+        for line in to_text(so).split('\n'):
+            if line.startswith('\0'):
+                commit = line[1:].strip()
+                continue
+            if not line.strip():
+                continue
+            parts = line.split('\t')
+            for path in parts[1:]:
+                if path not in history:
+                    history[path] = commit
+            if parts[0].startswith('R') and len(parts) == 3 and parts[1] not in renames:
+                renames[parts[1]] = (parts[2], commit)
+        return history, renames
+
+    def get_tips(self):
+        cmd = "cd %s ; git rev-parse --all" % self.checkoutdir
+        (rc, so, se) = run_command(cmd)
+        return sorted(set(to_text(so).split())) if rc == 0 else None
+
+    def get_history(self):
+        '''The map of every path that ever existed to its last commit'''
+        if self._history is None and self._is_git and self.checkoutdir:
+            logging.info('indexing the history of %s' % self.checkoutdir)
+            tips = self.get_tips()
+            history, renames = self._read_history()
+            if history is not None:
+                self._history = history
+                self._renames = renames
+                self._history_tips = tips
+        return self._history
+
+    def update_history(self):
+        '''Add the commits since the history was read'''
+        tips = self.get_tips()
+        if tips is None or tips == self._history_tips:
+            return
+        history, renames = self._read_history(exclude=self._history_tips or ())
+        if history is None:
+            self._history = None
+            return
+        self._history.update(history)
+        self._renames.update(renames)
+        self._history_tips = tips
+        logging.info('added %s paths to the history index' % len(history))
+
+    def get_rename_chain(self, filepath):
+        '''The names a path was renamed to, oldest first'''
+        self.get_history()
+        chain = []
+        seen = {filepath}
+        while filepath in self._renames:
+            filepath = self._renames[filepath][0]
+            if filepath in seen:
+                break
+            seen.add(filepath)
+            chain.append(filepath)
+        return chain
 
     def get_last_rev_for_file(self, filepath):
         ''' Retrive last hash for a file if it ever existed '''
         # https://stackoverflow.com/a/19727752
         # https://stackoverflow.com/a/1395463
 
-        if filepath not in self._lrev_map:
-            cmd = 'cd %s; git rev-list --max-count=1 --all -- %s' % (self.checkoutdir, filepath)
-            logging.info(cmd)
-            (rc, so, se) = run_command(cmd)
-            lrev = so.strip().decode('utf-8')
-            self._lrev_map[filepath] = lrev
+        history = self.get_history()
+        if history is not None:
+            return history.get(filepath, '')
 
-        return self._lrev_map[filepath]
+        cmd = 'cd %s; git rev-list --max-count=1 --all -- %s' % (self.checkoutdir, filepath)
+        logging.info(cmd)
+        (rc, so, se) = run_command(cmd)
+        return so.strip().decode('utf-8')
 
     def existed(self, filepath):
         '''Did a file ever exist in this repo?'''
@@ -264,38 +489,28 @@ class GitRepoWrapper:
             return None
 
         lrev = self.get_last_rev_for_file(filepath)
+        if not lrev:
+            return b''
 
         # https://stackoverflow.com/a/1395463
-        cmd = 'cd %s; git show %s^:%s' % (self.checkoutdir, lrev, filepath)
-        (rc, so, se) = run_command(cmd)
-        logging.info(cmd)
-        so = so.strip()
+        so = (self.reader.get_blob('%s^' % lrev, filepath) or b'').strip()
+        # a symlink, its content is the path it points to
         if so.decode('utf-8').endswith('.py'):
             newpath = os.path.dirname(filepath)
             newpath = os.path.join(newpath, so.decode('utf-8'))
-            lrev = self.get_last_rev_for_file(filepath)
-
-            cmd = 'cd %s; git show %s^:%s' % (self.checkoutdir, lrev, newpath)
-            logging.info(cmd)
-            (rc, so, se) = run_command(cmd)
-            so = so.strip()
+            so = (self.reader.get_blob('%s^' % lrev, newpath) or b'').strip()
 
         return so
 
     def find(self, pattern):
-        if pattern in self._files:
+        if pattern in self.file_index:
             return pattern
         matches = set()
-        for fn in self._files:
+        for fn in self.file_index.with_suffix(pattern):
             if self.context and self.context not in fn:
                 continue
-            if fn.endswith(pattern):
-                matches.add(fn)
+            matches.add(fn)
         return matches
 
     def list_files_by_branch(self, branch):
-        cmd = "cd %s; git ls-tree -r --name-only %s" % (self.checkoutdir, branch)
-        logging.info(cmd)
-        (rc, so, se) = run_command(cmd)
-        res = so.strip().decode('utf-8')
-        return res.splitlines()
+        return self.reader.list_files(branch)
@@ -0,0 +1,262 @@
+'''A conditional request cache for the github api
+
+Every GET that goes through a session from new_session() is stored with
+its ETag/Last-Modified validators. The next GET for the same url, accept
+header and token sends If-None-Match/If-Modified-Since and a 304, which
+costs no ratelimit, is answered with the stored body. A GET that already
+carries its own validators gets the 304 as it is. Commits by sha never
+change, so those are answered from the cache without asking github.
+
+https://docs.github.com/en/rest/overview/resources-in-the-rest-api#conditional-requests
+'''
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from ansibullbot.utils.ratelimits import RATELIMITS
+
+
+# responses that can be used without revalidating them
+IMMUTABLE_URLS = re.compile(r'/commits/[0-9a-f]{40}$')
+
+# the response headers that are stored with the body
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Link')
+
+STATS_LOCK = threading.Lock()
+STATS = {
+    'hits': 0,
+    'not_modified': 0,
+    'misses': 0,
+    'uncached': 0,
+}
+
+STORE = None
+
+
+class HttpCacheStore:
+
+    '''Validators and compressed bodies of GET responses in one sqlite file'''
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            url TEXT,
+            headers TEXT,
+            body BLOB,
+            stored_at REAL
+        )
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+        dirname = os.path.dirname(self.path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+
+        with self.connection as conn:
+            conn.execute(self.SCHEMA)
+
+    @property
+    def connection(self):
+        # sqlite connections must not cross threads or forks
+        if getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=60)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def get(self, key):
+        row = self.connection.execute(
+            'SELECT url, headers, body FROM responses WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'url': row[0],
+            'headers': json.loads(row[1]),
+            'body': zlib.decompress(row[2]),
+        }
+
+    def set(self, key, url, headers, body):
+        with self.connection as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                (key, url, json.dumps(headers), zlib.compress(body), time.time())
+            )
+
+    def delete(self, key):
+        with self.connection as conn:
+            conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+
+    def touch(self, key):
+        '''Mark an entry as used, stored_at is the last use for eviction'''
+        with self.connection as conn:
+            conn.execute('UPDATE responses SET stored_at = ? WHERE key = ?', (time.time(), key))
+
+    def evict(self, max_bytes=None, max_age=None):
+        '''Drop entries unused for max_age seconds, then the least recently
+        used ones until the bodies fit into max_bytes
+
+        Returns the number of entries and bytes dropped.
+        '''
+        count = 0
+        freed = 0
+        with self.connection as conn:
+            if max_age is not None:
+                cutoff = time.time() - max_age
+                freed += conn.execute(
+                    'SELECT COALESCE(SUM(LENGTH(body)), 0) FROM responses WHERE stored_at < ?', (cutoff,)
+                ).fetchone()[0]
+                count += conn.execute('DELETE FROM responses WHERE stored_at < ?', (cutoff,)).rowcount
+
+            if max_bytes is not None:
+                total = conn.execute('SELECT COALESCE(SUM(LENGTH(body)), 0) FROM responses').fetchone()[0]
+                if total > max_bytes:
+                    doomed = []
+                    rows = conn.execute('SELECT key, LENGTH(body) FROM responses ORDER BY stored_at')
+                    for key, size in rows:
+                        if total <= max_bytes:
+                            break
+                        doomed.append((key,))
+                        total -= size
+                        freed += size
+                    conn.executemany('DELETE FROM responses WHERE key = ?', doomed)
+                    count += len(doomed)
+        return count, freed
+
+
+class CachingAdapter(HTTPAdapter):
+
+    '''A transport adapter that sends conditional GETs through the cache'''
+
+    def send(self, request, **kwargs):
+        store = STORE
+        if store is None or request.method != 'GET' or kwargs.get('stream'):
+            count('uncached')
+            RATELIMITS.route(request)
+            return super().send(request, **kwargs)
+
+        key = self.get_key(request)
+        entry = store.get(key)
+
+        if entry is not None and IMMUTABLE_URLS.search(request.url.split('?')[0]):
+            count('hits')
+            store.touch(key)
+            return self.build_cached_response(request, entry)
+
+        # the key is taken first so every token of the pool shares the entry
+        RATELIMITS.route(request)
+
+        # a caller that sends its own validators, like pygithub's update(),
+        # wants to see the 304 itself
+        conditional = 'If-None-Match' in request.headers or 'If-Modified-Since' in request.headers
+
+        if entry is not None and not conditional:
+            if entry['headers'].get('ETag'):
+                request.headers['If-None-Match'] = entry['headers']['ETag']
+            if entry['headers'].get('Last-Modified'):
+                request.headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+
+        resp = super().send(request, **kwargs)
+
+        if resp.status_code == 304 and conditional:
+            count('not_modified')
+            if entry is not None:
+                store.touch(key)
+            return resp
+
+        if resp.status_code == 304 and entry is not None:
+            count('not_modified')
+            store.touch(key)
+            # keep the live headers, they carry the current ratelimit
+            resp.status_code = 200
+            resp.reason = 'OK'
+            resp.headers.update(entry['headers'])
+            resp._content = entry['body']
+            resp._content_consumed = True
+            return resp
+
+        count('misses')
+        if resp.status_code == 200 and (resp.headers.get('ETag') or resp.headers.get('Last-Modified')):
+            headers = {x: resp.headers[x] for x in STORED_HEADERS if x in resp.headers}
+            store.set(key, request.url, headers, resp.content)
+        elif entry is not None:
+            store.delete(key)
+
+        return resp
+
+    @staticmethod
+    def get_key(request):
+        # responses differ by media type and by who is asking
+        parts = [request.url, request.headers.get('Accept', ''), request.headers.get('Authorization', '')]
+        return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    def build_cached_response(self, request, entry):
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.reason = 'OK'
+        resp.url = request.url
+        resp.request = request
+        resp.connection = self
+        resp.encoding = 'utf-8'
+        resp.headers = CaseInsensitiveDict(entry['headers'])
+        resp._content = entry['body']
+        resp._content_consumed = True
+        return resp
+
+
+def configure(cachedir):
+    '''Store the responses of every caching session under cachedir'''
+    global STORE
+    path = os.path.join(os.path.expanduser(cachedir), 'http_cache.sqlite')
+    if STORE is None or STORE.path != path:
+        STORE = HttpCacheStore(path)
+    return STORE
+
+
+def new_session():
+    session = requests.Session()
+    mount(session)
+    return session
+
+
+def mount(session):
+    '''Send the requests of an existing session through the cache'''
+    for prefix in ('https://', 'http://'):
+        # keep the retry settings the session was created with
+        retries = session.get_adapter(prefix).max_retries
+        session.mount(prefix, CachingAdapter(max_retries=retries))
+    # every response also updates the tracked ratelimit
+    session.hooks['response'].append(RATELIMITS.update_from_response)
+
+
+def count(name):
+    with STATS_LOCK:
+        STATS[name] += 1
+
+
+def get_stats():
+    with STATS_LOCK:
+        return STATS.copy()
+
+
+def log_stats():
+    stats = get_stats()
+    logging.info(
+        'http cache: %s hits, %s not modified, %s misses, %s uncached' %
+        (stats['hits'], stats['not_modified'], stats['misses'], stats['uncached'])
+    )
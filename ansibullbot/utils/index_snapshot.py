@@ -0,0 +1,120 @@
+'''Snapshots of the indexers built from the ansible checkout
+
+Building the version, module and component indexes walks the checkout,
+runs git log for every module and parses their docs, which takes minutes.
+What they find only depends on the checkout, BOTMETA and the bot code, so
+their state is stored with those and loaded again while they match. When
+only the checkout moved, the module indexer and the component matcher
+start from the snapshot and read just the files that changed in between.
+
+Snapshots are plain data written with cache_store.dump_file. The bytes,
+dates, tuples, sets and non string keys of the indexer state are tagged,
+see to_plain(). A snapshot of another SCHEMA_VERSION is a miss and the
+indexes are built again.
+
+The workers are forked after the indexers are built and share them.
+'''
+
+import base64
+import datetime
+import hashlib
+import logging
+import os
+
+from ansibullbot._text_compat import to_bytes
+from ansibullbot.utils.cache_store import dump_file, load_file
+from ansibullbot.utils.fingerprint import get_code_version
+
+
+SNAPSHOT_DIR = 'index_snapshots'
+
+SCHEMA_VERSION = 1
+
+TAGS = ('__bytes__', '__date__', '__tuple__', '__set__', '__items__')
+
+
+def get_base_key(botmeta_sha, options=None):
+    '''The part of the key that is not about the checkout'''
+    parts = [botmeta_sha, get_code_version(), repr(sorted((options or {}).items()))]
+    return hashlib.sha256(to_bytes('\n'.join(str(x) for x in parts))).hexdigest()
+
+
+def get_snapshot_path(cachedir, repopath):
+    return os.path.join(os.path.expanduser(cachedir), SNAPSHOT_DIR, repopath.replace('/', '__') + '.cache')
+
+
+def to_plain(data):
+    '''The indexer state as data json can hold, from_plain() reverses it'''
+    if isinstance(data, bytes):
+        return {'__bytes__': base64.b64encode(data).decode('ascii')}
+    # datetimes are left to cache_store.encode
+    if isinstance(data, datetime.date) and not isinstance(data, datetime.datetime):
+        return {'__date__': data.isoformat()}
+    if isinstance(data, tuple):
+        return {'__tuple__': [to_plain(x) for x in data]}
+    if isinstance(data, (set, frozenset)):
+        return {'__set__': [to_plain(x) for x in data]}
+    if isinstance(data, list):
+        return [to_plain(x) for x in data]
+    if isinstance(data, dict):
+        if all(isinstance(x, str) for x in data) and not (len(data) == 1 and set(data) & set(TAGS)):
+            return {k: to_plain(v) for k, v in data.items()}
+        return {'__items__': [[to_plain(k), to_plain(v)] for k, v in data.items()]}
+    return data
+
+
+def from_plain(data):
+    if isinstance(data, list):
+        return [from_plain(x) for x in data]
+    if not isinstance(data, dict):
+        return data
+    if len(data) == 1:
+        tag, value = next(iter(data.items()))
+        if tag == '__bytes__':
+            return base64.b64decode(value)
+        if tag == '__date__':
+            return datetime.date.fromisoformat(value)
+        if tag == '__tuple__':
+            return tuple(from_plain(x) for x in value)
+        if tag == '__set__':
+            return {from_plain(x) for x in value}
+        if tag == '__items__':
+            return {from_plain(k): from_plain(v) for k, v in value}
+    return {k: from_plain(v) for k, v in data.items()}
+
+
+def load_snapshot(cachedir, repopath, base_key):
+    '''The stored snapshot if it was taken with the same base_key
+
+    A snapshot is a dict of the base_key, the head and refs_sha of the
+    checkout and the state of each indexer.
+    '''
+    path = get_snapshot_path(cachedir, repopath)
+    data = load_file(path)
+    if data is None:
+        return None
+    if data.get('version') != SCHEMA_VERSION:
+        logging.info('index snapshot %s has schema version %s, rebuilding' % (path, data.get('version')))
+        return None
+    snapshot = from_plain(data['snapshot'])
+    if snapshot.get('base_key') != base_key:
+        logging.info('index snapshot %s is for another botmeta or bot version' % path)
+        return None
+    logging.info('loaded index snapshot %s of %s' % (path, snapshot['head']))
+    return snapshot
+
+
+def save_snapshot(cachedir, repopath, snapshot):
+    path = get_snapshot_path(cachedir, repopath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # readers never see a partial file
+    tmp = '%s.%s' % (path, os.getpid())
+    try:
+        dump_file(tmp, {'version': SCHEMA_VERSION, 'snapshot': to_plain(snapshot)})
+    except TypeError as e:
+        # the indexes are built again next time
+        logging.warning('not saving index snapshot %s: %s' % (path, e))
+        os.remove(tmp)
+        return
+    os.replace(tmp, path)
+    logging.info('saved index snapshot %s' % path)
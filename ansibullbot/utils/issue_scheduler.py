@@ -0,0 +1,65 @@
+import logging
+
+from ansibullbot.utils.ratelimits import RATELIMITS
+
+
+# estimated api calls to triage an item, see DefaultTriager.estimate_issue_cost
+CACHED_COST = 1
+ISSUE_COST = 8
+PULLREQUEST_COST = 25
+
+
+class QuotaScheduler:
+
+    '''Order the remaining issues by their api cost once the quota runs low
+
+    While more than reserve calls are left the order is untouched. Below
+    that the items that fit into what is left go first, cheapest first,
+    and the rest are parked at the end of the queue. By the time a parked
+    item comes up either the window has reset, or there is nothing else
+    left that could be done while waiting for it.
+    '''
+
+    def __init__(self, cost, reserve=500, ratelimits=RATELIMITS):
+        # cost(number) -> estimated api calls
+        self.cost = cost
+        self.reserve = reserve
+        self.ratelimits = ratelimits
+        self.costs = {}
+        self.parked = set()
+
+    def get_cost(self, number):
+        if number not in self.costs:
+            self.costs[number] = self.cost(number)
+        return self.costs[number]
+
+    def reorder(self, numbers):
+        if not self.reserve or not self.ratelimits.known():
+            return numbers
+
+        budget = self.ratelimits.remaining('core')
+        if budget > self.reserve:
+            if self.parked:
+                logging.info('quota restored, %s parked issues are back in order' % len(self.parked))
+                self.parked = set()
+            return numbers
+
+        ready = []
+        parked = set()
+        # sorted is stable, equal costs keep the original order
+        for number in sorted(numbers, key=self.get_cost):
+            cost = self.get_cost(number)
+            if cost <= budget:
+                ready.append(number)
+                budget -= cost
+            else:
+                parked.add(number)
+
+        if parked != self.parked:
+            logging.info(
+                '%s calls left, parking %s expensive issues until the reset' %
+                (self.ratelimits.remaining('core'), len(parked))
+            )
+        self.parked = parked
+
+        return ready + [x for x in numbers if x in parked]
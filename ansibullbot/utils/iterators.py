@@ -1,24 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
 class RepoIssuesIterator:
 
-    def __init__(self, repo, numbers, issuecache=None):
+    def __init__(self, repo, numbers, issuecache=None, prefetch=0, prefetcher=None, batcher=None, batch_size=50, scheduler=None):
         self.repo = repo
-        self.numbers = numbers
+        self.numbers = list(numbers)
         self.issuecache = {} if issuecache is None else issuecache
         self.i = 0
 
+        # prefetcher(number, issue) -> (issue, data) is called from worker
+        # threads for the next N numbers while the current one is processed
+        self.prefetcher = prefetcher
+        self.prefetch = prefetch if prefetcher is not None else 0
+        self.prefetched = {}
+        self._futures = {}
+        self._executor = None
+
+        # batcher(numbers) -> {number: issue} hydrates the next batch_size
+        # numbers in one go instead of one get_issue call per number
+        self.batcher = batcher
+        self.batch_size = batch_size
+
+        # scheduler.reorder(numbers) -> numbers puts the remaining numbers
+        # in the order the api quota allows, see QuotaScheduler
+        self.scheduler = scheduler
+
+        # the first number of the original order that was not handed out
+        # before the current one, restarting there skips nothing even when
+        # the scheduler moved the current one ahead of parked numbers
+        self.order = list(numbers)
+        self.resume_number = None
+        self._handed_out = set()
+        self._resume_idx = 0
+
     def __iter__(self):
         return self
 
     def __next__(self):
 
         if self.i > (len(self.numbers) - 1):
+            self.shutdown()
             raise StopIteration()
 
+        if self.scheduler is not None:
+            self.numbers[self.i:] = self.scheduler.reorder(self.numbers[self.i:])
+
+        if self.batcher is not None:
+            self._fill_batch()
+
+        if self.prefetch > 0:
+            self._fill_window()
+
         thisnum = self.numbers[self.i]
         self.i += 1
-        if thisnum in self.issuecache:
+
+        while self.order[self._resume_idx] in self._handed_out:
+            self._resume_idx += 1
+        self.resume_number = self.order[self._resume_idx]
+        self._handed_out.add(thisnum)
+
+        if thisnum in self._futures:
+            issue, data = self._futures.pop(thisnum).result()
+            if data is not None:
+                self.prefetched[thisnum] = data
+        elif thisnum in self.issuecache:
             issue = self.issuecache[thisnum]
         else:
             issue = self.repo.get_issue(thisnum)
 
         return issue
+
+    def _fill_batch(self):
+        '''Hydrate the upcoming numbers once the next one is not cached'''
+        if self.numbers[self.i] in self.issuecache:
+            return
+
+        numbers = [
+            x for x in self.numbers[self.i:self.i + self.batch_size]
+            if x not in self.issuecache
+        ]
+        self.issuecache.update(self.batcher(numbers))
+
+    def _fill_window(self):
+        '''Keep the next N numbers queued on the thread pool'''
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.prefetch)
+
+        for number in self.numbers[self.i:self.i + self.prefetch]:
+            if number in self._futures:
+                continue
+            self._futures[number] = self._executor.submit(
+                self.prefetcher,
+                number,
+                self.issuecache.get(number)
+            )
+
+    def shutdown(self):
+        if self._executor is not None:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures = {}
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -59,7 +59,7 @@ class ModuleIndexer:
         'imports': []
     }
 
-    def __init__(self, commits=True, blames=True, botmeta=None, gh_client=None, cachedir='~/.ansibullbot/cache', gitrepo=None):
+    def __init__(self, commits=True, blames=True, botmeta=None, gh_client=None, cachedir='~/.ansibullbot/cache', gitrepo=None, state=None):
         self.get_commits = commits
         self.get_blames = blames
         botmeta = botmeta if botmeta else {}
@@ -87,13 +87,46 @@ class ModuleIndexer:
         self.commits = {}
         # map of email to github login
         self.emails_cache = {}
+        # modules whose file did not change since the last update
+        self._unchanged = {}
 
-        self.update(botmeta)
+        # the get_state() of an indexer for the same checkout and botmeta
+        if state is not None:
+            self.botmeta = botmeta
+            self.modules = state['modules']
+            self.committers = state['committers']
+            self.commits = state['commits']
+            self.emails_cache = state['emails_cache']
+        else:
+            self.update(botmeta)
+
+    def get_state(self):
+        return {
+            'modules': self.modules,
+            'committers': self.committers,
+            'commits': self.commits,
+            'emails_cache': self.emails_cache,
+        }
 
-    def update(self, botmeta=None):
+    def update(self, botmeta=None, changed_files=None):
+        '''Index the modules again
+
+        Given the paths that changed since the last update, only those
+        modules are read again, the others keep their imports, commits
+        and authors.
+        '''
         if botmeta is not None:
             self.botmeta = botmeta
+        if changed_files is None:
+            self._unchanged = {}
+        else:
+            self._unchanged = {
+                k: v for k, v in self.modules.items()
+                if v['filepath'] and v['filepath'] not in changed_files
+            }
+        self.modules = {}
         self.get_ansible_modules()
+        self._unchanged = {}
 
     def get_ansible_modules(self):
         """Make a list of known modules"""
@@ -213,9 +246,12 @@ class ModuleIndexer:
         self.modules['meta']['repo_filename'] = 'meta'
 
     def get_module_commits(self):
+        self.commits = {k: v for k, v in self.commits.items() if k in self.modules}
         keys = self.modules.keys()
         keys = sorted(keys)
         for k in keys:
+            if k in self._unchanged and k in self.commits:
+                continue
             self.commits[k] = []
             cpath = os.path.join(self.gitrepo.checkoutdir, k)
             if not os.path.isfile(cpath):
@@ -382,8 +418,11 @@ class ModuleIndexer:
         for k, v in self.modules.items():
             if v['filepath'] is None:
                 continue
-            mfile = os.path.join(self.gitrepo.checkoutdir, v['filepath'])
-            authors = ModuleExtractor(mfile, email_cache=self.emails_cache).get_module_authors()
+            if k in self._unchanged:
+                authors = self._unchanged[k]['authors']
+            else:
+                mfile = os.path.join(self.gitrepo.checkoutdir, v['filepath'])
+                authors = ModuleExtractor(mfile, email_cache=self.emails_cache).get_module_authors()
             self.modules[k]['authors'] = authors
 
             # authors are maintainers by -default-
@@ -475,6 +514,9 @@ class ModuleIndexer:
         for k, v in self.modules.items():
             if not v['filepath']:
                 continue
+            if k in self._unchanged:
+                self.modules[k]['imports'] = self._unchanged[k]['imports']
+                continue
             mfile = os.path.join(self.gitrepo.checkoutdir, v['filepath'])
             self.modules[k]['imports'] = self.get_module_imports(mfile)
 
@@ -0,0 +1,242 @@
+import logging
+import multiprocessing
+import time
+
+import ansibullbot.constants as C
+
+
+class RateLimitTracker:
+
+    '''The remaining github quota, kept up to date from response headers
+
+    Each resource is a token bucket, remaining is taken from the
+    X-RateLimit-* headers of every response and refills to the limit when
+    the window resets. The numbers live in shared memory, so threads and
+    forked workers all draw from the same buckets.
+
+    https://docs.github.com/en/rest/overview/resources-in-the-rest-api#rate-limiting
+    '''
+
+    RESOURCES = ('core', 'graphql', 'search')
+    FIELDS = ('limit', 'remaining', 'reset')
+
+    def __init__(self):
+        # limit, remaining and reset per resource, the number of requests
+        # sent with the token and the last persist time
+        self._values = multiprocessing.Array('d', len(self.RESOURCES) * len(self.FIELDS) + 2)
+
+    def _offset(self, resource):
+        return self.RESOURCES.index(resource) * len(self.FIELDS)
+
+    def _get(self, resource):
+        offset = self._offset(resource)
+        return list(self._values[offset:offset + len(self.FIELDS)])
+
+    def _set(self, resource, limit, remaining, reset):
+        offset = self._offset(resource)
+        self._values[offset:offset + len(self.FIELDS)] = [limit, remaining, reset]
+
+    def known(self, resource='core'):
+        return self._get(resource)[0] > 0
+
+    def update_from_headers(self, headers):
+        resource = headers.get('X-RateLimit-Resource', 'core')
+        if resource not in self.RESOURCES or 'X-RateLimit-Remaining' not in headers:
+            return
+        try:
+            limit = int(headers['X-RateLimit-Limit'])
+            remaining = int(headers['X-RateLimit-Remaining'])
+            reset = int(headers['X-RateLimit-Reset'])
+        except (KeyError, ValueError):
+            return
+        with self._values.get_lock():
+            self._set(resource, limit, remaining, reset)
+
+    def update_from_response(self, response, *args, **kwargs):
+        '''A requests response hook'''
+        self.update_from_headers(response.headers)
+
+    def update_from_json(self, rawjson):
+        '''Take the numbers from a /rate_limit response'''
+        with self._values.get_lock():
+            for resource in self.RESOURCES:
+                data = rawjson.get('resources', {}).get(resource)
+                if data:
+                    self._set(resource, data['limit'], data['remaining'], data['reset'] or 0)
+
+    def to_json(self):
+        '''The numbers in the format of a /rate_limit response'''
+        with self._values.get_lock():
+            resources = {}
+            for resource in self.RESOURCES:
+                limit, remaining, reset = self._get(resource)
+                if limit:
+                    resources[resource] = {'limit': int(limit), 'remaining': int(remaining), 'reset': int(reset)}
+        return {'resources': resources}
+
+    def remaining(self, resource='core'):
+        with self._values.get_lock():
+            limit, remaining, reset = self._get(resource)
+        if reset and reset <= time.time():
+            return int(limit)
+        return int(remaining)
+
+    def acquire(self, resource='core'):
+        '''Take one call from the bucket
+
+        Returns 0, or the seconds until the window resets if it is empty.
+        '''
+        with self._values.get_lock():
+            limit, remaining, reset = self._get(resource)
+            if not limit:
+                return 0
+
+            now = time.time()
+            if reset and reset <= now:
+                # a new window, the headers of the next response have the real reset
+                remaining = limit
+                reset = now + 60 * 60
+
+            if remaining < 1:
+                return int(reset - now) + 5
+
+            self._set(resource, limit, remaining - 1, reset)
+        return 0
+
+    def record(self):
+        '''Count a request sent with this token'''
+        with self._values.get_lock():
+            self._values[-2] += 1
+
+    @property
+    def used(self):
+        return int(self._values[-2])
+
+    def should_persist(self, interval, force=False):
+        '''Is it time to write the numbers to disk, only one process gets a yes'''
+        with self._values.get_lock():
+            now = time.time()
+            if not force and now - self._values[-1] < interval:
+                return False
+            self._values[-1] = now
+        logging.debug('persisting ratelimit %s' % self.to_json())
+        return True
+
+
+class TokenPool:
+
+    '''A RateLimitTracker per github token
+
+    Reads are sent with the token that has the most quota left for the
+    resource, so a call only has to wait when every token is exhausted.
+    Anything else, like commenting or labeling, keeps the token it was
+    made with so the bot always acts as the same user.
+    '''
+
+    def __init__(self, tokens=()):
+        self.primary = None
+        self.trackers = {}
+        for token in tokens:
+            self.add(token)
+
+    def add(self, token):
+        # trackers have to exist before workers fork to be shared
+        if token and token not in self.trackers:
+            self.trackers[token] = RateLimitTracker()
+            if self.primary is None:
+                self.primary = token
+        return self.trackers.get(token)
+
+    def known(self, resource='core'):
+        return all(x.known(resource) for x in self.trackers.values())
+
+    def unknown_tokens(self, resource='core'):
+        return [x for x, tracker in self.trackers.items() if not tracker.known(resource)]
+
+    def choose(self, resource='core'):
+        '''The token with the most quota left, the primary one on a tie'''
+        def headroom(token):
+            tracker = self.trackers[token]
+            # a token without numbers yet will get them from the response
+            if not tracker.known(resource):
+                return float('inf')
+            return tracker.remaining(resource)
+        return max(self.trackers, key=headroom, default=None)
+
+    def remaining(self, resource='core'):
+        return sum(x.remaining(resource) for x in self.trackers.values())
+
+    def acquire(self, resource='core'):
+        '''Take one call from the best token
+
+        Returns 0, or the seconds until the first token resets if every
+        token is empty.
+        '''
+        token = self.choose(resource)
+        if token is None:
+            return 0
+        stime = self.trackers[token].acquire(resource)
+        if stime:
+            stime = min(x.acquire(resource) for x in self.trackers.values())
+        return stime
+
+    def route(self, request):
+        '''Set the token of a read request to the one with the most headroom'''
+        auth = request.headers.get('Authorization')
+        if not auth or ' ' not in auth:
+            return
+        scheme, token = auth.split(' ', 1)
+        if token not in self.trackers:
+            return
+
+        resource = self.get_resource(request)
+        if resource is not None and len(self.trackers) > 1:
+            token = self.choose(resource)
+            request.headers['Authorization'] = '%s %s' % (scheme, token)
+        self.trackers[token].record()
+
+    @staticmethod
+    def get_resource(request):
+        path = request.path_url.split('?')[0]
+        if request.method == 'POST' and path.endswith('/graphql'):
+            return 'graphql'
+        if request.method != 'GET':
+            return None
+        if path.startswith('/search/'):
+            return 'search'
+        return 'core'
+
+    def update_from_response(self, response, *args, **kwargs):
+        '''A requests response hook'''
+        auth = response.request.headers.get('Authorization') if response.request else None
+        if not auth or ' ' not in auth:
+            return
+        tracker = self.trackers.get(auth.split(' ', 1)[1])
+        if tracker is not None:
+            tracker.update_from_headers(response.headers)
+
+    def update_from_json(self, rawjson, token=None):
+        tracker = self.add(token or self.primary)
+        if tracker is not None:
+            tracker.update_from_json(rawjson)
+
+    def get_stats(self):
+        '''Usage per token, the tokens themselves are masked'''
+        stats = {}
+        for token, tracker in self.trackers.items():
+            stats['...' + token[-4:]] = {
+                'requests': tracker.used,
+                'core': tracker.remaining('core'),
+                'graphql': tracker.remaining('graphql'),
+            }
+        return stats
+
+    def log_stats(self):
+        for token, stats in self.get_stats().items():
+            logging.info(
+                'token %s: %s requests, %s core and %s graphql calls left' %
+                (token, stats['requests'], stats['core'], stats['graphql'])
+            )
+
+
+RATELIMITS = TokenPool([C.DEFAULT_GITHUB_TOKEN] + C.DEFAULT_GITHUB_TOKENS)
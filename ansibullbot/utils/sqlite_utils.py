@@ -42,18 +42,6 @@ class RateLimit(Base):
     query_counter = Column(Integer)
 
 
-class GithubApiRequest(Base):
-    __tablename__ = 'github_api_request'
-    id = Column(Integer(), primary_key=True)
-    url = Column(String)
-    headers = Column(String)
-    datafile = Column(String)
-    etag = Column(String)
-    date = Column(String)
-    last_modified = Column(String)
-    token = Column(String)
-
-
 class AnsibullbotDatabase:
 
     '''A sqlite backed database to help with data caching [NOT CONFIG]'''
@@ -84,6 +72,12 @@ class AnsibullbotDatabase:
 
         self.create_tables()
 
+    def reconnect(self):
+        '''Start a new engine+session, connections must not cross a fork'''
+        self.engine = create_engine(self.unc)
+        self.session_maker = sessionmaker(bind=self.engine)
+        self.session = self.session_maker()
+
     def delete_db_file(self):
         os.remove(self.dbfile)
 
@@ -95,65 +89,12 @@ class AnsibullbotDatabase:
                 Email.metadata.create_all(self.engine)
                 Blame.metadata.create_all(self.engine)
                 RateLimit.metadata.create_all(self.engine)
-                GithubApiRequest.metadata.create_all(self.engine)
                 break
             except Exception as e:
                 retries += 1
                 if self.dbfile and os.path.exists(self.dbfile):
                     self.delete_db_file()
 
-    def get_github_api_request_meta(self, url, token=None):
-        try:
-            if token is None:
-                rl = self.session.query(GithubApiRequest).filter(GithubApiRequest.url == url).first()
-            else:
-                rl = self.session.query(GithubApiRequest).filter(GithubApiRequest.url == url).filter(GithubApiRequest.token == token).first()
-        except Exception as e:
-            logging.error(e)
-            return {}
-
-        meta = {}
-        if rl is not None:
-            meta = {
-                'url': rl.url,
-                'date': rl.date,
-                'etag': rl.etag,
-                'last_modified': rl.last_modified,
-                'datafile': rl.datafile,
-                'token': rl.token,
-                'headers': json.loads(rl.headers)
-            }
-
-        return meta
-
-    def set_github_api_request_meta(self, url, headers, datafile, token=None):
-        kwargs = {
-            'url': url,
-            'date': headers['Date'],
-            'etag': headers['ETag'],
-            'last_modified': headers.get('Last-Modified'),
-            'datafile': datafile,
-            'token': token,
-            'headers': json.dumps(dict(headers))
-        }
-
-        try:
-            if token is None:
-                current = self.session.query(GithubApiRequest).filter(GithubApiRequest.url == url).first()
-            else:
-                current = self.session.query(GithubApiRequest).filter(GithubApiRequest.url == url).filter(GithubApiRequest.token == token).first()
-        except Exception as e:
-            logging.error(e)
-            return None
-
-        meta = GithubApiRequest(**kwargs)
-        self.session.merge(meta)
-        try:
-            self.session.flush()
-            self.session.commit()
-        except Exception as e:
-            logging.error(e)
-
     def set_rate_limit(self, username=None, token=None, rawjson=None):
 
         '''Store the ratelimit json data by user/token'''
@@ -30,3 +30,20 @@ def strip_time_safely(tstring):
 
     logging.error(f'{tstring} could not be stripped')
     raise Exception(f'{tstring} could not be stripped')
+
+
+def utc_timestamp(tstring):
+    """A github or isoformat utc timestamp, or seconds since the epoch, as
+    a utc timestamp without the zone and fractions
+
+    These sort and compare as plain strings.
+    """
+    if not tstring:
+        return tstring
+    if isinstance(tstring, (int, float)):
+        return datetime.datetime.fromtimestamp(tstring, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+    if tstring.endswith('Z'):
+        tstring = tstring[:-1]
+    elif tstring.endswith('+00:00'):
+        tstring = tstring[:-len('+00:00')]
+    return tstring.split('.')[0]
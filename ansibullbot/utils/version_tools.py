@@ -12,13 +12,26 @@ from ansibullbot.utils.timetools import strip_time_safely
 
 class AnsibleVersionIndexer:
 
-    def __init__(self, checkoutdir):
+    def __init__(self, checkoutdir, state=None):
         self.checkoutdir = checkoutdir
         self.VALIDVERSIONS = None
         self.commit_versions_cache = {}
         self.DATEVERSIONS = None
 
-        self._get_versions()
+        # the get_state() of an indexer for the same checkout
+        if state is not None:
+            self.VALIDVERSIONS = state['VALIDVERSIONS']
+            self.commit_versions_cache = state['commit_versions_cache']
+            self.DATEVERSIONS = state['DATEVERSIONS']
+        else:
+            self._get_versions()
+
+    def get_state(self):
+        return {
+            'VALIDVERSIONS': self.VALIDVERSIONS,
+            'commit_versions_cache': self.commit_versions_cache,
+            'DATEVERSIONS': self.DATEVERSIONS,
+        }
 
     def _get_devel_version(self):
         # get devel's version
@@ -1,23 +1,26 @@
-import json
 import logging
 import os
-import pickle
-import requests
-import shutil
+import threading
 from datetime import datetime
 
 from github import Github
+from github.Issue import Issue
+from github.Label import Label
+from github.NamedUser import NamedUser
+from github.Requester import (
+    HTTPRequestsConnectionClass,
+    HTTPSRequestsConnectionClass,
+    Requester,
+)
 
 import ansibullbot.constants as C
 
 from ansibullbot.decorators.github import RateLimited
 from ansibullbot.errors import RateLimitError
-from ansibullbot.utils.file_tools import read_gzip_json_file, write_gzip_json_file
-from ansibullbot.utils.sqlite_utils import AnsibullbotDatabase
+from ansibullbot.utils import http_cache
+from ansibullbot.utils.cache_store import REPO, get_store
 
 
-ADB = AnsibullbotDatabase()
-
 HEADERS = [
     'application/json',
     'application/vnd.github.mockingbird-preview',
@@ -28,16 +31,58 @@ HEADERS = [
 ]
 
 
+class SharedSessionMixin:
+    '''Once connection classes are injected pygithub builds a connection for
+    every request, so no two threads share one. The connections take the
+    requests session of their thread from sessions, which keeps the http
+    connections alive between requests and sends them through the cache.'''
+
+    # a threading.local, see get_connection_classes
+    sessions = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        by_host = self.sessions.__dict__.setdefault('by_host', {})
+        key = (self.protocol, self.host, self.port)
+        if key not in by_host:
+            http_cache.mount(self.session)
+            by_host[key] = self.session
+        self.session = by_host[key]
+
+
+class ThreadSafeHTTPRequestsConnection(SharedSessionMixin, HTTPRequestsConnectionClass):
+    pass
+
+
+class ThreadSafeHTTPSRequestsConnection(SharedSessionMixin, HTTPSRequestsConnectionClass):
+    pass
+
+
+def get_connection_classes():
+    '''The connection classes for one GithubWrapper, they share the sessions
+    of each thread with each other but not with other wrappers'''
+    sessions = threading.local()
+    return tuple(
+        type(cls.__name__, (cls,), {'sessions': sessions})
+        for cls in (ThreadSafeHTTPRequestsConnection, ThreadSafeHTTPSRequestsConnection)
+    )
+
+
 class GithubWrapper:
     def __init__(self, url=None, user=None, passw=None, token=None, cachedir='~/.ansibullbot/cache'):
+        self.connection_classes = get_connection_classes()
+        self._connect_args = (url, user, passw, token)
         self.gh = self._connect(url, user, passw, token)
         self.token = token
         self.cachedir = os.path.expanduser(cachedir)
-        self.cached_requests_dir = os.path.join(self.cachedir, 'cached_requests')
+        http_cache.configure(self.cachedir)
+        self.session = http_cache.new_session()
 
     @RateLimited
     def _connect(self, url, user, passw, token):
         """Connects to GitHub's API"""
+        # a Requester keeps the connection classes injected when it is built
+        Requester.injectConnectionClasses(*self.connection_classes)
         if token:
             return Github(base_url=url, login_or_token=token)
         else:
@@ -47,64 +92,14 @@ class GithubWrapper:
                 password=passw
             )
 
+    def new_connection(self):
+        '''Create a separate connection, pygithub connections are not thread safe'''
+        return self._connect(*self._connect_args)
+
     @RateLimited
     def get_cached_request(self, url):
-        '''Use a combination of sqlite and ondisk caching to GET an api resource'''
-        url_parts = url.split('/')
-
-        cdf = os.path.join(self.cached_requests_dir, url.replace('https://', '') + '.json.gz')
-        cdd = os.path.dirname(cdf)
-        if not os.path.exists(cdd):
-            os.makedirs(cdd)
-
-        # FIXME - commits are static and can always be used from cache.
-        if url_parts[-2] == 'commits' and os.path.exists(cdf):
-            return read_gzip_json_file(cdf)
-
-        headers = {
-            'Accept': ','.join(HEADERS),
-            'Authorization': 'Bearer %s' % self.token,
-        }
-
-        meta = ADB.get_github_api_request_meta(url, token=self.token)
-        if meta is None:
-            meta = {}
-
-        # https://developer.github.com/v3/#conditional-requests
-        etag = meta.get('etag')
-        if etag and os.path.exists(cdf):
-            headers['If-None-Match'] = etag
-
-        rr = requests.get(url, headers=headers)
-
-        if rr.status_code == 304:
-            # not modified
-            with open(cdf) as f:
-                data = json.loads(f.read())
-        else:
-            data = rr.json()
-
-            # handle ratelimits ...
-            if isinstance(data, dict) and data.get('message'):
-                if data['message'].lower().startswith('api rate limit exceeded'):
-                    raise RateLimitError()
-
-            # cache data to disk
-            logging.debug('write %s' % cdf)
-            write_gzip_json_file(cdf, data)
-
-        # save the meta
-        ADB.set_github_api_request_meta(url, rr.headers, cdf, token=self.token)
-
-        # pagination
-        if hasattr(rr, 'links') and rr.links and rr.links.get('next'):
-            _data = self.get_request(rr.links['next']['url'])
-            if isinstance(data, list):
-                data += _data
-            else:
-                data.update(_data)
-
-        return data
+        '''GET an api resource, the http cache makes it a conditional request'''
+        return self.get_request(url)
 
     @RateLimited
     def get_request(self, url):
@@ -115,7 +110,7 @@ class GithubWrapper:
             'Authorization': 'Bearer %s' % self.token,
         }
 
-        rr = requests.get(url, headers=headers)
+        rr = self.session.get(url, headers=headers)
         data = rr.json()
 
         # handle ratelimits ...
@@ -135,22 +130,22 @@ class GithubWrapper:
 
 
 class RepoWrapper:
-    def __init__(self, gh, repo_path, cachedir='~/.ansibullbot/cache'):
+    def __init__(self, gh, repo_path, cachedir='~/.ansibullbot/cache', lazy=False):
         self.gh = gh
         self.cachedir = os.path.join(os.path.expanduser(cachedir), repo_path)
 
         self._assignees = False
         self._labels = False
-        self.repo = self.get_repo(repo_path)
+        self.repo = self.get_repo(repo_path, lazy=lazy)
 
     def has_in_assignees(self, login):
         logins = [x.login for x in self.assignees]
         return login in logins
 
     @RateLimited
-    def get_repo(self, repo_path):
+    def get_repo(self, repo_path, lazy=False):
         logging.getLogger('github.Requester').setLevel(logging.INFO)
-        repo = self.gh.get_repo(repo_path)
+        repo = self.gh.get_repo(repo_path, lazy=lazy)
         return repo
 
     def get_rate_limit(self):
@@ -171,7 +166,7 @@ class RepoWrapper:
             except UnicodeDecodeError:
                 # https://github.com/ansible/ansibullbot/issues/610
                 logging.warning('cleaning cache for %s' % number)
-                shutil.rmtree(os.path.join(self.cachedir, 'issues', str(number)))
+                self.store.delete(number)
 
         return issue
 
@@ -205,42 +200,26 @@ class RepoWrapper:
         else:
             return self.repo.get_issues()
 
+    @property
+    def store(self):
+        return get_store(self.cachedir)
+
     def load_issue(self, number):
         if not C.DEFAULT_PICKLE_ISSUES:
             return False
 
-        pfile = os.path.join(
-            self.cachedir,
-            'issues',
-            str(number),
-            'issue.pickle'
-        )
-        if os.path.isfile(pfile):
-            with open(pfile, 'rb') as f:
-                try:
-                    issue = pickle.load(f)
-                except TypeError:
-                    return False
-            return issue
-        else:
+        data = self.store.get_data(number, 'issue')
+        if data is None:
             return False
+        # the headers carry the etag issue.update() revalidates with
+        return self.gh.create_from_raw_data(Issue, data['raw_data'], data['headers'])
 
     def save_issue(self, issue):
         if not C.DEFAULT_PICKLE_ISSUES:
             return
 
-        cfile = os.path.join(
-            self.cachedir,
-            'issues',
-            str(issue.number),
-            'issue.pickle'
-        )
-        cdir = os.path.dirname(cfile)
-        if not os.path.isdir(cdir):
-            os.makedirs(cdir)
-        logging.debug('dump %s' % cfile)
-        with open(cfile, 'wb') as f:
-            pickle.dump(issue, f)
+        logging.debug('dump issue %s' % issue.number)
+        self.store.put_data(issue.number, 'issue', {'raw_data': issue.raw_data, 'headers': issue.raw_headers})
 
     @RateLimited
     def load_update_fetch(self, property_name):
@@ -253,28 +232,20 @@ class RepoWrapper:
 
         self.repo.update()
 
-        pfile = os.path.join(self.cachedir, '%s.pickle' % property_name)
-        pdir = os.path.dirname(pfile)
-
-        if not os.path.isdir(pdir):
-            os.makedirs(pdir)
+        klass = {'labels': Label, 'assignees': NamedUser}[property_name]
 
-        if os.path.isfile(pfile):
-            try:
-                with open(pfile, 'rb') as f:
-                    edata = pickle.load(f)
-            except Exception:
+        edata = self.store.get_data(REPO, property_name)
+        if edata is None:
+            update = True
+            write_cache = True
+        else:
+            # check the timestamp on the cache
+            updated = edata[0]
+            events = [self.gh.create_from_raw_data(klass, x) for x in edata[1]]
+            if updated < self.repo.updated_at:
                 update = True
                 write_cache = True
 
-            # check the timestamp on the cache
-            if edata:
-                updated = edata[0]
-                events = edata[1]
-                if updated < self.repo.updated_at:
-                    update = True
-                    write_cache = True
-
         # pull all events if timestamp is behind or no events cached
         if update or not events:
             write_cache = True
@@ -282,12 +253,8 @@ class RepoWrapper:
             methodToCall = getattr(self.repo, 'get_' + property_name)
             events = [x for x in methodToCall()]
 
-        if C.DEFAULT_PICKLE_ISSUES:
-            if write_cache or not os.path.isfile(pfile):
-                # need to dump the pickle back to disk
-                edata = [updated, events]
-                with open(pfile, 'wb') as f:
-                    pickle.dump(edata, f)
+        if C.DEFAULT_PICKLE_ISSUES and write_cache:
+            self.store.put_data(REPO, property_name, [updated, [x.raw_data for x in events]])
 
         return events
 
@@ -1,14 +1,69 @@
 import datetime
+import itertools
 import logging
 import os
-import pickle
 
 from operator import itemgetter
 
 import ansibullbot.constants as C
+from ansibullbot.utils.cache_store import get_store
+from ansibullbot.utils.command_table import WORD_COMMANDS, CommandTable
 from ansibullbot.utils.timetools import strip_time_safely
 
 
+class EventIndex:
+
+    '''The positions of the events of a history, by what is asked of them
+
+    Built once per history, every list of positions is in the order of
+    the history so the first and last entries are the oldest and newest
+    events, and their created_at the first and last timestamps.
+    '''
+
+    def __init__(self, history):
+        self.by_event = {}
+        self.by_actor = {}
+        # (event, actor), ('commented', actor) are the comments of an actor
+        self.by_event_actor = {}
+        # label -> {'labeled': positions, 'unlabeled': positions}
+        self.by_label = {}
+        # stripped body of a comment or review -> position of its last use
+        self.last_body = {}
+        # tuple of @mentions -> when they were last made
+        self.notified = {}
+
+        for pos, event in enumerate(history):
+            name = event['event']
+            actor = event.get('actor')
+            self.by_event.setdefault(name, []).append(pos)
+            self.by_actor.setdefault(actor, []).append(pos)
+            self.by_event_actor.setdefault((name, actor), []).append(pos)
+            if name in ('labeled', 'unlabeled'):
+                self.by_label.setdefault(event['label'], {'labeled': [], 'unlabeled': []})[name].append(pos)
+            if event.get('body'):
+                self.last_body[event['body'].strip()] = pos
+
+    def find(self, eventname=None, actor=None):
+        '''Positions of the events of a name and actor, either may be None
+
+        None if both are, that is every event.
+        '''
+        if actor is None:
+            if eventname:
+                return self.by_event.get(eventname, [])
+            return None
+        return self.find_by_actors(eventname, actor if isinstance(actor, list) else [actor])
+
+    def find_by_actors(self, eventname, actors):
+        if eventname:
+            lists = [self.by_event_actor.get((eventname, x), []) for x in set(actors)]
+        else:
+            lists = [self.by_actor.get(x, []) for x in set(actors)]
+        if len(lists) == 1:
+            return lists[0]
+        return sorted(itertools.chain.from_iterable(lists))
+
+
 class HistoryWrapper:
     """A tool to ask questions about an issue's history.
 
@@ -28,6 +83,9 @@ class HistoryWrapper:
 
     def __init__(self, issue, usecache=True, cachedir=None):
         self.issue = issue
+        self._history = []
+        self._index = None
+        self._command_table = None
         self._waffled_labels = None
 
         if issue.repo_full_name not in cachedir and 'issues' not in cachedir:
@@ -68,22 +126,66 @@ class HistoryWrapper:
             logging.error(self.cachedir)
             raise Exception
 
+        # cachedir is <repo>/issues/<number>
+        self.store = get_store(os.path.dirname(os.path.dirname(self.cachedir)))
+
         if usecache:
             cache = self._load_cache()
 
+            merged = False
+            if self._cache_is_behind(cache):
+                logging.info('history cache behind issue, merging new events')
+                cache = self._merge_events(cache)
+                merged = True
+
             if not self.validate_cache(cache):
                 logging.info('history cache invalidated, rebuilding')
-                self.history = self.issue.events
+                if cache is None:
+                    self.history = self.issue.events
+                else:
+                    # the events on disk are suspect, start over
+                    self.history = self.issue.refetch_events()
                 self._dump_cache()
             else:
                 logging.info('use cached history')
                 self.history = cache['history']
+                if merged:
+                    self._dump_cache()
         else:
             self.history = self.issue.events
 
         self.history = sorted(self.history, key=itemgetter('created_at'))
 
-    def validate_cache(self, cache):
+    @property
+    def history(self):
+        return self._history
+
+    @history.setter
+    def history(self, events):
+        # merge_commits and merge_reviews set the merged history here too
+        self._history = events
+        self._index = None
+        self._command_table = None
+        self._waffled_labels = None
+
+    @property
+    def index(self):
+        '''The EventIndex of the history, rebuilt when the history is set'''
+        if self._index is None:
+            self._index = EventIndex(self._history)
+        return self._index
+
+    @property
+    def command_table(self):
+        '''The CommandTable of the comments and reviews not made by a bot'''
+        if self._command_table is None:
+            self._command_table = CommandTable(self._history, botnames=self.BOTNAMES)
+        return self._command_table
+
+    def _get_events(self, positions):
+        return [self._history[x] for x in positions]
+
+    def _validate_cache_schema(self, cache):
         if cache is None:
             return False
 
@@ -101,6 +203,29 @@ class HistoryWrapper:
             logging.info('history cache schema version behind')
             return False
 
+        return True
+
+    def _cache_is_behind(self, cache):
+        if not self._validate_cache_schema(cache):
+            return False
+        return cache['updated_at'] < self.issue.instance.updated_at
+
+    def _merge_events(self, cache):
+        '''Append the events the cache has not seen yet'''
+        known = {x['id'] for x in cache['history']}
+        new_events = [x for x in self.issue.events if x['id'] not in known]
+        logging.info('%s new events in history' % len(new_events))
+
+        return {
+            'version': cache['version'],
+            'updated_at': self.issue.instance.updated_at,
+            'history': sorted(cache['history'] + new_events, key=itemgetter('created_at')),
+        }
+
+    def validate_cache(self, cache):
+        if not self._validate_cache_schema(cache):
+            return False
+
         if cache['updated_at'] < self.issue.instance.updated_at:
             logging.info('history cache behind issue')
             return False
@@ -119,19 +244,9 @@ class HistoryWrapper:
         return True
 
     def _load_cache(self):
-        if not os.path.isdir(self.cachedir):
-            os.makedirs(self.cachedir)
-        if not os.path.isfile(self.cachefile):
-            logging.info('!%s' % self.cachefile)
-            return
-        try:
-            with open(self.cachefile, 'rb') as f:
-                cachedata = pickle.load(f)
-        except Exception as e:
-            logging.debug(e)
-            logging.info('%s failed to load' % self.cachefile)
-            return
-
+        cachedata = self.store.get_data(self.issue.instance.number, 'history')
+        if cachedata is None:
+            logging.info('no cached history for %s' % self.issue.instance.number)
         return cachedata
 
     def _dump_cache(self):
@@ -139,21 +254,13 @@ class HistoryWrapper:
             logging.error(self.history)
             raise AssertionError('found a non-datetime created_at in events data')
 
-        if not os.path.isdir(self.cachedir):
-            os.makedirs(self.cachedir)
-
         cachedata = {
             'version': self.SCHEMA_VERSION,
             'updated_at': self.issue.instance.updated_at,
             'history': self.history
         }
 
-        try:
-            with open(self.cachefile, 'wb') as f:
-                pickle.dump(cachedata, f)
-        except Exception as e:
-            logging.error(e)
-            raise
+        self.store.put_data(self.issue.instance.number, 'history', cachedata)
 
     def get_json_comments(self):
         comments = self.issue.comments[:]
@@ -216,20 +323,11 @@ class HistoryWrapper:
         self.history = sorted(self.history, key=itemgetter('created_at'))
 
     def _find_events_by_actor(self, eventname, actor, maxcount=1):
-        matching_events = []
-        for event in self.history:
-            if event['event'] == eventname or not eventname:
-                # allow actor to be a list or a string or None
-                if actor is None:
-                    matching_events.append(event)
-                elif type(actor) != list and event['actor'] == actor:
-                    matching_events.append(event)
-                elif type(actor) == list and event['actor'] in actor:
-                    matching_events.append(event)
-                if len(matching_events) == maxcount:
-                    break
-
-        return matching_events
+        # allow actor to be a list or a string or None
+        positions = self.index.find(eventname, actor)
+        if positions is None:
+            return self._history[:maxcount]
+        return self._get_events(positions[:maxcount])
 
     def get_user_comments(self, username):
         """Get all the comments from a user"""
@@ -254,33 +352,28 @@ class HistoryWrapper:
     def get_commands(self, username, command_keys, timestamps=False, uselabels=True):
         """Given a list of phrase keys, return a list of phrases used"""
         commands = []
+        table = self.command_table
 
-        comments = self._find_events_by_actor(
-            'commented',
-            username,
-            maxcount=999
-        )
-        labels = self._find_events_by_actor(
-            'labeled',
-            username,
-            maxcount=999
-        )
-        unlabels = self._find_events_by_actor(
-            'unlabeled',
-            username,
-            maxcount=999
-        )
-        events = comments + labels + unlabels
-        events = sorted(events, key=itemgetter('created_at'))
-        for event in events:
+        if username is None:
+            actors = None
+        else:
+            actors = username if isinstance(username, list) else [username]
+        if all(x in WORD_COMMANDS for x in command_keys):
+            positions = {x.position for x in table.find(command_keys, actors)}
+        else:
+            positions = set(self.index.find('commented', username) or [])
+        positions = sorted(x for x in positions if x not in table.mirrored)
+
+        events = [(self._history[x], x) for x in positions]
+        events += [(x, None) for x in self._find_events_by_actor('labeled', username, maxcount=999)]
+        events += [(x, None) for x in self._find_events_by_actor('unlabeled', username, maxcount=999)]
+        events = sorted(events, key=lambda x: x[0]['created_at'])
+        for event, position in events:
             if event['actor'] in self.BOTNAMES:
                 continue
-            if event['event'] == 'commented':
+            if position is not None:
                 for y in command_keys:
-                    if event['body'].startswith('_From @'):
-                        continue
-                    l_body = event['body'].split()
-                    if y in l_body and not '!' + y in l_body:
+                    if table.is_active(position, y):
                         if timestamps:
                             commands.append((event['created_at'], y))
                         else:
@@ -302,21 +395,14 @@ class HistoryWrapper:
 
     def get_component_commands(self, command_key='!component'):
         """Given a list of phrase keys, return a list of phrases used"""
+        positions = sorted({x.position for x in self.command_table.find(command_key)})
         commands = []
-        events = self.get_json_comments()
-        events = [x for x in events if x['user']['login'] not in self.BOTNAMES]
-
-        for event in events:
-            if event.get('body'):
-                matched = False
-                lines = event['body'].split('\n')
-                for line in lines:
-                    if line.strip().startswith(command_key):
-                        matched = True
-                        break
-                if matched:
-                    commands.append(event)
-
+        for x in positions:
+            event = self._history[x]
+            ca = event['created_at']
+            if not (hasattr(ca, 'tzinfo') and ca.tzinfo):
+                ca = ca.replace(tzinfo=datetime.timezone.utc)
+            commands.append({'body': event['body'], 'created_at': ca, 'user': {'login': event['actor']}})
         return commands
 
     def was_assigned(self, username):
@@ -333,85 +419,55 @@ class HistoryWrapper:
         """When was this person pinged last in a comment?"""
         if not isinstance(username, list):
             username = [username]
-        username = ['@' + x for x in username]
-        last_notification = None
-        comments = [x for x in self.history if x['event'] == 'commented']
-        for comment in comments:
-            if not comment.get('body'):
-                continue
-            for un in username:
-                if un in comment['body']:
-                    if not last_notification:
-                        last_notification = comment['created_at']
-                    else:
-                        if comment['created_at'] > last_notification:
-                            last_notification = comment['created_at']
-        return last_notification
+        username = tuple('@' + x for x in username)
+        if username not in self.index.notified:
+            last_notification = None
+            for comment in reversed(self._get_events(self.index.find('commented'))):
+                if comment.get('body') and any(x in comment['body'] for x in username):
+                    last_notification = comment['created_at']
+                    break
+            self.index.notified[username] = last_notification
+        return self.index.notified[username]
 
     def last_comment(self, username):
         last_comment = None
-        for event in reversed(self.history):
-            if event['event'] == 'commented':
-                if type(username) == list:
-                    if event['actor'] in username:
-                        last_comment = event['body']
-                elif event['actor'] == username:
-                    last_comment = event['body']
+        actors = username if isinstance(username, list) else [username]
+        for event in reversed(self._get_events(self.index.find_by_actors('commented', actors))):
+            last_comment = event['body']
             if last_comment:
                 break
         return last_comment
 
+    def _label_last_date(self, eventname, label):
+        positions = self.index.by_label.get(label, {}).get(eventname)
+        if not positions:
+            return None
+        return self._history[positions[-1]]['created_at']
+
     def label_last_applied(self, label):
         """What date was a label last applied?"""
-        last_date = None
-        for event in reversed(self.history):
-            if event['event'] == 'labeled':
-                if event['label'] == label:
-                    last_date = event['created_at']
-                    break
-        return last_date
+        return self._label_last_date('labeled', label)
 
     def label_last_removed(self, label):
         """What date was a label last removed?"""
-        last_date = None
-        for event in reversed(self.history):
-            if event['event'] == 'unlabeled':
-                if event['label'] == label:
-                    last_date = event['created_at']
-                    break
-        return last_date
+        return self._label_last_date('unlabeled', label)
+
+    def _was_labeled(self, eventname, label, bots):
+        if label:
+            positions = self.index.by_label.get(label, {}).get(eventname, [])
+        else:
+            positions = self.index.find(eventname)
+        if not bots:
+            return len(positions) > 0
+        return any(self._history[x]['actor'] not in bots for x in positions)
 
     def was_labeled(self, label, bots=None):
         """Were labels -ever- applied to this issue?"""
-        labeled = False
-        for event in self.history:
-            if bots:
-                if event['actor'] in bots:
-                    continue
-            if event['event'] == 'labeled':
-                if label and event['label'] == label:
-                    labeled = True
-                    break
-                elif not label:
-                    labeled = True
-                    break
-        return labeled
+        return self._was_labeled('labeled', label, bots)
 
     def was_unlabeled(self, label, bots=None):
         """Were labels -ever- unapplied from this issue?"""
-        labeled = False
-        for event in self.history:
-            if bots:
-                if event['actor'] in bots:
-                    continue
-            if event['event'] == 'unlabeled':
-                if label and event['label'] == label:
-                    labeled = True
-                    break
-                elif not label:
-                    labeled = True
-                    break
-        return labeled
+        return self._was_labeled('unlabeled', label, bots)
 
     def get_boilerplate_comments(self, dates=False, content=True):
         boilerplates = []
@@ -455,9 +511,9 @@ class HistoryWrapper:
 
     @property
     def last_commit_date(self):
-        events = [x for x in self.history if x['event'] == 'committed']
-        if events:
-            return events[-1]['created_at']
+        positions = self.index.find('committed')
+        if positions:
+            return self._history[positions[-1]]['created_at']
         else:
             return None
 
@@ -466,16 +522,13 @@ class HistoryWrapper:
         if bots is None:
             bots = []
         labeled = []
-        for event in self.history:
-            if event['actor'] in bots:
+        for label, positions in self.index.by_label.items():
+            if prefix and not label.startswith(prefix):
                 continue
-            if event['event'] in ['labeled', 'unlabeled']:
-                if prefix:
-                    if event['label'].startswith(prefix):
-                        labeled.append(event['label'])
-                else:
-                    labeled.append(event['label'])
-        return sorted(set(labeled))
+            events = self._get_events(positions['labeled'] + positions['unlabeled'])
+            if any(x['actor'] not in bots for x in events):
+                labeled.append(label)
+        return sorted(labeled)
 
     def label_is_waffling(self, label, limit=20):
         """ detect waffling on labels """
@@ -493,12 +546,8 @@ class HistoryWrapper:
             return False
 
     def command_status(self, command):
-        status = None
-        for event in self.history:
-            if 'body' not in event:
-                continue
-            if event['body'].strip() == command:
-                status = True
-            elif event['body'].strip() == '!' + command:
-                status = False
-        return status
+        on = self.index.last_body.get(command)
+        off = self.index.last_body.get('!' + command)
+        if on is None and off is None:
+            return None
+        return off is None or (on is not None and on > off)
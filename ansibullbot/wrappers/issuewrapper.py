@@ -15,34 +15,146 @@
 
 
 import datetime
-import json
 import logging
 import os
-import pickle
 import re
 import time
+from types import SimpleNamespace
 
 import requests
+from github.File import File
 
 import ansibullbot.constants as C
 from ansibullbot.decorators.github import RateLimited
+from ansibullbot.utils.cache_store import get_store
 from ansibullbot.utils.extractors import get_template_data
 from ansibullbot.utils.timetools import strip_time_safely
 from ansibullbot.wrappers.historywrapper import HistoryWrapper
 
 
+# events per page when fetching the tail of a cached timeline
+TIMELINE_PAGE_SIZE = 100
+
+
+def timeline_event_key(event):
+    '''A stable key for a raw timeline event, not all of them have an id'''
+    for key in ('id', 'node_id', 'sha'):
+        if event.get(key):
+            return str(event[key])
+
+    # cross references only have a source
+    source = (event.get('source') or {}).get('issue') or {}
+    return '%s/%s/%s/%s' % (
+        event.get('event'),
+        event.get('created_at'),
+        (event.get('actor') or {}).get('login'),
+        source.get('html_url'),
+    )
+
+
 class UnsetValue:
     def __str__(self):
         return "AnsibullbotUnsetValue()"
 
 
+class IssueSnapshot:
+    '''Stand-in for a pygithub Issue built from a graphql snapshot
+
+    The attributes the triager reads come from the snapshot, see
+    GithubGraphQLClient.get_issue_batch. Anything else, like editing or
+    labeling, loads the pygithub issue on first use.
+    '''
+
+    def __init__(self, node, repo=None):
+        self.node = node
+        self.repo = repo
+        self._issue = None
+
+        self.number = node['number']
+        self.url = node['url']
+        self.html_url = node['html_url']
+        self.title = node['title']
+        self.body = node['body']
+        self.state = node['state']
+        self.created_at = self._parse_date(node['created_at'])
+        self.updated_at = self._parse_date(node['updated_at'])
+        self.closed_at = self._parse_date(node['closed_at'])
+        self.merged_at = self._parse_date(node['merged_at'])
+        self.user = SimpleNamespace(**node['user'])
+        self.labels = [SimpleNamespace(name=x) for x in node['labels']]
+        self.assignees = [SimpleNamespace(login=x) for x in node['assignees']]
+        self.draft = node['draft']
+        self.mergeable = node['mergeable']
+
+    @staticmethod
+    def _parse_date(value):
+        if value is None:
+            return None
+        return strip_time_safely(value)
+
+    def __getattr__(self, name):
+        # only called for attributes the snapshot does not have
+        repo = self.__dict__.get('repo')
+        if name.startswith('_') or repo is None:
+            raise AttributeError(name)
+        if self._issue is None:
+            logging.debug('loading pygithub issue for snapshot #%s' % self.number)
+            self._issue = repo.repo.get_issue(self.number)
+        return getattr(self._issue, name)
+
+
+class SnapshotCommit:
+    '''Stand-in for a pygithub Commit built from a pullrequest snapshot'''
+
+    def __init__(self, data):
+        self.data = data
+        self.sha = data['sha']
+        self.url = data['url']
+        self.html_url = data['html_url']
+        self.parents = data['parents']
+        self.commit = SimpleNamespace(
+            sha=data['sha'],
+            message=data['message'],
+            author=self._person(data['author']),
+            committer=self._person(data['committer']),
+        )
+        self.author = SimpleNamespace(login=data['author']['login']) if data['author']['login'] else None
+        self.committer = SimpleNamespace(login=data['committer']['login']) if data['committer']['login'] else None
+
+    @staticmethod
+    def _person(data):
+        return SimpleNamespace(
+            name=data['name'],
+            email=data['email'],
+            date=strip_time_safely(data['date']),
+        )
+
+
+class SnapshotFile:
+    '''Stand-in for a pygithub File built from a pullrequest snapshot
+
+    The snapshot has no patch and no previous filename, see
+    IssueWrapper.rest_pr_files for those.
+    '''
+
+    def __init__(self, data):
+        self.raw_data = dict(data, changes=data['additions'] + data['deletions'])
+        self.filename = data['filename']
+        self.additions = data['additions']
+        self.deletions = data['deletions']
+        self.changes = self.raw_data['changes']
+        self.status = data['status']
+
+
 class IssueWrapper:
-    def __init__(self, github=None, repo=None, issue=None, cachedir=None, gitrepo=None):
+    def __init__(self, github=None, repo=None, issue=None, cachedir=None, gitrepo=None, gqlc=None):
         self.github = github
         self.repo = repo
         self.instance = issue
         self.cachedir = cachedir
         self.gitrepo = gitrepo
+        # with a graphql client the pullrequest data comes from one snapshot
+        self.gqlc = gqlc
 
         self.meta = {}
         self._assignees = UnsetValue
@@ -59,9 +171,15 @@ class IssueWrapper:
         self._template_data = None
         self._pull_raw = None
         self._pr_files = None
+        self._rest_pr_files = None
         self.full_cachedir = os.path.join(self.cachedir, 'issues', str(self.number))
         self._renamed_files = None
         self._pullrequest_check_runs = None
+        self._pr_snapshot = None
+
+    @property
+    def store(self):
+        return get_store(self.cachedir)
 
     @property
     def url(self):
@@ -142,57 +260,82 @@ class IssueWrapper:
 
         return sorted(processed_events, key=lambda x: x['created_at'])
 
-    def _get_timeline(self):
-        '''Use python-requests instead of pygithub'''
-        data = None
-
-        cache_data = os.path.join(self.full_cachedir, 'timeline_data.json')
-        cache_meta = os.path.join(self.full_cachedir, 'timeline_meta.json')
-        logging.debug(cache_data)
+    def refetch_events(self):
+        '''Drop the cached timeline and fetch it again in full'''
+        self._events = self._parse_events(self._get_timeline(full=True))
+        return self._events
 
-        if not os.path.exists(self.full_cachedir):
-            os.makedirs(self.full_cachedir)
+    def _get_timeline(self, full=False):
+        '''Use python-requests instead of pygithub
 
-        meta = {}
-        fetch = False
-        if not os.path.exists(cache_data):
-            fetch = True
-        else:
-            with open(cache_meta) as f:
-                meta = json.loads(f.read())
+        The cached timeline is only appended to. When the issue has been
+        updated, the pages from the last cached event on are fetched and
+        the new events are added to the cache.
+        '''
+        url = self.url + '/timeline'
 
-        if not fetch and (not meta or meta.get('updated_at', 0) < self.updated_at.isoformat()):
-            fetch = True
+        meta = None
+        data = None
+        if not full:
+            meta = self.store.get_json(self.number, 'timeline')
+            if meta:
+                data = meta.get('events')
 
-        # validate the data is not infected by ratelimit errors
-        if not fetch:
-            with open(cache_data) as f:
-                data = json.loads(f.read())
+            # validate the data is not infected by ratelimit errors
+            if not self._is_timeline(data):
+                data = None
 
-            if isinstance(data, list):
-                bad_events = [x for x in data if not isinstance(x, dict)]
-                if bad_events:
-                    fetch = True
-            else:
-                fetch = True
+        if data is not None:
+            if meta.get('updated_at', 0) >= self.updated_at.isoformat():
+                return data
+            data = self._get_timeline_tail(url, data)
 
         if data is None:
-            fetch = True
-
-        if fetch:
-            url = self.url + '/timeline'
             data = self.github.get_request(url)
 
-            with open(cache_meta, 'w') as f:
-                f.write(json.dumps({
-                    'updated_at': self.updated_at.isoformat(),
-                    'url': url
-                }))
-            with open(cache_data, 'w') as f:
-                f.write(json.dumps(data))
+        self.store.put_json(self.number, 'timeline', {
+            'updated_at': self.updated_at.isoformat(),
+            'url': url,
+            'events': data,
+        })
 
         return data
 
+    def _get_timeline_tail(self, url, data):
+        '''Fetch the timeline from the page of the last cached event on
+
+        Returns the cached events with the new ones appended, or None if
+        the cache no longer lines up with the timeline and has to be
+        fetched again.
+        '''
+        if not data:
+            return None
+
+        page = (len(data) - 1) // TIMELINE_PAGE_SIZE + 1
+        offset = (page - 1) * TIMELINE_PAGE_SIZE
+        tail = self.github.get_request('%s?per_page=%s&page=%s' % (url, TIMELINE_PAGE_SIZE, page))
+        if not self._is_timeline(tail):
+            return None
+
+        # events that were removed from the timeline shift the pages
+        keys = [timeline_event_key(x) for x in tail]
+        if not keys or keys[0] != timeline_event_key(data[offset]):
+            logging.info('timeline cache for %s does not line up, refetching' % self.number)
+            return None
+        if timeline_event_key(data[-1]) not in keys:
+            logging.info('timeline cache for %s does not line up, refetching' % self.number)
+            return None
+
+        known = {timeline_event_key(x) for x in data}
+        new_events = [x for x in tail if timeline_event_key(x) not in known]
+        logging.debug('%s new timeline events for %s' % (len(new_events), self.number))
+
+        return data + new_events
+
+    @staticmethod
+    def _is_timeline(data):
+        return isinstance(data, list) and all(isinstance(x, dict) for x in data)
+
     @RateLimited
     def load_update_fetch_files(self):
         edata = None
@@ -201,20 +344,12 @@ class IssueWrapper:
         update = False
         write_cache = False
 
-        pfile = os.path.join(self.full_cachedir, 'files.pickle')
-        pdir = os.path.dirname(pfile)
-        logging.debug(pfile)
-
-        if not os.path.isdir(pdir):
-            os.makedirs(pdir)
-
-        if os.path.isfile(pfile):
-            try:
-                with open(pfile, 'rb') as f:
-                    edata = pickle.load(f)
-            except Exception:
-                update = True
-                write_cache = True
+        edata = self.store.get_data(self.number, 'files')
+        if edata is None:
+            update = True
+            write_cache = True
+        else:
+            edata = [edata[0], [self.repo.gh.create_from_raw_data(File, x) for x in edata[1]]]
 
         # check the timestamp on the cache
         if edata:
@@ -231,11 +366,8 @@ class IssueWrapper:
             events = [x for x in self.pullrequest.get_files()]
 
         if C.DEFAULT_PICKLE_ISSUES:
-            if write_cache or not os.path.isfile(pfile):
-                # need to dump the pickle back to disk
-                edata = [updated, events]
-                with open(pfile, 'wb') as f:
-                    pickle.dump(edata, f)
+            if write_cache:
+                self.store.put_data(self.number, 'files', [updated, [x.raw_data for x in events]])
 
         return events
 
@@ -398,6 +530,14 @@ class IssueWrapper:
             self._pr = self.repo.get_pullrequest(self.number)
         return self._pr
 
+    def prefetch(self):
+        '''Load the timeline and pull request data ahead of processing'''
+        self.events
+        if self.is_pullrequest():
+            self.update_pullrequest()
+            self.reviews
+            self.commits
+
     def update_pullrequest(self):
         if self.is_pullrequest():
             # the underlying call is wrapper with ratelimited ...
@@ -405,13 +545,17 @@ class IssueWrapper:
             self._pr_reviews = False
             self._merge_commits = False
             self._committer_emails = False
+            self._pr_snapshot = None
 
     @property
     @RateLimited
     def pullrequest_check_runs(self):
         if self._pullrequest_check_runs is None:
             logging.info('fetching pull request check runs')
-            self._pullrequest_check_runs = self.commits[-1].get_check_runs()
+            if self.pr_snapshot is not None:
+                self._pullrequest_check_runs = [SimpleNamespace(**x) for x in self.pr_snapshot['check_runs']]
+            else:
+                self._pullrequest_check_runs = self.commits[-1].get_check_runs()
         return self._pullrequest_check_runs
 
     @property
@@ -425,13 +569,28 @@ class IssueWrapper:
     @property
     def pr_files(self):
         if self._pr_files is None:
-            self._pr_files = self.load_update_fetch_files()
+            if self.pr_snapshot is not None:
+                self._pr_files = [SnapshotFile(x) for x in self.pr_snapshot['files']]
+            else:
+                self._pr_files = self.load_update_fetch_files()
         return self._pr_files
 
+    @property
+    def rest_pr_files(self):
+        '''The pygithub files of the pullrequest, with their patches and
+        previous filenames, which a graphql snapshot does not have'''
+        if self.pr_snapshot is None:
+            return self.pr_files
+        if self._rest_pr_files is None:
+            self._rest_pr_files = self.load_update_fetch_files()
+        return self._rest_pr_files
+
     @property
     def files(self):
         if self.is_issue():
             return None
+        if self.pr_snapshot is not None:
+            return [x['filename'] for x in self.pr_snapshot['files']]
         return [x.filename for x in self.pr_files]
 
     @property
@@ -470,7 +629,10 @@ class IssueWrapper:
     @property
     def reviews(self):
         if self._pr_reviews is False:
-            self._pr_reviews = [r.raw_data for r in self.pullrequest.get_reviews()]
+            if self.pr_snapshot is not None:
+                self._pr_reviews = [dict(r) for r in self.pr_snapshot['reviews']]
+            else:
+                self._pr_reviews = [r.raw_data for r in self.pullrequest.get_reviews()]
 
         # https://github.com/ansible/ansibullbot/issues/881
         # https://github.com/ansible/ansibullbot/issues/883
@@ -500,11 +662,47 @@ class IssueWrapper:
     def get_commits(self):
         if not self.is_pullrequest():
             return None
+        if self.pr_snapshot is not None:
+            return [SnapshotCommit(x) for x in self.pr_snapshot['commits']]
         commits = [x for x in self.pullrequest.get_commits()]
         return commits
 
+    @property
+    def pr_snapshot(self):
+        if self.gqlc is None or not self.is_pullrequest():
+            return None
+        if self._pr_snapshot is None:
+            self._pr_snapshot = self.load_pr_snapshot()
+        return self._pr_snapshot
+
+    def load_pr_snapshot(self):
+        '''Fetch the graphql pullrequest snapshot
+
+        Files and commits are reused from the cache while the head sha and
+        base branch are unchanged, which makes this a single query.
+        '''
+        owner, repo = self.repo_full_name.split('/', 1)
+
+        cached = self.store.get_json(self.number, 'pr_snapshot')
+
+        snapshot = self.gqlc.get_pullrequest_snapshot(owner, repo, self.number, full=cached is None)
+        if cached is not None:
+            if (snapshot['head_sha'], snapshot['base_ref']) == (cached['head_sha'], cached['base_ref']):
+                snapshot['files'] = cached['files']
+                snapshot['commits'] = cached['commits']
+            else:
+                logging.info('head of #%s moved, fetching the full snapshot' % self.number)
+                snapshot = self.gqlc.get_pullrequest_snapshot(owner, repo, self.number)
+
+        self.store.put_json(self.number, 'pr_snapshot', snapshot)
+
+        return snapshot
+
     @property
     def mergeable(self):
+        # prefer the pullrequest once it was loaded, it is the fresher one
+        if not self._pr and isinstance(self.instance, IssueSnapshot) and self.instance.mergeable is not None:
+            return self.instance.mergeable
         return self.pullrequest.mergeable
 
     @property
@@ -537,9 +735,15 @@ class IssueWrapper:
         return (
             self.title.startswith('WIP') or
             '[WIP]' in self.title or
-            (self.is_pullrequest() and self.pullrequest.draft)
+            (self.is_pullrequest() and self.draft)
         )
 
+    @property
+    def draft(self):
+        if not self._pr and isinstance(self.instance, IssueSnapshot):
+            return self.instance.draft
+        return self.pullrequest.draft
+
     @property
     def incoming_repo_exists(self):
         return self.pullrequest.head.repo is not None
@@ -566,6 +770,9 @@ class IssueWrapper:
 
     @RateLimited
     def get_commit_login(self, commit):
+        if isinstance(commit, SnapshotCommit):
+            return commit.data['author']['login'] or ''
+
         cdata = self.github.get_cached_request(commit.url)
 
         # https://github.com/ansible/ansibullbot/issues/1265
@@ -584,8 +791,14 @@ class IssueWrapper:
         if self._merge_commits is False:
             self._merge_commits = []
             for commit in self.commits:
-                commit_data = self.github.get_cached_request(commit.url)
-                if len(commit_data['parents']) > 1 or commit_data['commit']['message'].startswith('Merge branch'):
+                if isinstance(commit, SnapshotCommit):
+                    parents = commit.parents
+                    message = commit.commit.message
+                else:
+                    commit_data = self.github.get_cached_request(commit.url)
+                    parents = commit_data['parents']
+                    message = commit_data['commit']['message']
+                if len(parents) > 1 or message.startswith('Merge branch'):
                     self._merge_commits.append(commit)
         return self._merge_commits
 
@@ -642,12 +855,20 @@ class IssueWrapper:
         if self.is_issue():
             return self._renamed_files
 
-        for x in self.commits:
-            rd = x.raw_data
-            for filed in rd.get('files', []):
-                if filed.get('previous_filename'):
-                    src = filed['previous_filename']
-                    dst = filed['filename']
-                    self._renamed_files[dst] = src
+        if self.pr_snapshot is not None:
+            # the snapshot knows which files were renamed but not from where,
+            # one listing of the pullrequest files has the previous names
+            if any(x['status'] == 'renamed' for x in self.pr_snapshot['files']):
+                files = [x.raw_data for x in self.rest_pr_files]
+            else:
+                files = []
+        else:
+            files = [y for x in self.commits for y in x.raw_data.get('files', [])]
+
+        for filed in files:
+            if filed.get('previous_filename'):
+                src = filed['previous_filename']
+                dst = filed['filename']
+                self._renamed_files[dst] = src
 
         return self._renamed_files
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+# Compare the per lookup latency of a git subprocess per call with the one
+# long lived cat-file process of GitObjectReader, on the files of a checkout.
+#
+#   scripts/benchmark_git_reader.py ~/.ansibullbot/cache/ansible/ansible.checkout
+
+import argparse
+import random
+import time
+
+from ansibullbot.utils.git_objects import GitObjectReader
+from ansibullbot.utils.systemtools import run_command
+
+
+def timed(func, args):
+    start = time.perf_counter()
+    for arg in args:
+        func(arg)
+    return (time.perf_counter() - start) * 1000.0 / len(args)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('checkoutdir', help='a git checkout')
+    parser.add_argument('--count', type=int, default=200,
+                        help='number of lookups of each kind')
+    args = parser.parse_args()
+
+    reader = GitObjectReader(args.checkoutdir)
+    files = reader.list_files('HEAD')
+    if not files:
+        parser.error('%s has no files at HEAD' % args.checkoutdir)
+    paths = [random.choice(files) for x in range(args.count)]
+
+    def show(path):
+        run_command('git show HEAD:%s' % path, cwd=args.checkoutdir)
+
+    def show_commit(rev):
+        run_command('git show --pretty=format:%%n --name-only %s' % rev, cwd=args.checkoutdir)
+
+    # start the cat-file process outside of the timings
+    reader.rev_parse('HEAD')
+    rc, so, se = run_command('git rev-list --max-count=%s HEAD' % args.count, cwd=args.checkoutdir)
+    commits = so.decode('utf-8').split()
+
+    rows = [
+        ('blob', timed(show, paths), timed(lambda x: reader.get_blob('HEAD', x), paths)),
+        ('commit files', timed(show_commit, commits), timed(reader.get_commit_files, commits)),
+    ]
+    reader.close()
+
+    print('%-14s %12s %12s %8s' % ('lookup', 'shell ms', 'reader ms', 'speedup'))
+    for name, shell, batch in rows:
+        print('%-14s %12.3f %12.3f %7.1fx' % (name, shell, batch, shell / batch if batch else 0))
+
+
+if __name__ == '__main__':
+    main()
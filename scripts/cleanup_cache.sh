@@ -1,5 +1,6 @@
 #!/bin/bash
 
-CACHEDIR=~/.ansibullbot/cache/shippable.runs/.raw
+# the bot can do this itself with all of its budgets: triage_ansible.py --gc-cache
+CACHEDIR=~/.ansibullbot/cache/azp.runs
 
 find $CACHEDIR -type f -atime +2 | xargs rm -f
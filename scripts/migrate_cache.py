@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+
+# Move the per issue cache files (issue.pickle, files.pickle, history.pickle,
+# timeline_*.json, pr_snapshot.json and meta.json) into the per repo store.
+# Run it once with the bot stopped, the bot rebuilds anything not migrated.
+
+import argparse
+import logging
+import os
+
+from ansibullbot.utils.cache_store import migrate_repo
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cachedir', default='~/.ansibullbot/cache',
+                        help='the cachedir_base of the bot')
+    parser.add_argument('--remove', action='store_true',
+                        help='delete the migrated files, meta.json is kept')
+    parser.add_argument('repos', nargs='*',
+                        help='owner/repo to migrate, default is every repo in the cachedir')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    cachedir = os.path.expanduser(args.cachedir)
+    repos = args.repos
+    if not repos:
+        for owner in sorted(os.listdir(cachedir)):
+            if not os.path.isdir(os.path.join(cachedir, owner)):
+                continue
+            for repo in sorted(os.listdir(os.path.join(cachedir, owner))):
+                if os.path.isdir(os.path.join(cachedir, owner, repo, 'issues')):
+                    repos.append('%s/%s' % (owner, repo))
+
+    for repo in repos:
+        logging.info('migrating %s' % repo)
+        migrate_repo(os.path.join(cachedir, repo), remove=args.remove)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,9 @@
+import time
+
 from unittest.mock import patch
 
-from ansibullbot.decorators.github import get_rate_limit
+from ansibullbot.decorators.github import RateLimited, get_rate_limit
+from ansibullbot.utils.ratelimits import TokenPool
 
 
 class RequestsResponseMock:
@@ -51,3 +54,29 @@ def test_get_rate_limit(mock_requests_get):
     assert 'reset' in limit['resources']['core']
     assert limit['resources']['core']['limit'] == 5000
     assert limit['resources']['core']['remaining'] == 5000
+
+
+TRACKER = TokenPool(['abcde12345'])
+
+
+@patch('ansibullbot.decorators.github.C.DEFAULT_RATELIMIT', True)
+@patch('ansibullbot.decorators.github.RATELIMITS', TRACKER)
+@patch('ansibullbot.decorators.github.save_rate_limit')
+@patch('ansibullbot.decorators.github.requests.get')
+def test_ratelimited_uses_tracked_quota(mock_requests_get, mock_save):
+
+    '''Decorated calls draw from the in memory quota, not the database'''
+
+    TRACKER.update_from_json({
+        'resources': {'core': {'limit': 5000, 'remaining': 50, 'reset': int(time.time()) + 600}}
+    })
+
+    @RateLimited
+    def call(x):
+        return x * 2
+
+    assert call(2) == 4
+    assert call(3) == 6
+    assert TRACKER.remaining() == 48
+    assert mock_save.call_count == 2
+    mock_requests_get.assert_not_called()
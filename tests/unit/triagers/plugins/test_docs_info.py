@@ -1,5 +1,7 @@
 import pytest
 
+from unittest.mock import Mock, PropertyMock
+
 from ansibullbot.triagers.plugins.docs_info import get_docs_facts
 from tests.utils.issue_mock import IssueMock
 
@@ -54,3 +56,21 @@ def test_docs_facts(iw_fixture):
     facts = get_docs_facts(iw)
     for key, val in expects.items():
         assert facts[key] == val
+
+def test_docs_facts_fetch_patches_only_when_needed():
+    iw = Mock()
+    iw.is_pullrequest.return_value = True
+    rest_pr_files = PropertyMock(return_value=[])
+    type(iw).rest_pr_files = rest_pr_files
+
+    # files from a graphql snapshot have no patches
+    iw.pr_files = [Mock(raw_data={'filename': 'docs/docsite/rst/index.rst', 'status': 'modified'})]
+    assert get_docs_facts(iw) == {'is_docs_only': True}
+    rest_pr_files.assert_not_called()
+
+    iw.pr_files.append(Mock(raw_data={'filename': 'lib/ansible/modules/foo.py', 'status': 'modified'}))
+    rest_pr_files.return_value = [
+        Mock(raw_data={'filename': 'lib/ansible/modules/foo.py', 'status': 'modified', 'patch': '@@ -1,1 +1,1 @@\n-x\n+y'}),
+    ]
+    assert get_docs_facts(iw) == {'is_docs_only': False}
+    rest_pr_files.assert_called_once_with()
@@ -14,6 +14,7 @@ from ansibullbot.triagers.plugins.shipit import get_automerge_facts
 from ansibullbot.triagers.plugins.shipit import get_review_facts
 from ansibullbot.triagers.plugins.shipit import get_shipit_facts
 from ansibullbot.triagers.plugins.shipit import is_approval
+from ansibullbot.utils.command_table import CommandTable
 from ansibullbot.wrappers.issuewrapper import IssueWrapper
 
 
@@ -31,6 +32,10 @@ class HistoryWrapperMock:
     def __init__(self):
         self.history = []
 
+    @property
+    def command_table(self):
+        return CommandTable(self.history)
+
 
 class IssueWrapperMock:
     _is_pullrequest = False
@@ -0,0 +1,124 @@
+import os
+import random
+import tempfile
+import time
+from argparse import Namespace
+from unittest.mock import Mock
+
+from ansibullbot.triagers.ansible import AnsibleActions, AnsibleTriage
+from ansibullbot.utils.cache_store import get_store
+from ansibullbot.utils.fingerprint import get_triage_fingerprint
+
+
+class IteratorMock:
+    def __init__(self, numbers):
+        self.numbers = numbers
+
+
+def fake_worker(repopath, repodata, work_q, result_q):
+    pid = os.getpid()
+    for number in iter(work_q.get, None):
+        time.sleep(random.random() / 100)
+        result_q.put(('issue', pid, number, 0.1))
+    result_q.put(('exit', pid))
+
+
+def test_run_workers_aggregates_results():
+    numbers = list(range(30, 0, -1))
+    resumes = []
+
+    at = AnsibleTriage.__new__(AnsibleTriage)
+    at.args = Namespace(workers=3)
+    at.repos = {'ansible/ansible': {'processed': []}}
+    at.set_resume = lambda repopath, number: resumes.append(number)
+    at._triage_worker = fake_worker
+
+    repodata = {'issues': IteratorMock(numbers)}
+    count = at.run_workers('ansible/ansible', repodata)
+
+    assert count == len(numbers)
+    assert sorted(at.repos['ansible/ansible']['processed']) == sorted(numbers)
+    # the resume point only ever moves forward through the queue order
+    assert resumes == sorted(resumes, reverse=True)
+    assert resumes[-1] == numbers[-1]
+
+
+def test_get_stale_numbers_uses_meta_index():
+    with tempfile.TemporaryDirectory() as cachedir:
+        store = get_store(os.path.join(cachedir, 'ansible/ansible'))
+        store.put_meta(1, {'updated_at': '2021-01-01T00:00:00'})
+        store.put_meta(2, {'updated_at': '2021-01-01T00:00:00'})
+        store.flush()
+        # 2 was last triaged long ago
+        with store.connection as conn:
+            conn.execute('UPDATE meta_index SET last_processed = 0 WHERE number = 2')
+
+        at = AnsibleTriage.__new__(AnsibleTriage)
+        at.cachedir_base = cachedir
+        at.issue_summaries = {'ansible/ansible': {
+            '1': {'state': 'open'},
+            '2': {'state': 'open'},
+            '3': {'state': 'open'},
+            '4': {'state': 'closed'},
+        }}
+
+        assert at.get_stale_numbers('ansible/ansible') == [2, 3]
+
+
+def test_get_unchanged_numbers():
+    with tempfile.TemporaryDirectory() as cachedir:
+        store = get_store(os.path.join(cachedir, 'ansible/ansible'))
+        for number in range(1, 7):
+            store.put_meta(number, {'updated_at': '2021-01-01T00:00:00', 'needs_rebuild': number == 4})
+        store.flush()
+
+        at = AnsibleTriage.__new__(AnsibleTriage)
+        at.cachedir_base = cachedir
+        at.repos = {'ansible/ansible': {'stale': [6]}}
+        at.issue_summaries = {'ansible/ansible': {
+            '1': {'type': 'issue', 'updated_at': '2021-01-01T00:00:00Z'},
+            '2': {'type': 'issue', 'updated_at': '2021-01-02T00:00:00Z'},
+            '3': {'type': 'pullrequest', 'updated_at': '2021-01-01T00:00:00Z'},
+            '4': {'type': 'pullrequest', 'updated_at': '2021-01-01T00:00:00Z'},
+            '5': {'type': 'pullrequest', 'updated_at': '2021-01-01T00:00:00Z'},
+            '6': {'type': 'issue', 'updated_at': '2021-01-01T00:00:00Z'},
+            '7': {'type': 'issue', 'updated_at': '2021-01-01T00:00:00Z'},
+        }}
+        at.gqlc = Mock()
+        # the checks of 3 finished after its last update but before it was
+        # last triaged, those of 5 after that
+        later = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() + 3600))
+        at.gqlc.get_ci_updated_at.return_value = {3: '2021-01-01T02:00:00Z', 5: later}
+
+        unchanged = at.get_unchanged_numbers('ansible/ansible', list(range(1, 8)))
+
+        # 2 was updated, 4 needs a rebuild, 5 has new checks, 6 is stale
+        # and 7 was never triaged
+        assert unchanged == {1, 3}
+        at.gqlc.get_ci_updated_at.assert_called_once_with('ansible', 'ansible', [3, 5])
+
+
+def test_reuse_triage():
+    with tempfile.TemporaryDirectory() as cachedir:
+        iw = Mock()
+        iw.number = 1
+        iw.full_cachedir = os.path.join(cachedir, 'issues', '1')
+        iw.store = get_store(cachedir)
+
+        digests = {'code': '1', 'labels': '2'}
+        fp = get_triage_fingerprint(digests)
+
+        at = AnsibleTriage.__new__(AnsibleTriage)
+
+        # nothing stored yet
+        assert not at.reuse_triage(iw, AnsibleActions(), None, digests)
+
+        stored = {'fingerprint': fp, 'actions': {'newlabel': ['bug']}}
+        actions = AnsibleActions()
+        assert at.reuse_triage(iw, actions, stored, digests)
+        assert actions.newlabel == ['bug']
+        assert at.meta['fingerprint'] == fp
+        assert iw.store.get_json(1, 'meta')['fingerprint'] == fp
+
+        digests['labels'] = '3'
+        assert not at.reuse_triage(iw, AnsibleActions(), stored, digests)
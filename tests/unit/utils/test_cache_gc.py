@@ -0,0 +1,74 @@
+import os
+import tempfile
+import time
+
+from unittest import mock
+
+from ansibullbot.utils import cache_gc
+from ansibullbot.utils.cache_gc import CacheGC
+from ansibullbot.utils.cache_store import get_store
+from ansibullbot.utils.http_cache import HttpCacheStore
+
+
+def write_file(path, size, age_days):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    used = time.time() - age_days * cache_gc.DAY
+    os.utime(path, (used, used))
+
+
+@mock.patch.dict(cache_gc.NAMESPACES, {'azp.runs': (250, 30)}, clear=True)
+def test_collect_namespace_by_age_and_size():
+    with tempfile.TemporaryDirectory() as cachedir:
+        nsdir = os.path.join(cachedir, 'azp.runs')
+        write_file(os.path.join(nsdir, 'expired'), 10, 40)
+        write_file(os.path.join(nsdir, 'old'), 100, 3)
+        write_file(os.path.join(nsdir, 'older'), 100, 4)
+        write_file(os.path.join(nsdir, 'new'), 100, 1)
+        write_file(os.path.join(nsdir, 'newest'), 100, 0)
+
+        CacheGC(cachedir, lambda x: None).collect_namespace('azp.runs')
+
+        # the expired file goes, then the least recently used until it fits
+        assert sorted(os.listdir(nsdir)) == ['new', 'newest']
+
+
+def test_collect_repo_only_prunes_old_closed_issues():
+    with tempfile.TemporaryDirectory() as cachedir:
+        repodir = os.path.join(cachedir, 'ansible', 'ansible')
+        store = get_store(repodir)
+        for number in (1, 2, 3, 4):
+            store.put_json(number, 'meta', {'number': number})
+        store.flush()
+        os.makedirs(os.path.join(repodir, 'issues', '1'))
+
+        summaries = {
+            '1': {'state': 'closed', 'updated_at': '2020-01-01T00:00:00Z'},
+            '2': {'state': 'closed', 'updated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())},
+            '3': {'state': 'open', 'updated_at': '2020-01-01T00:00:00Z'},
+        }
+        gc = CacheGC(cachedir, get_summaries={'ansible/ansible': summaries}.get, closed_days=30)
+        assert gc.get_repos() == ['ansible/ansible']
+
+        gc.collect_repo('ansible/ansible')
+
+        # 2 is recent, 3 is open and the state of 4 is unknown
+        assert store.numbers() == {2, 3, 4}
+        assert not os.path.exists(os.path.join(repodir, 'issues', '1'))
+
+
+def test_http_cache_evict():
+    with tempfile.TemporaryDirectory() as cachedir:
+        store = HttpCacheStore(os.path.join(cachedir, 'http_cache.sqlite'))
+        for key in ('a', 'b', 'c'):
+            store.set(key, 'https://api.github.com/%s' % key, {}, os.urandom(1000))
+            time.sleep(0.01)
+        store.touch('a')
+
+        count, freed = store.evict(max_bytes=2500)
+
+        # b was used longest ago
+        assert count == 1
+        assert store.get('b') is None
+        assert store.get('a') is not None
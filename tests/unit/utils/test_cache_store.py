@@ -0,0 +1,103 @@
+import datetime
+import json
+import os
+import pickle
+import tempfile
+
+from ansibullbot.utils.cache_store import CacheStore, decode, encode, get_store, migrate_repo
+
+
+def test_encode_roundtrip():
+    data = {
+        'updated_at': datetime.datetime(2021, 1, 1, 10, 0),
+        'history': [{'created_at': datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc), 'id': 1}],
+    }
+    assert decode(encode(data)) == data
+
+
+def test_records_are_versioned_and_batched():
+    with tempfile.TemporaryDirectory() as cachedir:
+        store = CacheStore(os.path.join(cachedir, 'cache.sqlite'), batch_size=3)
+
+        store.put_json(1, 'meta', {'a': 1})
+        store.put(1, 'history', b'old', version=1)
+
+        # pending writes are visible before they are flushed
+        assert store.get_json(1, 'meta') == {'a': 1}
+        other = CacheStore(store.path)
+        assert other.get_json(1, 'meta') is None
+
+        # the third write fills the batch
+        store.put_json(2, 'meta', {'b': 2})
+        assert other.get_json(1, 'meta') == {'a': 1}
+
+        assert store.get(1, 'history', version=1) == b'old'
+        # a record in an older format is a miss
+        assert store.get_data(1, 'history') is None
+        store.put_data(1, 'history', {'version': 1.2})
+        assert store.get_data(1, 'history') == {'version': 1.2}
+        assert store.numbers() == {1, 2}
+
+        store.delete(1)
+        assert store.get_json(1, 'meta') is None
+        assert store.get_data(1, 'history') is None
+        assert store.get_json(2, 'meta') == {'b': 2}
+
+
+def test_migrate_repo():
+    with tempfile.TemporaryDirectory() as cachedir:
+        repodir = os.path.join(cachedir, 'ansible', 'ansible')
+        idir = os.path.join(repodir, 'issues', '10')
+        os.makedirs(idir)
+
+        history = {'version': 1.2, 'updated_at': datetime.datetime(2021, 1, 1), 'history': []}
+        with open(os.path.join(idir, 'history.pickle'), 'wb') as f:
+            pickle.dump(history, f)
+        with open(os.path.join(idir, 'meta.json'), 'w') as f:
+            f.write(json.dumps({'number': 10}))
+        with open(os.path.join(idir, 'timeline_meta.json'), 'w') as f:
+            f.write(json.dumps({'updated_at': '2021-01-01T00:00:00', 'url': 'x'}))
+        with open(os.path.join(idir, 'timeline_data.json'), 'w') as f:
+            f.write(json.dumps([{'id': 1}]))
+
+        assert migrate_repo(repodir, remove=True) == 3
+
+        store = get_store(repodir)
+        assert store.get_data(10, 'history') == history
+        assert store.get_json(10, 'meta') == {'number': 10}
+        assert store.get_json(10, 'timeline')['events'] == [{'id': 1}]
+
+        # meta.json is what the scripts read, it stays
+        assert sorted(os.listdir(idir)) == ['meta.json']
+
+
+def test_meta_index():
+    with tempfile.TemporaryDirectory() as cachedir:
+        path = os.path.join(cachedir, 'cache.sqlite')
+        store = CacheStore(path)
+        store.put_meta(1, {'updated_at': '2021-01-01T00:00:00', 'needs_rebuild': True, 'time': 'x'})
+        assert store.meta_index()[1].needs_rebuild
+        assert not store.meta_index()[1].admin_merge
+
+        # loaded once, then kept in step with put_meta
+        store.put_meta(2, {'updated_at': '2021-01-02T00:00:00'})
+        assert sorted(store.meta_index()) == [1, 2]
+        store.flush()
+        assert sorted(CacheStore(path).meta_index()) == [1, 2]
+
+        store.delete(1)
+        assert sorted(store.meta_index()) == [2]
+
+
+def test_meta_index_is_built_from_old_records():
+    with tempfile.TemporaryDirectory() as cachedir:
+        store = CacheStore(os.path.join(cachedir, 'cache.sqlite'))
+        store.put_json(5, 'meta', {'updated_at': '2021-01-01T00:00:00', 'time': '2021-01-03T00:00:00', 'admin_merge': 1})
+        store.put_json(6, 'meta', {'updated_at': '2021-01-01T00:00:00'})
+
+        index = store.meta_index()
+
+        # 6 has no time, it is stale until it is triaged again
+        assert sorted(index) == [5]
+        assert index[5].admin_merge
+        assert index[5].updated_at == '2021-01-01T00:00:00'
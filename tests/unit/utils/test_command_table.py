@@ -0,0 +1,57 @@
+import datetime
+
+from ansibullbot.utils.command_table import CommandTable, tokenize
+
+
+def test_tokenize():
+    words, commands = tokenize(
+        'shipit, looks good\n'
+        '+label easyfix\n'
+        '-label\n'
+        '!waffling needs_info\n'
+        '  !component =plugins/modules/foo.py\n'
+        '!component+plugins/modules/bar.py\n'
+        'shipit !needs_info /rebuild_failed'
+    )
+    assert 'shipit,' in words
+    assert commands == [
+        ('+label', 'easyfix'),
+        # a command word counts wherever it is
+        ('needs_info', None),
+        ('!waffling', 'needs_info'),
+        ('!component', '=plugins/modules/foo.py'),
+        ('!component', '+plugins/modules/bar.py'),
+        ('shipit', None),
+        ('!needs_info', None),
+        ('/rebuild_failed', None),
+    ]
+
+
+def test_command_table():
+    day = datetime.datetime(2021, 1, 1)
+    history = [
+        {'event': 'commented', 'actor': 'jimi-c', 'body': 'bot_skip', 'created_at': day},
+        {'event': 'labeled', 'actor': 'jimi-c', 'label': 'bug', 'created_at': day},
+        {'event': 'commented', 'actor': 'ansibot', 'body': 'shipit', 'created_at': day},
+        {'event': 'review_approved', 'actor': 'bcoca', 'body': 'LGTM', 'created_at': day},
+        {'event': 'commented', 'actor': 'bcoca', 'body': 'bot_skip\n!bot_skip\n+label easyfix', 'created_at': day},
+        {'event': 'commented', 'actor': 'bcoca', 'body': '_From @jimi-c_ bot_skip', 'created_at': day},
+        {'event': 'review_comment', 'actor': 'bcoca', 'body': None, 'created_at': day},
+    ]
+    table = CommandTable(history, botnames=['ansibot'])
+
+    assert [x.position for x in table.find('bot_skip')] == [0, 4, 5]
+    assert [x.position for x in table.find('bot_skip', ['bcoca'])] == [4, 5]
+    assert [(x.position, x.command) for x in table.find(['+label', '!bot_skip'])] == [
+        (4, '!bot_skip'), (4, '+label'),
+    ]
+    assert table.find('LGTM') == []
+    assert [x.actor for x in table.find('LGTM', event=None)] == ['bcoca']
+    assert table.mirrored == {5}
+
+    assert table.is_active(0, 'bot_skip')
+    assert not table.is_active(4, 'bot_skip')
+    assert table.is_active(4, '!bot_skip')
+    assert table.is_approval(3)
+    assert not table.is_approval(2)
+    assert not table.is_approval(6)
@@ -604,3 +604,19 @@ class TestComponentMatcherInheritance(TestCase):
 
         # make sure the support level is applied
         assert result['support'] == 'core'
+
+
+def test_ties_resolve_to_the_first_path_in_sorted_order():
+    '''The file matchers return the first match, the files are iterated in sorted order'''
+    with tempfile.TemporaryDirectory() as cachedir:
+        gitrepo = GitRepoWrapper(cachedir, None)
+        gitrepo._files = [
+            'plugins/modules/y/a/foo.py',
+            'plugins/modules/x/a/foo.py',
+        ]
+        matcher = ComponentMatcher.__new__(ComponentMatcher)
+        matcher.gitrepo = gitrepo
+        matcher.MODULES = {}
+
+        assert matcher.find_module_match('a/foo') == 'plugins/modules/x/a/foo.py'
+        assert matcher.search_by_filepath('a/foo.py', context='plugins/modules/') == ['plugins/modules/x/a/foo.py']
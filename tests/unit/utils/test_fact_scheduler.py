@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from ansibullbot.utils.fact_scheduler import FactPlugin, FactScheduler
+
+
+def make_plugins(calls=None):
+    def slow(name, facts):
+        def func(meta):
+            time.sleep(0.01)
+            if calls is not None:
+                calls.append((name, threading.current_thread().name))
+            return facts(meta)
+        return func
+
+    return [
+        FactPlugin('a', slow('a', lambda meta: {'x': 1}), writes=('x',)),
+        FactPlugin('b', slow('b', lambda meta: {'y': 2}), writes=('y',)),
+        FactPlugin('c', slow('c', lambda meta: {'z': meta['x'] + meta['y']}), reads=('x', 'y'), writes=('z',)),
+        FactPlugin('d', slow('d', lambda meta: {'x': 10, 'w': 0}), writes=('x', 'w')),
+        FactPlugin('e', slow('e', lambda meta: {'v': meta['x'] * meta['z']}), reads=('x', 'z'), writes=('v',)),
+        FactPlugin('f', slow('f', lambda meta: {'u': True}), writes=('u',)),
+    ]
+
+
+def test_dependencies():
+    scheduler = FactScheduler(make_plugins())
+
+    assert scheduler.deps['a'] == set()
+    assert scheduler.deps['b'] == set()
+    assert scheduler.deps['c'] == {'a', 'b'}
+    # d overwrites a key that a wrote and c read
+    assert scheduler.deps['d'] == {'a', 'c'}
+    assert scheduler.deps['e'] == {'a', 'c', 'd'}
+    assert scheduler.deps['f'] == set()
+
+
+def test_run_matches_serial():
+    serial = FactScheduler(make_plugins()).run_serial({})
+
+    calls = []
+    concurrent = FactScheduler(make_plugins(calls)).run({})
+
+    assert concurrent == serial
+    assert list(concurrent.keys()) == list(serial.keys())
+    assert concurrent['z'] == 3
+    assert concurrent['v'] == 30
+    assert len({x[1] for x in calls}) > 1
+
+
+def test_shared_objects_are_used_serially():
+    active = []
+    overlaps = []
+
+    def use_ci(name):
+        def func(meta):
+            active.append(name)
+            if len(active) > 1:
+                overlaps.append(tuple(active))
+            time.sleep(0.01)
+            active.remove(name)
+            return {name: True}
+        return func
+
+    plugins = [FactPlugin(x, use_ci(x), writes=(x,), uses=('ci',)) for x in 'abc']
+    plugins.append(FactPlugin('d', lambda meta: {'d': True}, writes=('d',)))
+    scheduler = FactScheduler(plugins)
+
+    assert scheduler.deps['c'] == {'a', 'b'}
+    assert scheduler.deps['d'] == set()
+    assert scheduler.run({}) == {'a': True, 'b': True, 'c': True, 'd': True}
+    assert overlaps == []
+
+
+def test_duplicate_names():
+    plugins = [FactPlugin('a', lambda meta: {}), FactPlugin('a', lambda meta: {})]
+    with pytest.raises(ValueError):
+        FactScheduler(plugins)
+
+
+def test_errors_are_raised():
+    def broken(meta):
+        raise KeyError('x')
+
+    scheduler = FactScheduler([FactPlugin('a', broken, reads=('x',))])
+    with pytest.raises(KeyError):
+        scheduler.run({})
+
+
+def test_reuse_unchanged_plugins():
+    calls = []
+    plugins = make_plugins(calls)
+    for plugin in plugins:
+        plugin.inputs = frozenset(['ci'] if plugin.name == 'b' else ['history'])
+    digests = {'code': '1', 'history': '1', 'ci': '1'}
+
+    scheduler = FactScheduler(plugins)
+    previous = scheduler.run({})
+    groups = scheduler.get_groups(digests)
+    # d overwrites the x of a, which c read
+    assert groups['a']['shadowed'] == {'x': 1}
+
+    digests['ci'] = '2'
+    stale = scheduler.get_stale(digests, groups)
+    assert stale == {'b', 'c', 'd', 'e'}
+
+    calls[:] = []
+    reused = scheduler.get_reused(groups, previous, stale)
+    meta = scheduler.run({}, reused=reused)
+    assert sorted(x[0] for x in calls) == ['b', 'c', 'd', 'e']
+    assert meta == FactScheduler(make_plugins()).run_serial({})
+    assert list(meta) == list(previous)
+
+    calls[:] = []
+    assert scheduler.run_serial({}, reused=reused) == meta
+    assert sorted(x[0] for x in calls) == ['b', 'c', 'd', 'e']
@@ -0,0 +1,68 @@
+import datetime
+from unittest.mock import Mock
+
+from ansibullbot.utils.fingerprint import get_input_digests, get_triage_fingerprint, git_blob_sha
+
+
+def get_iw(labels=None, head='abc'):
+    iw = Mock()
+    iw.history.history = [
+        {'id': 1, 'event': 'labeled', 'actor': 'foo', 'label': 'bug',
+         'created_at': datetime.datetime(2021, 1, 1)},
+    ]
+    iw.title = 'foo'
+    iw.body = 'bar'
+    iw.state = 'open'
+    iw.submitter = 'foo'
+    iw.created_at = datetime.datetime(2021, 1, 1)
+    iw.html_url = 'https://github.com/ansible/ansible/pull/1'
+    iw.labels = labels or ['bug']
+    iw.assignees = []
+    iw.is_pullrequest.return_value = True
+    iw.pullrequest = Mock(
+        state='open', merged=False, draft=False, mergeable=True, mergeable_state='clean'
+    )
+    iw.pullrequest.head.sha = head
+    iw.pullrequest.base.ref = 'devel'
+    iw.reviews = [{'id': 1, 'user': {'login': 'bar'}, 'state': 'COMMENTED', 'commit_id': head}]
+    return iw
+
+
+def get_fingerprint(iw, **kwargs):
+    return get_triage_fingerprint(get_input_digests(iw, **kwargs))
+
+
+def test_git_blob_sha():
+    # git hash-object /dev/null
+    assert git_blob_sha(b'') == 'e69de29bb2d1d6434b8b29ae775ad8c2e48c5391'
+    assert git_blob_sha('foo\n') == git_blob_sha(b'foo\n')
+
+
+def test_triage_fingerprint_follows_the_inputs():
+    fp = get_fingerprint(get_iw(), botmeta_sha='1', index_version='2')
+    assert fp == get_fingerprint(get_iw(), botmeta_sha='1', index_version='2')
+    assert fp != get_fingerprint(get_iw(labels=['bug', 'feature']), botmeta_sha='1', index_version='2')
+    assert fp != get_fingerprint(get_iw(head='def'), botmeta_sha='1', index_version='2')
+    assert fp != get_fingerprint(get_iw(), botmeta_sha='3', index_version='2')
+    assert fp != get_fingerprint(get_iw(), botmeta_sha='1', index_version='3')
+
+    ci = Mock(state='success', updated_at=datetime.datetime(2021, 1, 2))
+    assert fp != get_fingerprint(get_iw(), ci=ci, botmeta_sha='1', index_version='2')
+
+    iw = get_iw()
+    iw.pullrequest.mergeable_state = 'dirty'
+    assert fp != get_fingerprint(iw, botmeta_sha='1', index_version='2')
+
+    iw = get_iw()
+    iw.reviews[0]['state'] = 'APPROVED'
+    assert fp != get_fingerprint(iw, botmeta_sha='1', index_version='2')
+
+    assert fp != get_fingerprint(get_iw(), botmeta_sha='1', index_version='2', maintainer_team=['bar'])
+
+
+def test_input_digests():
+    iw = get_iw()
+    digests = get_input_digests(iw)
+    iw.labels = ['feature']
+    changed = get_input_digests(iw)
+    assert [x for x in digests if digests[x] != changed[x]] == ['labels']
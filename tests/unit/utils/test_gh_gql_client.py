@@ -0,0 +1,198 @@
+from unittest import mock
+
+from ansibullbot.utils.gh_gql_client import GithubGraphQLClient
+
+
+def make_node(number, typename='Issue', **kwargs):
+    node = {
+        '__typename': typename,
+        'id': 'node%s' % number,
+        'number': number,
+        'url': 'https://github.com/ansible/ansible/%s/%s' % ('pull' if typename == 'PullRequest' else 'issues', number),
+        'title': 'title %s' % number,
+        'body': 'body %s' % number,
+        'state': 'OPEN',
+        'createdAt': '2021-01-01T00:00:00Z',
+        'updatedAt': '2021-01-02T00:00:00Z',
+        'closedAt': None,
+        'author': {'__typename': 'User', 'login': 'jdoe'},
+        'labels': {'nodes': [{'name': 'bug'}]},
+        'assignees': {'nodes': [{'login': 'maintainer'}]},
+    }
+    node.update(kwargs)
+    return node
+
+
+class ResponseMock:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+def test_get_issue_batch():
+    queries = []
+
+    def fake_requests(payload, allowed_errors=None):
+        queries.append(payload['query'])
+        numbers = [int(x.split(':')[0].strip()[1:]) for x in payload['query'].split('\n') if 'issueOrPullRequest' in x]
+        repository = {}
+        for number in numbers:
+            if number == 3:
+                repository['i3'] = None
+            elif number % 2:
+                repository['i%s' % number] = make_node(number)
+            else:
+                repository['i%s' % number] = make_node(
+                    number, typename='PullRequest', state='MERGED', isDraft=True,
+                    mergeable='CONFLICTING', merged=True, mergedAt='2021-01-03T00:00:00Z',
+                    author=None,
+                )
+        return ResponseMock({'data': {'repository': repository}})
+
+    gqlc = GithubGraphQLClient('token')
+    with mock.patch.object(gqlc, 'requests', side_effect=fake_requests):
+        snapshots = gqlc.get_issue_batch('ansible', 'ansible', range(1, 8), batch_size=3)
+
+    assert len(queries) == 3
+    assert sorted(snapshots) == [1, 2, 4, 5, 6, 7]
+
+    issue = snapshots[1]
+    assert issue['type'] == 'issue'
+    assert issue['state'] == 'open'
+    assert issue['url'].endswith('/repos/ansible/ansible/issues/1')
+    assert issue['labels'] == ['bug']
+    assert issue['assignees'] == ['maintainer']
+    assert issue['user'] == {'login': 'jdoe', 'type': 'User'}
+
+    pr = snapshots[2]
+    assert pr['type'] == 'pullrequest'
+    assert pr['state'] == 'closed'
+    assert pr['draft'] is True
+    assert pr['mergeable'] is False
+    assert pr['user']['login'] == 'ghost'
+
+
+def make_commit(sha, parents=1, login='jdoe'):
+    return {
+        'commit': {
+            'oid': sha,
+            'url': 'https://github.com/ansible/ansible/commit/%s' % sha,
+            'message': 'commit %s' % sha,
+            'authoredDate': '2021-01-01T00:00:00Z',
+            'committedDate': '2021-01-01T00:00:01Z',
+            'parents': {'nodes': [{'oid': 'p%s' % x} for x in range(parents)]},
+            'author': {'name': 'J Doe', 'email': 'jdoe@example.com', 'user': {'login': login} if login else None},
+            'committer': {'name': 'GitHub', 'email': 'noreply@github.com', 'user': None},
+        }
+    }
+
+
+def test_get_pullrequest_snapshot_pages():
+    payloads = []
+
+    def fake_requests(payload, allowed_errors=None):
+        variables = dict(payload['variables'])
+        payloads.append(variables)
+        pr = {
+            'number': 1,
+            'updatedAt': '2021-01-02T00:00:00Z',
+            'headRefOid': 'abc',
+            'baseRefName': 'devel',
+            'headCommit': {'nodes': [{'commit': {
+                'oid': 'abc',
+                'statusCheckRollup': {'state': 'FAILURE'},
+                'checkSuites': {'nodes': [{
+                    'app': {'slug': 'azure-pipelines'},
+                    'checkRuns': {'nodes': [{
+                        'databaseId': 7,
+                        'name': 'CI',
+                        'status': 'COMPLETED',
+                        'conclusion': 'FAILURE',
+                        'detailsUrl': 'https://dev.azure.com/ansible/ansible/_build/results?buildId=1',
+                    }]},
+                }]},
+            }}]},
+        }
+        if variables['withFiles']:
+            pr['files'] = {
+                'pageInfo': {'endCursor': 'f1', 'hasNextPage': False},
+                'nodes': [{'path': 'lib/foo.py', 'additions': 1, 'deletions': 2, 'changeType': 'DELETED'}],
+            }
+        if variables['withCommits']:
+            # two pages of commits
+            if variables.get('commitsCursor') is None:
+                pr['commits'] = {
+                    'pageInfo': {'endCursor': 'c1', 'hasNextPage': True},
+                    'nodes': [make_commit('a1')],
+                }
+            else:
+                pr['commits'] = {
+                    'pageInfo': {'endCursor': 'c2', 'hasNextPage': False},
+                    'nodes': [make_commit('a2', parents=2, login=None)],
+                }
+        if variables['withReviews']:
+            pr['reviews'] = {
+                'pageInfo': {'endCursor': 'r1', 'hasNextPage': False},
+                'nodes': [{
+                    'databaseId': 3,
+                    'state': 'APPROVED',
+                    'body': 'shipit',
+                    'submittedAt': '2021-01-01T10:00:00Z',
+                    'author': {'login': 'reviewer'},
+                    'commit': {'oid': 'a1'},
+                }],
+            }
+        return ResponseMock({'data': {'repository': {'pullRequest': pr}}})
+
+    gqlc = GithubGraphQLClient('token')
+    with mock.patch.object(gqlc, 'requests', side_effect=fake_requests):
+        snapshot = gqlc.get_pullrequest_snapshot('ansible', 'ansible', 1)
+
+    assert len(payloads) == 2
+    # the second page only asks for the unfinished connection
+    assert payloads[1]['withCommits']
+    assert not payloads[1]['withFiles']
+    assert not payloads[1]['withReviews']
+
+    assert snapshot['head_sha'] == 'abc'
+    assert snapshot['files'] == [{'filename': 'lib/foo.py', 'additions': 1, 'deletions': 2, 'status': 'removed'}]
+    assert [x['sha'] for x in snapshot['commits']] == ['a1', 'a2']
+    assert snapshot['commits'][0]['url'].endswith('/repos/ansible/ansible/commits/a1')
+    assert snapshot['commits'][1]['parents'] == ['p0', 'p1']
+    assert snapshot['commits'][1]['author']['login'] is None
+    assert snapshot['reviews'][0]['user'] == {'login': 'reviewer'}
+    assert snapshot['reviews'][0]['commit_id'] == 'a1'
+    assert snapshot['check_runs'][0]['details_url'].endswith('buildId=1')
+    assert snapshot['check_runs'][0]['conclusion'] == 'failure'
+    assert snapshot['status'] == 'failure'
+
+    payloads.clear()
+    with mock.patch.object(gqlc, 'requests', side_effect=fake_requests):
+        snapshot = gqlc.get_pullrequest_snapshot('ansible', 'ansible', 1, full=False)
+
+    assert len(payloads) == 1
+    assert snapshot['files'] == []
+    assert snapshot['commits'] == []
+    assert len(snapshot['reviews']) == 1
+
+
+def test_get_ci_updated_at():
+    def fake_requests(payload, allowed_errors=None):
+        assert 'p1: pullRequest(number: 1)' in payload['query']
+        contexts = [
+            {'__typename': 'CheckRun', 'startedAt': '2021-01-01T00:00:00Z', 'completedAt': '2021-01-01T01:00:00Z'},
+            {'__typename': 'StatusContext', 'createdAt': '2021-01-01T00:30:00Z'},
+        ]
+        return ResponseMock({'data': {'repository': {
+            'p1': {'commits': {'nodes': [{'commit': {'statusCheckRollup': {'contexts': {'nodes': contexts}}}}]}},
+            'p2': {'commits': {'nodes': [{'commit': {'statusCheckRollup': None}}]}},
+            'p3': None,
+        }}})
+
+    gqlc = GithubGraphQLClient('token')
+    with mock.patch.object(gqlc, 'requests', side_effect=fake_requests):
+        updated = gqlc.get_ci_updated_at('ansible', 'ansible', [1, 2, 3])
+
+    assert updated == {1: '2021-01-01T01:00:00Z', 2: None}
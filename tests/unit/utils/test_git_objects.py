@@ -0,0 +1,53 @@
+import os
+import subprocess
+import tempfile
+
+from ansibullbot.utils.git_objects import GitObjectReader
+
+
+def git(cwd, *args):
+    return subprocess.check_output(
+        ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com'] + list(args),
+        cwd=cwd, stderr=subprocess.DEVNULL,
+    ).decode('utf-8')
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(data)
+
+
+def test_reader_matches_git():
+    with tempfile.TemporaryDirectory() as repo:
+        write(os.path.join(repo, 'README.md'), 'readme')
+        write(os.path.join(repo, 'plugins/modules/foo.py'), 'foo')
+        write(os.path.join(repo, 'plugins/modules/bar.py'), 'bar')
+        git(repo, 'init', '-q')
+        git(repo, 'add', '.')
+        git(repo, 'commit', '-q', '-m', 'init')
+
+        write(os.path.join(repo, 'plugins/modules/foo.py'), 'foo2')
+        write(os.path.join(repo, 'plugins/module_utils/baz.py'), 'baz')
+        os.remove(os.path.join(repo, 'README.md'))
+        git(repo, 'add', '-A')
+        git(repo, 'commit', '-q', '-m', 'change')
+
+        reader = GitObjectReader(repo)
+        head = git(repo, 'rev-parse', 'HEAD').strip()
+        assert reader.rev_parse('HEAD') == head
+        assert reader.rev_parse('nope') is None
+
+        assert reader.get_blob('HEAD', 'plugins/modules/foo.py') == b'foo2'
+        assert reader.get_blob('HEAD^', 'plugins/modules/foo.py') == b'foo'
+        assert reader.get_blob('HEAD', 'README.md') is None
+
+        assert reader.list_files('HEAD') == git(repo, 'ls-tree', '-r', '--name-only', 'HEAD').split()
+        for rev in ('HEAD', 'HEAD^'):
+            expected = git(repo, 'show', '--pretty=', '--name-only', rev).split()
+            assert reader.get_commit_files(rev) == sorted(expected)
+
+        reader.close()
+        # it starts again on the next lookup
+        assert reader.rev_parse('HEAD') == head
+        reader.close()
@@ -0,0 +1,192 @@
+import os
+import subprocess
+import tempfile
+
+from unittest import mock
+
+from ansibullbot.utils.commit_index import CommitIndex
+from ansibullbot.utils.git_tools import FileIndex, GitRepoWrapper
+
+
+def git(cwd, *args):
+    subprocess.check_call(
+        ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com'] + list(args),
+        cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(data)
+
+
+def test_update_applies_the_diff():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        origin = os.path.join(tmpdir, 'origin')
+        write(os.path.join(origin, 'plugins/modules/foo.py'), 'foo')
+        write(os.path.join(origin, 'plugins/modules/bar.py'), 'bar')
+        git(origin, 'init', '-q')
+        git(origin, 'add', '.')
+        git(origin, 'commit', '-q', '-m', 'init')
+
+        gitrepo = GitRepoWrapper(os.path.join(tmpdir, 'cache'), origin)
+        assert gitrepo.exists('plugins/modules/foo.py')
+        old_head = gitrepo.head
+        nfiles = len(gitrepo.files)
+
+        git(origin, 'mv', 'plugins/modules/bar.py', 'plugins/modules/baz.py')
+        write(os.path.join(origin, 'plugins/modules/foo.py'), 'foo2')
+        git(origin, 'commit', '-q', '-am', 'change')
+
+        gitrepo.update()
+        assert gitrepo.head != old_head
+        assert gitrepo.get_changed_files(old_head, gitrepo.head) == {
+            'plugins/modules/foo.py', 'plugins/modules/bar.py', 'plugins/modules/baz.py',
+        }
+        assert gitrepo.exists('plugins/modules/baz.py')
+        assert not gitrepo.exists('plugins/modules/bar.py')
+        assert sorted(gitrepo.module_files) == ['plugins/modules/baz.py', 'plugins/modules/foo.py']
+
+        # a walk does not keep the files of the walk before
+        gitrepo.get_files(force=True)
+        assert len(gitrepo.files) >= nfiles
+        assert len(gitrepo.files) == len(set(gitrepo.files))
+
+
+def test_file_index():
+    index = FileIndex([
+        'plugins/modules/foo.py',
+        'plugins/modules/foo_info.py',
+        'plugins/module_utils/foo.py',
+        'tests/unit/plugins/modules/test_foo.py',
+        'plugins/modules/foo.py',
+    ])
+    assert len(index) == 4
+    assert 'plugins/modules/foo.py' in index
+    assert 'plugins/modules/bar.py' not in index
+    assert list(index) == sorted(index.pathset)
+
+    assert index.with_prefix('plugins/modules') == ['plugins/modules/foo.py', 'plugins/modules/foo_info.py']
+    assert index.with_prefix('plugins/modules/foo.') == ['plugins/modules/foo.py']
+    assert index.with_prefix('nope') == []
+
+    assert index.with_suffix('/foo.py') == ['plugins/module_utils/foo.py', 'plugins/modules/foo.py']
+    assert index.with_suffix('foo.py', 'foo_info.py') == [
+        'plugins/module_utils/foo.py', 'plugins/modules/foo.py', 'plugins/modules/foo_info.py',
+        'tests/unit/plugins/modules/test_foo.py',
+    ]
+
+
+def test_history_index():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        origin = os.path.join(tmpdir, 'origin')
+        write(os.path.join(origin, 'plugins/modules/foo.py'), 'foo\n' * 20)
+        git(origin, 'init', '-q')
+        git(origin, 'add', '.')
+        git(origin, 'commit', '-q', '-m', 'init')
+
+        gitrepo = GitRepoWrapper(os.path.join(tmpdir, 'cache'), origin)
+        first = gitrepo.head
+        assert gitrepo.existed('plugins/modules/foo.py')
+        assert not gitrepo.existed('plugins/modules/bar.py')
+        assert gitrepo.get_last_rev_for_file('plugins/modules/foo.py') == first
+
+        git(origin, 'mv', 'plugins/modules/foo.py', 'plugins/modules/bar.py')
+        git(origin, 'commit', '-q', '-m', 'rename')
+        git(origin, 'mv', 'plugins/modules/bar.py', 'plugins/modules/baz.py')
+        git(origin, 'commit', '-q', '-m', 'rename again')
+        gitrepo.update()
+
+        # the index picked up the new commits
+        assert gitrepo.existed('plugins/modules/bar.py')
+        assert gitrepo.get_last_rev_for_file('plugins/modules/baz.py') == gitrepo.head
+        assert gitrepo.get_last_rev_for_file('plugins/modules/foo.py') != first
+        assert gitrepo.get_rename_chain('plugins/modules/foo.py') == [
+            'plugins/modules/bar.py', 'plugins/modules/baz.py',
+        ]
+        assert gitrepo.get_file_content('plugins/modules/foo.py', follow=True) == b'foo\n' * 19 + b'foo'
+
+
+def test_commits_by_email():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        origin = os.path.join(tmpdir, 'origin')
+        write(os.path.join(origin, 'plugins/modules/foo.py'), 'foo')
+        git(origin, 'init', '-q')
+        git(origin, 'add', '.')
+        git(origin, 'commit', '-q', '-m', 'init')
+        write(os.path.join(origin, 'plugins/modules/foo.py'), 'foo2')
+        write(os.path.join(origin, 'plugins/modules/bar.py'), 'bar')
+        git(origin, 'add', '.')
+        git(origin, '-c', 'user.email=other@example.com', 'commit', '-q', '-m', 'other')
+
+        gitrepo = GitRepoWrapper(os.path.join(tmpdir, 'cache'), origin)
+        assert gitrepo.get_commits_by_email(['test@example.com', 'nobody@example.com']) == {
+            'test@example.com': {'commit_count': 1, 'commit_count_byfile': {'plugins/modules/foo.py': 1}},
+            'nobody@example.com': {'commit_count': 0, 'commit_count_byfile': {}},
+        }
+        assert gitrepo.get_commits_by_email('other@example.com')['other@example.com'] == {
+            'commit_count': 1,
+            'commit_count_byfile': {'plugins/modules/foo.py': 1, 'plugins/modules/bar.py': 1},
+        }
+
+        write(os.path.join(origin, 'plugins/modules/foo.py'), 'foo3')
+        git(origin, 'commit', '-q', '-am', 'change')
+        gitrepo.update()
+
+        # a new wrapper starts from the stored index and only reads the new commit
+        gitrepo = GitRepoWrapper(os.path.join(tmpdir, 'cache'), origin, rebase=False)
+        assert CommitIndex.load(gitrepo.checkoutdir).head != gitrepo.head
+        assert gitrepo.get_commits_by_email('test@example.com')['test@example.com'] == {
+            'commit_count': 2, 'commit_count_byfile': {'plugins/modules/foo.py': 2},
+        }
+        assert gitrepo.get_commit_index().head == gitrepo.head
+
+
+def test_commit_index_schema_version():
+    with tempfile.TemporaryDirectory() as checkoutdir:
+        os.makedirs(os.path.join(checkoutdir, '.git'))
+        index = CommitIndex()
+        index.add_commits([
+            ('a@example.com', ['foo.py', 'bar.py']),
+            ('b@example.com', ['foo.py']),
+            ('a@example.com', ['foo.py']),
+        ])
+        index.head = 'abc'
+        index.save(checkoutdir)
+
+        loaded = CommitIndex.load(checkoutdir)
+        assert loaded.head == 'abc'
+        assert loaded.get('a@example.com') == {
+            'commit_count': 2, 'commit_count_byfile': {'foo.py': 2, 'bar.py': 1},
+        }
+        assert loaded.to_dict() == index.to_dict()
+
+        # an index of another schema is a miss
+        with mock.patch.object(CommitIndex, 'SCHEMA_VERSION', CommitIndex.SCHEMA_VERSION + 1):
+            assert CommitIndex.load(checkoutdir) is None
+
+
+def test_branch_of_a_worktree():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        origin = os.path.join(tmpdir, 'origin')
+        write(os.path.join(origin, 'plugins/modules/foo.py'), 'foo')
+        git(origin, 'init', '-q')
+        git(origin, 'checkout', '-q', '-b', 'devel')
+        git(origin, 'add', '.')
+        git(origin, 'commit', '-q', '-m', 'init')
+        worktree = os.path.join(tmpdir, 'worktree')
+        git(origin, 'worktree', 'add', '-q', '-b', 'stable-2.9', worktree)
+
+        gitrepo = GitRepoWrapper(os.path.join(tmpdir, 'cache'), None)
+        gitrepo.checkoutdir = origin
+        assert gitrepo.branch == 'devel'
+
+        # .git is a file in a worktree
+        gitrepo = GitRepoWrapper(os.path.join(tmpdir, 'cache'), None)
+        gitrepo.checkoutdir = worktree
+        assert os.path.isfile(os.path.join(worktree, '.git'))
+        assert gitrepo.branch == 'stable-2.9'
+
+        git(worktree, 'checkout', '-q', '--detach')
+        assert gitrepo.branch == 'HEAD'
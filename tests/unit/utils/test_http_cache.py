@@ -0,0 +1,110 @@
+import json
+import tempfile
+
+from unittest import mock
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from github import Github
+
+from ansibullbot.utils import http_cache
+
+
+class GithubMock:
+    '''Answers like github, with a 304 when the etag matches'''
+
+    def __init__(self):
+        self.bodies = {}
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        body, etag = self.bodies[request.url]
+
+        resp = requests.Response()
+        resp.url = request.url
+        resp.request = request
+        resp.headers = CaseInsensitiveDict({'ETag': etag, 'X-RateLimit-Remaining': str(5000 - len(self.requests))})
+        if request.headers.get('If-None-Match') == etag:
+            resp.status_code = 304
+            resp._content = b''
+        else:
+            resp.status_code = 200
+            resp._content = body
+        return resp
+
+
+def test_conditional_requests():
+    github = GithubMock()
+    url = 'https://api.github.com/repos/ansible/ansible/issues/1/timeline'
+    github.bodies[url] = (b'[{"id": 1}]', '"abc"')
+
+    with tempfile.TemporaryDirectory() as cachedir, \
+            mock.patch.object(http_cache, 'STORE', None), \
+            mock.patch.object(HTTPAdapter, 'send', side_effect=github.send):
+        http_cache.configure(cachedir)
+        session = http_cache.new_session()
+        before = http_cache.get_stats()
+
+        assert session.get(url).json() == [{'id': 1}]
+        assert 'If-None-Match' not in github.requests[-1].headers
+
+        # unchanged, the 304 is answered from the cache
+        rr = session.get(url)
+        assert rr.status_code == 200
+        assert rr.json() == [{'id': 1}]
+        assert github.requests[-1].headers['If-None-Match'] == '"abc"'
+        assert rr.headers['X-RateLimit-Remaining'] == '4998'
+
+        # changed
+        github.bodies[url] = (b'[{"id": 1}, {"id": 2}]', '"def"')
+        assert len(session.get(url).json()) == 2
+
+        # another token does not share the cached response
+        session.get(url, headers={'Authorization': 'Bearer other'})
+        assert 'If-None-Match' not in github.requests[-1].headers
+
+        # commits never change, they do not need a request at all
+        commit_url = 'https://api.github.com/repos/ansible/ansible/commits/%s' % ('a' * 40)
+        github.bodies[commit_url] = (b'{"sha": "aaa"}', '"ghi"')
+        session.get(commit_url)
+        count = len(github.requests)
+        assert session.get(commit_url).json() == {'sha': 'aaa'}
+        assert len(github.requests) == count
+
+        # POSTs pass through
+        github.bodies['https://api.github.com/graphql'] = (b'{}', '"jkl"')
+        session.post('https://api.github.com/graphql', data='{}')
+
+        stats = http_cache.get_stats()
+        assert stats['misses'] - before['misses'] == 4
+        assert stats['not_modified'] - before['not_modified'] == 1
+        assert stats['hits'] - before['hits'] == 1
+        assert stats['uncached'] - before['uncached'] == 1
+
+
+def test_pygithub_update():
+    github = GithubMock()
+    url = 'https://api.github.com:443/repos/ansible/ansible/issues/1'
+    issue_url = 'https://api.github.com/repos/ansible/ansible/issues/1'
+    github.bodies[url] = (json.dumps({'url': issue_url, 'number': 1, 'title': 'foo'}).encode('utf-8'), '"abc"')
+
+    with tempfile.TemporaryDirectory() as cachedir, \
+            mock.patch.object(http_cache, 'STORE', None), \
+            mock.patch.object(HTTPAdapter, 'send', side_effect=github.send):
+        http_cache.configure(cachedir)
+        gh = Github()
+        http_cache.mount(gh._Github__requester._Requester__createConnection().session)
+
+        issue = gh.get_repo('ansible/ansible', lazy=True).get_issue(1)
+        assert issue.title == 'foo'
+
+        # update() sends its own etag and relies on the 304 to see no change
+        assert not issue.update()
+        assert github.requests[-1].headers['If-None-Match'] == '"abc"'
+
+        github.bodies[url] = (json.dumps({'url': issue_url, 'number': 1, 'title': 'bar'}).encode('utf-8'), '"def"')
+        assert issue.update()
+        assert issue.title == 'bar'
@@ -0,0 +1,48 @@
+import datetime
+import tempfile
+
+from unittest import mock
+
+from ansibullbot.utils import index_snapshot
+from ansibullbot.utils.index_snapshot import get_base_key, load_snapshot, save_snapshot
+from ansibullbot.utils.version_tools import AnsibleVersionIndexer
+
+
+def test_snapshot_roundtrip():
+    with tempfile.TemporaryDirectory() as cachedir:
+        snapshot = {
+            'base_key': get_base_key('123'),
+            'head': 'abc',
+            'refs_sha': 'def',
+            'indexers': {
+                'version_indexer': {'VALIDVERSIONS': {b'2.9': 'branch', '2.10': 'tag'}},
+                'module_indexer': {
+                    'commits': {'lib/foo.py': [{'hash': 'abc', 'date': datetime.datetime(2021, 1, 1, 10)}]},
+                    'keys': (1, 'a'),
+                    'authors': {'jdoe'},
+                    'numbers': {1: {'__set__': 'not a tag'}},
+                    'added': datetime.date(2021, 1, 1),
+                },
+            },
+        }
+        assert load_snapshot(cachedir, 'ansible/ansible', get_base_key('123')) is None
+
+        save_snapshot(cachedir, 'ansible/ansible', snapshot)
+        assert load_snapshot(cachedir, 'ansible/ansible', get_base_key('123')) == snapshot
+        # another botmeta or other options
+        assert load_snapshot(cachedir, 'ansible/ansible', get_base_key('456')) is None
+        assert load_snapshot(cachedir, 'ansible/ansible', get_base_key('123', {'commits': False})) is None
+
+        # a snapshot of another schema is a miss
+        with mock.patch.object(index_snapshot, 'SCHEMA_VERSION', index_snapshot.SCHEMA_VERSION + 1):
+            assert load_snapshot(cachedir, 'ansible/ansible', get_base_key('123')) is None
+
+
+def test_version_indexer_state():
+    state = {
+        'VALIDVERSIONS': {b'2.9': 'branch'},
+        'commit_versions_cache': {'abc': '2.9.0'},
+        'DATEVERSIONS': None,
+    }
+    indexer = AnsibleVersionIndexer('/nonexistent', state=state)
+    assert indexer.get_state() == state
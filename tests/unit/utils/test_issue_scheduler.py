@@ -0,0 +1,46 @@
+from ansibullbot.utils.issue_scheduler import QuotaScheduler
+from ansibullbot.utils.iterators import RepoIssuesIterator
+
+
+class RateLimitsMock:
+    def __init__(self, remaining):
+        self._remaining = remaining
+
+    def known(self):
+        return True
+
+    def remaining(self, resource='core'):
+        return self._remaining
+
+
+class RepoMock:
+    def get_issue(self, number):
+        return number
+
+
+COSTS = {10: 25, 9: 1, 8: 8, 7: 1, 6: 25, 5: 1}
+
+
+def test_order_is_kept_with_enough_quota():
+    scheduler = QuotaScheduler(COSTS.get, reserve=500, ratelimits=RateLimitsMock(4000))
+    numbers = [10, 9, 8, 7, 6, 5]
+    assert scheduler.reorder(numbers) == numbers
+
+
+def test_expensive_issues_are_parked():
+    ratelimits = RateLimitsMock(12)
+    scheduler = QuotaScheduler(COSTS.get, reserve=500, ratelimits=ratelimits)
+
+    # the cheap ones first, what does not fit waits for the reset
+    assert scheduler.reorder([10, 9, 8, 7, 6, 5]) == [9, 7, 5, 8, 10, 6]
+    assert scheduler.parked == {10, 6}
+
+    ratelimits._remaining = 5000
+    assert scheduler.reorder([10, 6]) == [10, 6]
+    assert scheduler.parked == set()
+
+
+def test_iterator_follows_the_scheduler():
+    scheduler = QuotaScheduler(COSTS.get, reserve=500, ratelimits=RateLimitsMock(2))
+    ri = RepoIssuesIterator(RepoMock(), [10, 9, 8, 7, 6, 5], scheduler=scheduler)
+    assert list(ri) == [9, 7, 5, 10, 8, 6]
@@ -0,0 +1,102 @@
+import threading
+
+from ansibullbot.utils.iterators import RepoIssuesIterator
+
+
+class IssueMock:
+    def __init__(self, number):
+        self.number = number
+
+
+class RepoMock:
+    def __init__(self):
+        self.fetched = []
+
+    def get_issue(self, number):
+        self.fetched.append(number)
+        return IssueMock(number)
+
+
+def test_iterator_serial():
+    repo = RepoMock()
+    cached = IssueMock(2)
+    ri = RepoIssuesIterator(repo, [3, 2, 1], issuecache={2: cached})
+
+    issues = list(ri)
+
+    assert [x.number for x in issues] == [3, 2, 1]
+    assert issues[1] is cached
+    assert repo.fetched == [3, 1]
+    assert ri.prefetched == {}
+
+
+def test_iterator_prefetch_keeps_order():
+    repo = RepoMock()
+    cached = IssueMock(5)
+    threads = set()
+
+    def prefetcher(number, issue):
+        threads.add(threading.current_thread().name)
+        if issue is None:
+            issue = IssueMock(number)
+        return issue, 'data-%s' % number
+
+    numbers = list(range(20, 0, -1))
+    ri = RepoIssuesIterator(repo, numbers, issuecache={5: cached}, prefetch=4, prefetcher=prefetcher)
+
+    issues = list(ri)
+
+    assert [x.number for x in issues] == numbers
+    assert issues[numbers.index(5)] is cached
+    assert ri.prefetched[5] == 'data-5'
+    assert len(ri.prefetched) == len(numbers)
+    assert threading.current_thread().name not in threads
+    # everything went through the prefetcher
+    assert repo.fetched == []
+
+
+def test_iterator_prefetch_requires_prefetcher():
+    repo = RepoMock()
+    ri = RepoIssuesIterator(repo, [1, 2], prefetch=8)
+
+    assert [x.number for x in ri] == [1, 2]
+    assert repo.fetched == [1, 2]
+
+
+def test_iterator_batches():
+    repo = RepoMock()
+    batches = []
+
+    def batcher(numbers):
+        batches.append(numbers)
+        # pretend 4 does not exist anymore
+        return {x: IssueMock(x) for x in numbers if x != 4}
+
+    ri = RepoIssuesIterator(repo, [1, 2, 3, 4, 5, 6, 7], issuecache={2: IssueMock(2)}, batcher=batcher, batch_size=3)
+
+    assert [x.number for x in ri] == [1, 2, 3, 4, 5, 6, 7]
+    assert batches == [[1, 3], [4, 5, 6], [7]]
+    assert repo.fetched == [4]
+
+
+class SchedulerMock:
+    '''Parks 4 and 3 once 5 was handed out'''
+
+    def reorder(self, numbers):
+        if 5 in numbers:
+            return numbers
+        return [x for x in numbers if x not in (4, 3)] + [x for x in numbers if x in (4, 3)]
+
+
+def test_iterator_resume_skips_no_parked_number():
+    repo = RepoMock()
+    ri = RepoIssuesIterator(repo, [5, 4, 3, 2, 1], scheduler=SchedulerMock())
+
+    handed_out = []
+    resumes = []
+    for issue in ri:
+        handed_out.append(issue.number)
+        resumes.append(ri.resume_number)
+
+    assert handed_out == [5, 2, 1, 4, 3]
+    assert resumes == [5, 4, 4, 4, 3]
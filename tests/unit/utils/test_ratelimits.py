@@ -0,0 +1,131 @@
+import multiprocessing
+import time
+
+from ansibullbot.utils.ratelimits import RateLimitTracker, TokenPool
+
+
+def headers(remaining, reset, resource='core', limit=5000):
+    return {
+        'X-RateLimit-Limit': str(limit),
+        'X-RateLimit-Remaining': str(remaining),
+        'X-RateLimit-Reset': str(reset),
+        'X-RateLimit-Resource': resource,
+    }
+
+
+def test_headers_update_the_bucket():
+    tracker = RateLimitTracker()
+    assert not tracker.known()
+    assert tracker.acquire() == 0
+
+    reset = int(time.time()) + 600
+    tracker.update_from_headers(headers(2, reset))
+    tracker.update_from_headers(headers(4000, reset, resource='graphql'))
+    tracker.update_from_headers({'Content-Type': 'application/json'})
+
+    assert tracker.known()
+    assert tracker.remaining() == 2
+    assert tracker.remaining('graphql') == 4000
+
+    assert tracker.acquire() == 0
+    assert tracker.acquire() == 0
+    assert 590 < tracker.acquire() <= 605
+    assert tracker.remaining() == 0
+
+    assert tracker.to_json()['resources']['core'] == {'limit': 5000, 'remaining': 0, 'reset': reset}
+
+
+def test_bucket_refills_after_reset():
+    tracker = RateLimitTracker()
+    tracker.update_from_json({
+        'resources': {'core': {'limit': 5000, 'remaining': 0, 'reset': int(time.time()) - 1}}
+    })
+
+    assert tracker.remaining() == 5000
+    assert tracker.acquire() == 0
+    assert tracker.remaining() == 4999
+
+
+def _acquire(tracker):
+    for _ in range(10):
+        tracker.acquire()
+
+
+def test_shared_with_forked_workers():
+    tracker = RateLimitTracker()
+    tracker.update_from_headers(headers(100, int(time.time()) + 600))
+
+    ctx = multiprocessing.get_context('fork')
+    procs = [ctx.Process(target=_acquire, args=(tracker,)) for _ in range(3)]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+
+    assert tracker.remaining() == 70
+
+
+def test_only_one_persist_per_interval():
+    tracker = RateLimitTracker()
+    assert tracker.should_persist(60)
+    assert not tracker.should_persist(60)
+    assert tracker.should_persist(60, force=True)
+
+
+class RequestMock:
+    def __init__(self, method, path, token):
+        self.method = method
+        self.path_url = path
+        self.headers = {'Authorization': 'token %s' % token}
+
+
+class ResponseMock:
+    def __init__(self, request, headers):
+        self.request = request
+        self.headers = headers
+
+
+def test_pool_routes_reads_to_the_most_headroom():
+    pool = TokenPool(['aaaa', 'bbbb'])
+    reset = int(time.time()) + 600
+
+    # unknown tokens get tried so their numbers come back in the headers
+    request = RequestMock('GET', '/repos/ansible/ansible', 'aaaa')
+    pool.route(request)
+    pool.update_from_response(ResponseMock(request, headers(10, reset)))
+    request = RequestMock('GET', '/repos/ansible/ansible', 'aaaa')
+    pool.route(request)
+    assert request.headers['Authorization'] == 'token bbbb'
+    pool.update_from_response(ResponseMock(request, headers(4000, reset)))
+
+    request = RequestMock('GET', '/repos/ansible/ansible/issues/1', 'aaaa')
+    pool.route(request)
+    assert request.headers['Authorization'] == 'token bbbb'
+
+    # graphql quota is separate
+    pool.update_from_json({'resources': {'graphql': {'limit': 5000, 'remaining': 4500, 'reset': reset}}}, token='aaaa')
+    pool.update_from_json({'resources': {'graphql': {'limit': 5000, 'remaining': 1, 'reset': reset}}}, token='bbbb')
+    request = RequestMock('POST', '/graphql', 'bbbb')
+    pool.route(request)
+    assert request.headers['Authorization'] == 'token aaaa'
+
+    # writes keep their token
+    request = RequestMock('POST', '/repos/ansible/ansible/issues/1/labels', 'aaaa')
+    pool.route(request)
+    assert request.headers['Authorization'] == 'token aaaa'
+
+    stats = pool.get_stats()
+    assert stats['...aaaa']['requests'] == 3
+    assert stats['...bbbb']['requests'] == 2
+    assert stats['...bbbb']['core'] == 4000
+
+
+def test_pool_only_waits_when_every_token_is_empty():
+    pool = TokenPool(['aaaa', 'bbbb'])
+    reset = int(time.time()) + 600
+    pool.update_from_json({'resources': {'core': {'limit': 5000, 'remaining': 1, 'reset': reset}}}, token='aaaa')
+    pool.update_from_json({'resources': {'core': {'limit': 5000, 'remaining': 1, 'reset': reset + 600}}}, token='bbbb')
+
+    assert pool.acquire() == 0
+    assert pool.acquire() == 0
+    assert 590 < pool.acquire() <= 605
@@ -1,7 +1,7 @@
 import pytest
 
 from unittest import TestCase
-from ansibullbot.utils.timetools import strip_time_safely
+from ansibullbot.utils.timetools import strip_time_safely, utc_timestamp
 
 
 class TestTimeStrip(TestCase):
@@ -31,3 +31,9 @@ class TestTimeStrip(TestCase):
         ts = '2017-06-01T17:54:00ZDSFSDFDFSDFS'
         with pytest.raises(Exception):
             to = strip_time_safely(ts)
+
+
+def test_utc_timestamp():
+    assert utc_timestamp('2017-06-01T17:54:00Z') == '2017-06-01T17:54:00'
+    assert utc_timestamp('2017-06-01T17:54:00.123+00:00') == '2017-06-01T17:54:00'
+    assert utc_timestamp(1496339640.5) == '2017-06-01T17:54:00'
@@ -1,10 +1,19 @@
 import pytest
 import tempfile
+import threading
 
 from unittest.mock import patch, Mock
 
+import requests as real_requests
+from requests.structures import CaseInsensitiveDict
+
+from github import Github
+from github.Issue import Issue
+from github.Requester import Requester
+
 from ansibullbot.errors import RateLimitError
-from ansibullbot.wrappers.ghapiwrapper import GithubWrapper
+from ansibullbot.utils import http_cache
+from ansibullbot.wrappers.ghapiwrapper import GithubWrapper, RepoWrapper, get_connection_classes
 
 
 response_mock = Mock()
@@ -17,10 +26,70 @@ requests.get.side_effect = lambda url, headers: response_mock
 
 
 @patch('ansibullbot.decorators.github.C.DEFAULT_RATELIMIT', False)
-@patch('ansibullbot.wrappers.ghapiwrapper.requests', requests)
+@patch('ansibullbot.wrappers.ghapiwrapper.http_cache.new_session', lambda: requests)
 def test_get_request_rate_limited():
     GithubWrapper._connect = lambda *args: None
     gw = GithubWrapper(token=12345, cachedir=tempfile.mkdtemp())
 
     with pytest.raises(RateLimitError):
         gw.get_request('https://foo.bar.com/test')
+
+
+@patch('ansibullbot.decorators.github.C.DEFAULT_RATELIMIT', False)
+@patch('ansibullbot.wrappers.ghapiwrapper.C.DEFAULT_PICKLE_ISSUES', True)
+@patch.object(RepoWrapper, 'get_repo', Mock())
+def test_issue_cache_roundtrip():
+    '''Issues are cached as their raw data and headers, not pickles'''
+    with tempfile.TemporaryDirectory() as cachedir:
+        rw = RepoWrapper(Github(), 'ansible/ansible', cachedir=cachedir)
+
+        issue = Issue(None, {'etag': '"abc"'}, {'number': 1, 'title': 'broken', 'state': 'open'}, completed=True)
+        rw.save_issue(issue)
+        rw.store.flush()
+
+        cached = rw.load_issue(1)
+        assert isinstance(cached, Issue)
+        assert cached.title == 'broken'
+        assert cached.etag == '"abc"'
+        assert rw.load_issue(2) is False
+
+
+def test_connections_share_a_session_per_thread():
+    http_class, https_class = get_connection_classes()
+    first = https_class('api.github.com', 443)
+    assert https_class('api.github.com', 443).session is first.session
+    assert isinstance(first.session.get_adapter('https://api.github.com'), http_cache.CachingAdapter)
+
+    sessions = []
+    thread = threading.Thread(target=lambda: sessions.append(https_class('api.github.com', 443).session))
+    thread.start()
+    thread.join()
+    assert sessions[0] is not first.session
+
+    # the classes of another wrapper have their own sessions
+    assert get_connection_classes()[1]('api.github.com', 443).session is not first.session
+
+
+def test_pygithub_uses_the_connection_classes():
+    def send(request, **kwargs):
+        resp = real_requests.Response()
+        resp.status_code = 200
+        resp.url = request.url
+        resp.request = request
+        resp.headers = CaseInsensitiveDict({'Content-Type': 'application/json'})
+        resp._content = b'{"login": "jdoe", "url": "https://api.github.com/users/jdoe"}'
+        return resp
+
+    http_class, https_class = get_connection_classes()
+    try:
+        Requester.injectConnectionClasses(http_class, https_class)
+        gh = Github()
+        with patch.object(http_cache.CachingAdapter, 'send', side_effect=send) as cached_send:
+            assert gh.get_user('jdoe').login == 'jdoe'
+            assert gh.get_user('jdoe').login == 'jdoe'
+    finally:
+        Requester.resetConnectionClasses()
+
+    # both requests went through the http cache of the thread's session
+    assert cached_send.call_count == 2
+    assert list(https_class.sessions.by_host) == [('https', 'api.github.com', 443)]
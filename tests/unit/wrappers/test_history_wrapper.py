@@ -123,3 +123,106 @@ def test_ignore_events_without_dates_on_last_methods():
     res.append(hw.was_unlabeled('needs_info'))
 
     assert not [x for x in res if x is None]
+
+
+class CachedIssueWrapperMock(IssueWrapperMock):
+
+    labels = []
+
+    def __init__(self, events, updated_at):
+        super().__init__()
+        self._events = events
+        self.instance.updated_at = updated_at
+        self.refetched = False
+
+    def refetch_events(self):
+        self.refetched = True
+        return self._events
+
+
+def test_cache_merges_new_events():
+    first = datetime.datetime(2021, 1, 1)
+    events = [
+        {'id': 1, 'actor': 'jimi-c', 'event': 'labeled', 'label': 'bug', 'created_at': first},
+        {'id': 2, 'actor': 'jimi-c', 'event': 'commented', 'body': 'hi', 'created_at': first},
+    ]
+
+    cachedir = tempfile.mkdtemp()
+    iw = CachedIssueWrapperMock(events[:1], first)
+    HistoryWrapper(iw, cachedir=cachedir)
+
+    # the cached event is kept even if the timeline no longer has it
+    iw = CachedIssueWrapperMock(events[1:], first + datetime.timedelta(days=1))
+    hw = HistoryWrapper(iw, cachedir=cachedir)
+    assert [x['id'] for x in hw.history] == [1, 2]
+    assert not iw.refetched
+
+    hw = HistoryWrapper(iw, cachedir=cachedir)
+    assert [x['id'] for x in hw.history] == [1, 2]
+
+    # a cache that fails validation is rebuilt from a full refetch
+    iw = CachedIssueWrapperMock(events, first + datetime.timedelta(days=1))
+    iw.labels = ['needs_info']
+    hw = HistoryWrapper(iw, cachedir=cachedir)
+    assert iw.refetched
+
+
+class CommitMock:
+
+    def __init__(self, sha, login, date, message):
+        self.sha = sha
+        self.committer = type('User', (), {'login': login})()
+        self.commit = type('Commit', (), {
+            'committer': type('Committer', (), {'date': date})(),
+            'message': message,
+        })()
+
+
+def test_indexed_queries():
+    utc = datetime.timezone.utc
+    day = datetime.timedelta(days=1)
+    first = datetime.datetime(2021, 1, 1, tzinfo=utc)
+    iw = IssueWrapperMock()
+    iw._events = [
+        {'id': 1, 'actor': 'jimi-c', 'event': 'labeled', 'label': 'needs_info', 'created_at': first},
+        {'id': 2, 'actor': 'ansibot', 'event': 'labeled', 'label': 'bug', 'created_at': first + day},
+        {'id': 3, 'actor': 'bcoca', 'event': 'commented', 'body': 'ping @jimi-c', 'created_at': first + 2 * day},
+        {'id': 4, 'actor': 'jimi-c', 'event': 'commented', 'body': 'shipit', 'created_at': first + 3 * day},
+        {'id': 5, 'actor': 'jimi-c', 'event': 'unlabeled', 'label': 'needs_info', 'created_at': first + 4 * day},
+        {'id': 6, 'actor': 'bcoca', 'event': 'commented', 'body': '!shipit', 'created_at': first + 5 * day},
+    ]
+
+    hw = HistoryWrapper(iw, cachedir=tempfile.mkdtemp(), usecache=False)
+    hw.BOTNAMES = ['ansibot']
+
+    assert [x['id'] for x in hw._find_events_by_actor('commented', None, maxcount=999)] == [3, 4, 6]
+    assert [x['id'] for x in hw._find_events_by_actor(None, ['bcoca', 'jimi-c'], maxcount=999)] == [1, 3, 4, 5, 6]
+    assert [x['id'] for x in hw._find_events_by_actor('commented', 'bcoca')] == [3]
+    assert hw.get_commands(['jimi-c', 'bcoca'], ['shipit', 'needs_info'], timestamps=True) == [
+        (first, 'needs_info'), (first + 3 * day, 'shipit'), (first + 4 * day, '!needs_info'),
+    ]
+    assert hw.last_notified('jimi-c') == first + 2 * day
+    assert hw.last_notified(['bcoca']) is None
+    assert hw.last_comment(['bcoca', 'jimi-c']) == '!shipit'
+    assert hw.last_comment('nobody') is None
+    assert hw.label_last_applied('needs_info') == first
+    assert hw.label_last_removed('needs_info') == first + 4 * day
+    assert hw.label_last_removed('bug') is None
+    assert hw.was_labeled('bug')
+    assert not hw.was_labeled('bug', bots=['ansibot'])
+    assert hw.was_unlabeled(None)
+    assert hw.get_changed_labels() == ['bug', 'needs_info']
+    assert hw.get_changed_labels(prefix='need', bots=['jimi-c']) == []
+    assert hw.command_status('shipit') is False
+    assert hw.command_status('needs_info') is None
+    assert hw.last_commit_date is None
+
+    # merging rebuilds the index
+    hw.merge_commits([CommitMock('abc', 'jimi-c', datetime.datetime(2021, 1, 10), 'fix')])
+    assert hw.last_commit_date == datetime.datetime(2021, 1, 10, tzinfo=utc)
+    hw.merge_reviews([{
+        'id': 7, 'state': 'COMMENTED', 'user': {'login': 'bcoca'}, 'body': 'shipit',
+        'submitted_at': '2021-01-11T00:00:00Z',
+    }])
+    assert hw.command_status('shipit') is True
+    assert [x['id'] for x in hw._find_events_by_actor(None, 'bcoca', maxcount=999)] == [3, 6, 7]
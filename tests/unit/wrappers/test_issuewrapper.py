@@ -1,11 +1,10 @@
 import datetime
-import json
-import os
 import tempfile
 
 from unittest import mock
 
-from ansibullbot.wrappers.issuewrapper import IssueWrapper
+from ansibullbot.utils.cache_store import get_store
+from ansibullbot.wrappers.issuewrapper import IssueSnapshot, IssueWrapper
 
 
 class GithubIssueMock:
@@ -60,8 +59,7 @@ def test_get_events():
         events = iw.events
 
         assert len(events) == 3
-        assert os.path.exists(os.path.join(cachedir, 'issues', '1', 'timeline_meta.json'))
-        assert os.path.exists(os.path.join(cachedir, 'issues', '1', 'timeline_data.json'))
+        assert len(get_store(cachedir).get_json(1, 'timeline')['events']) == 3
 
 
 @mock.patch('ansibullbot.decorators.github.C.DEFAULT_RATELIMIT', False)
@@ -78,24 +76,15 @@ def test_get_events_bad_cache_invalidate():
             {'event': 'comment', 'created_at': '2020-05-31T10:02:20Z'}
         ]
 
-        events_meta_cache = os.path.join(cachedir, 'issues', '1', 'timeline_meta.json')
-        events_data_cache = os.path.join(cachedir, 'issues', '1', 'timeline_data.json')
-
-        os.makedirs(os.path.dirname(events_meta_cache))
-
-
-        # set a meta file that matches the timestamp for the issue so the cache is used
-        with open(events_meta_cache, 'w') as f:
-            f.write(json.dumps({
-                'updated_at': '2020-05-31T10:02:20Z',
-                'url': 'https://github.com/ansible/ansible/issues/1/timeline',
-            }))
-
-        # create a bad event to make sure the cache is invalidated and refetched
+        # create a bad event to make sure the cache is invalidated and refetched,
+        # the timestamp matches the issue so the cache would be used
         bad_events = github.cache['https://github.com/ansible/ansible/issues/1/timeline'][:]
         bad_events[0] = 'documentation_url'
-        with open(events_data_cache, 'w') as f:
-            f.write(json.dumps(bad_events))
+        get_store(cachedir).put_json(1, 'timeline', {
+            'updated_at': '2020-05-31T10:02:20Z',
+            'url': 'https://github.com/ansible/ansible/issues/1/timeline',
+            'events': bad_events,
+        })
 
         iw = IssueWrapper(
             github=github,
@@ -108,3 +97,201 @@ def test_get_events_bad_cache_invalidate():
         events = iw.events
 
         assert len(events) == 3
+
+
+@mock.patch('ansibullbot.decorators.github.C.DEFAULT_RATELIMIT', False)
+def test_get_events_incremental():
+    '''Only the tail of a cached timeline is fetched when the issue changes'''
+    with tempfile.TemporaryDirectory() as cachedir:
+        github = GithubWrapperMock()
+        github.cache = {}
+        repo = GithubRepoWrapperMock()
+        issue = GithubIssueMock()
+
+        url = 'https://github.com/ansible/ansible/issues/1/timeline'
+        events = [
+            {'id': 1, 'event': 'labeled', 'created_at': '2020-05-31T10:02:20Z', 'label': {'name': 'bug'}},
+            {'id': 2, 'event': 'commented', 'created_at': '2020-05-31T10:03:20Z', 'body': 'hi'},
+            {'event': 'cross-referenced', 'created_at': '2020-05-31T10:04:20Z', 'source': {}},
+        ]
+
+        store = get_store(cachedir)
+        store.put_json(1, 'timeline', {'updated_at': '2020-05-31T10:04:20Z', 'url': url, 'events': events})
+
+        github.cache[url + '?per_page=100&page=1'] = events + [
+            {'id': 3, 'event': 'commented', 'created_at': '2020-06-01T10:00:00Z', 'body': 'new'},
+        ]
+
+        iw = IssueWrapper(github=github, repo=repo, issue=issue, cachedir=cachedir, gitrepo=repo)
+        assert [x['event'] for x in iw.events] == ['labeled', 'commented', 'cross-referenced', 'commented']
+        assert len(store.get_json(1, 'timeline')['events']) == 4
+
+        # an event was deleted, the tail no longer lines up so refetch it all
+        timeline = store.get_json(1, 'timeline')
+        timeline['updated_at'] = '2020-05-31T10:04:20Z'
+        store.put_json(1, 'timeline', timeline)
+        github.cache[url + '?per_page=100&page=1'] = events[1:]
+        github.cache[url] = events[1:]
+
+        iw = IssueWrapper(github=github, repo=repo, issue=issue, cachedir=cachedir, gitrepo=repo)
+        assert len(iw.events) == 2
+
+
+@mock.patch('ansibullbot.decorators.github.C.DEFAULT_RATELIMIT', False)
+def test_snapshot_backend():
+    '''An IssueWrapper built from a graphql snapshot needs no pygithub calls'''
+    node = {
+        'id': 'abc',
+        'number': 2,
+        'type': 'pullrequest',
+        'url': 'https://api.github.com/repos/ansible/ansible/issues/2',
+        'html_url': 'https://github.com/ansible/ansible/pull/2',
+        'title': 'fix things',
+        'body': 'some body',
+        'state': 'open',
+        'created_at': '2021-01-01T00:00:00Z',
+        'updated_at': '2021-01-02T00:00:00Z',
+        'closed_at': None,
+        'merged_at': None,
+        'user': {'login': 'jdoe', 'type': 'User'},
+        'labels': ['bug', 'needs_triage'],
+        'assignees': ['maintainer'],
+        'draft': True,
+        'mergeable': True,
+        'merged': False,
+    }
+    repo = mock.Mock()
+    with tempfile.TemporaryDirectory() as cachedir:
+        iw = IssueWrapper(repo=repo, issue=IssueSnapshot(node, repo=repo), cachedir=cachedir)
+
+        assert iw.number == 2
+        assert iw.repo_full_name == 'ansible/ansible'
+        assert iw.is_pullrequest()
+        assert iw.submitter == 'jdoe'
+        assert not iw.is_bot
+        assert iw.labels == ['bug', 'needs_triage']
+        assert iw.assignees == ['maintainer']
+        assert iw.created_at == datetime.datetime(2021, 1, 1)
+        assert iw.mergeable is True
+        assert iw.wip
+        repo.get_pullrequest.assert_not_called()
+        repo.repo.get_issue.assert_not_called()
+
+        # writes go through the pygithub issue
+        iw.add_label('bug')
+        repo.repo.get_issue.assert_called_once_with(2)
+        repo.repo.get_issue.return_value.add_to_labels.assert_called_once_with('bug')
+
+
+class GraphQLClientMock:
+    def __init__(self):
+        self.calls = []
+        self.head_sha = 'abc'
+
+    def get_pullrequest_snapshot(self, owner, repo, number, full=True):
+        self.calls.append(full)
+        snapshot = {
+            'number': number,
+            'updated_at': '2021-01-02T00:00:00Z',
+            'head_sha': self.head_sha,
+            'base_ref': 'devel',
+            'files': [],
+            'commits': [],
+            'reviews': [{
+                'id': 3,
+                'user': {'login': 'reviewer'},
+                'state': 'APPROVED',
+                'body': 'shipit',
+                'submitted_at': '2021-01-01T10:00:00Z',
+                'commit_id': 'a1',
+            }],
+            'check_runs': [{
+                'id': 7, 'name': 'CI', 'status': 'completed', 'conclusion': 'success',
+                'details_url': 'https://dev.azure.com/x', 'app': 'azure-pipelines',
+            }],
+            'status': 'success',
+        }
+        if full:
+            snapshot['files'] = [{'filename': 'lib/foo.py', 'additions': 1, 'deletions': 0, 'status': 'modified'}]
+            snapshot['commits'] = [
+                {
+                    'sha': sha,
+                    'url': 'https://api.github.com/repos/ansible/ansible/commits/%s' % sha,
+                    'html_url': 'https://github.com/ansible/ansible/commit/%s' % sha,
+                    'message': message,
+                    'parents': parents,
+                    'author': {'login': login, 'name': 'x', 'email': '%s@example.com' % sha, 'date': '2021-01-01T00:00:00Z'},
+                    'committer': {'login': None, 'name': 'x', 'email': 'x', 'date': '2021-01-01T00:00:00Z'},
+                }
+                for sha, message, parents, login in (
+                    ('a1', 'fix it', ['p1'], 'jdoe'),
+                    ('a2', 'Merge branch devel', ['a1', 'p2'], None),
+                )
+            ]
+        return snapshot
+
+
+class PullRequestIssueMock(GithubIssueMock):
+    number = 2
+    url = 'https://api.github.com/repos/ansible/ansible/issues/2'
+    html_url = 'https://github.com/ansible/ansible/pull/2'
+
+
+@mock.patch('ansibullbot.decorators.github.C.DEFAULT_RATELIMIT', False)
+def test_pr_snapshot_backend():
+    '''Pullrequest data comes from one graphql snapshot, cached by head sha'''
+    gqlc = GraphQLClientMock()
+    repo = mock.Mock()
+    with tempfile.TemporaryDirectory() as cachedir:
+        iw = IssueWrapper(repo=repo, issue=PullRequestIssueMock(), cachedir=cachedir, gqlc=gqlc)
+
+        assert iw.files == ['lib/foo.py']
+        assert [x.sha for x in iw.commits] == ['a1', 'a2']
+        assert [x.sha for x in iw.merge_commits] == ['a2']
+        assert iw.committer_emails == ['a1@example.com', 'a2@example.com']
+        assert iw.committer_logins == ['jdoe', '']
+        assert iw.reviews[0]['user']['login'] == 'reviewer'
+        assert iw.pullrequest_check_runs[0].details_url == 'https://dev.azure.com/x'
+        assert [(x.filename, x.changes, x.status) for x in iw.pr_files] == [('lib/foo.py', 1, 'modified')]
+        assert iw.renamed_files == {}
+        assert gqlc.calls == [True]
+        repo.get_pullrequest.assert_not_called()
+
+        # same head, the files and commits come from the cache
+        iw = IssueWrapper(repo=repo, issue=PullRequestIssueMock(), cachedir=cachedir, gqlc=gqlc)
+        assert iw.files == ['lib/foo.py']
+        assert gqlc.calls == [True, False]
+
+        # new head, refetch everything
+        gqlc.head_sha = 'def'
+        iw = IssueWrapper(repo=repo, issue=PullRequestIssueMock(), cachedir=cachedir, gqlc=gqlc)
+        assert len(iw.commits) == 2
+        assert gqlc.calls == [True, False, False, True]
+
+
+@mock.patch('ansibullbot.decorators.github.C.DEFAULT_RATELIMIT', False)
+def test_pr_snapshot_renamed_files():
+    '''Previous filenames come from one listing of the pullrequest files'''
+    gqlc = GraphQLClientMock()
+    get_snapshot = gqlc.get_pullrequest_snapshot
+
+    def get_pullrequest_snapshot(owner, repo, number, full=True):
+        snapshot = get_snapshot(owner, repo, number, full=full)
+        snapshot['files'].append({'filename': 'lib/bar.py', 'additions': 0, 'deletions': 0, 'status': 'renamed'})
+        return snapshot
+
+    gqlc.get_pullrequest_snapshot = get_pullrequest_snapshot
+    rest_files = [
+        mock.Mock(raw_data={'filename': 'lib/foo.py', 'status': 'modified', 'patch': '@@ -1,1 +1,2 @@'}),
+        mock.Mock(raw_data={'filename': 'lib/bar.py', 'status': 'renamed', 'previous_filename': 'lib/baz.py'}),
+    ]
+    with tempfile.TemporaryDirectory() as cachedir, \
+            mock.patch.object(IssueWrapper, 'load_update_fetch_files', return_value=rest_files) as fetch:
+        iw = IssueWrapper(repo=mock.Mock(), issue=PullRequestIssueMock(), cachedir=cachedir, gqlc=gqlc)
+
+        assert [x.filename for x in iw.pr_files] == ['lib/foo.py', 'lib/bar.py']
+        fetch.assert_not_called()
+
+        assert iw.renamed_files == {'lib/bar.py': 'lib/baz.py'}
+        assert iw.rest_pr_files == rest_files
+        fetch.assert_called_once_with()
@@ -1480,7 +1480,10 @@ class BotMockManager:
         self.mocks.append(patch('ansibullbot.wrappers.historywrapper.logging', MockLogger))
         self.mocks.append(patch('ansibullbot.wrappers.ghapiwrapper.logging', MockLogger))
         self.mocks.append(patch('ansibullbot.utils.gh_gql_client.requests', self.mr))
-        self.mocks.append(patch('ansibullbot.wrappers.ghapiwrapper.requests', self.mr))
+        # the github sessions of the wrapper, the graphql client and pygithub
+        # are the mock sessions rather than ones mounted with the http cache
+        self.mocks.append(patch('ansibullbot.utils.http_cache.new_session', return_value=self.mrs))
+        self.mocks.append(patch('ansibullbot.utils.http_cache.mount'))
 
         for _m in self.mocks:
             _m.start()